@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Audit de parc hors Domoticz
+
+Interroge en parallèle (asyncio) une ou plusieurs instances Domoticz par
+leur API JSON, agrège les devices avec le noyau du plugin et produit le
+rapport des batteries:
+
+    python -m battery_level.audit 127.0.0.1:8080 user:pass@10.0.0.2:8080
+    python -m battery_level.audit --format json --output report.json ...
+    python -m battery_level.audit --check ...  # code retour non nul si alerte
+"""
+
+# standard libs
+import argparse
+import asyncio
+import csv
+import io
+import json
+import sys
+from base64 import b64encode
+from datetime import datetime, timedelta
+from typing import List, Mapping, Optional, Tuple
+
+# local libs
+from battery_level.core import _HardWares, level_band
+
+_DEVICES_URL = '/json.htm?type=devices&used=true'
+
+
+def parse_endpoint(endpoint: str) -> Tuple[str, int, Optional[str]]:
+    """'[user:pass@]hôte[:port]' -> (hôte, port, identifiants)"""
+    credentials, _, address = endpoint.rpartition('@')
+    host, _, port = address.partition(':')
+    return host, int(port or 8080), credentials or None
+
+
+async def fetch(endpoint: str, url: str = _DEVICES_URL, timeout: float = 10) -> dict:
+    """Requète GET (HTTP/1.0) sur l'API JSON d'une instance Domoticz"""
+    host, port, credentials = parse_endpoint(endpoint)
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        headers = ['GET {} HTTP/1.0'.format(url), 'Host: {}'.format(host)]
+        if credentials:
+            headers.append('Authorization: Basic {}'.format(
+                b64encode(credentials.encode()).decode()
+            ))
+        writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode())
+        raw = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    head, _, body = raw.partition(b'\r\n\r\n')
+    status = head.split(b'\r\n', 1)[0].split()
+    if len(status) < 2 or status[1] != b'200':
+        raise ConnectionError('{}: {}'.format(endpoint, head[:80].decode(errors='replace')))
+    datas = json.loads(body)
+    if datas.get('status') != 'OK':
+        raise ConnectionError('{}: {}'.format(endpoint, datas.get('status')))
+    return datas
+
+
+async def collect(endpoints: List[str], timeout: float = 10) -> Mapping[str, str]:
+    """Interroge toutes les instances et agrège leurs devices
+
+    Les préfixes des hw_id sont ceux du plugin: aucun pour la première
+    instance, 'R<n>-' pour les suivantes.
+
+    Returns:
+
+        - dict: erreurs par instance
+    """
+    results = await asyncio.gather(
+        *(fetch(endpoint, timeout=timeout) for endpoint in endpoints),
+        return_exceptions=True
+    )
+    errors = {}
+    for index, (endpoint, result) in enumerate(zip(endpoints, results)):
+        if isinstance(result, Exception):
+            errors[endpoint] = '{}'.format(result) or type(result).__name__
+            continue
+        prefix = 'R{}-'.format(index) if index else ''
+        for data in result.get('result', []):
+            _HardWares.update(data, prefix)
+    return errors
+
+
+def report(empty_level: float, stale: timedelta) -> List[dict]:
+    """Rapport des matériels agrégés, du plus déchargé au plus chargé"""
+    now = datetime.now()
+    rows = []
+    for hw_id, bat_lev, name, last_update in _HardWares.items():
+        dead = last_update + stale < now
+        rows.append({
+            'hw_id': hw_id,
+            'name': name,
+            'level': bat_lev,
+            'band': level_band(0 if dead else bat_lev, empty_level),
+            'last_update': last_update.strftime(r'%Y-%m-%d %H:%M:%S'),
+            'dead': dead
+        })
+    rows.sort(key=lambda row: (row['level'], row['name']))
+    return rows
+
+
+def render(rows: List[dict], errors: Mapping[str, str], output_format: str) -> str:
+    """Mise en forme du rapport (text, json, csv)"""
+    if output_format == 'json':
+        return json.dumps({'devices': rows, 'errors': errors}, indent=2)
+    if output_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(
+            buffer,
+            fieldnames=['hw_id', 'name', 'level', 'band', 'last_update', 'dead']
+        )
+        writer.writeheader()
+        writer.writerows(rows)
+        return buffer.getvalue()
+    lines = ['{:<16} {:>6}  {:<16} {:<19}  {}'.format(
+        'hw_id', 'level', 'band', 'last update', 'name'
+    )]
+    for row in rows:
+        lines.append('{:<16} {:>5.1f}%  {:<16} {:<19}  {}{}'.format(
+            row['hw_id'],
+            row['level'],
+            row['band'],
+            row['last_update'],
+            row['name'],
+            ' (dead)' if row['dead'] else ''
+        ))
+    for endpoint, error in errors.items():
+        lines.append('Erreur: {} - {}'.format(endpoint, error))
+    return '\n'.join(lines) + '\n'
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Point d'entrée
+
+    Code retour: 0 si tout va bien, 1 si --check et un device est vide ou
+    hors service, 2 si une instance n'a pas répondu.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        'endpoints', nargs='+', metavar='[user:pass@]host[:port]',
+        help='instances Domoticz à interroger'
+    )
+    parser.add_argument('--empty-level', type=float, default=25.0,
+                        help='niveau vide (%%), comme Mode1 du plugin')
+    parser.add_argument('--stale', type=float, default=30,
+                        help='délai (minutes) sans mise à jour avant hors service')
+    parser.add_argument('--timeout', type=float, default=10, help='délai réseau (s)')
+    parser.add_argument('--format', choices=('text', 'json', 'csv'), default='text')
+    parser.add_argument('--output', help='fichier de sortie (défaut: stdout)')
+    parser.add_argument('--check', action='store_true',
+                        help='code retour 1 si un device est vide ou hors service')
+    args = parser.parse_args(argv)
+
+    errors = asyncio.run(collect(args.endpoints, args.timeout))
+    rows = report(args.empty_level, timedelta(minutes=args.stale))
+    text = render(rows, errors, args.format)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            output.write(text)
+    else:
+        sys.stdout.write(text)
+    if errors:
+        return 2
+    if args.check and any(row['dead'] or row['level'] <= args.empty_level for row in rows):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
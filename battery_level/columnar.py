@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""État du parc en colonnes NumPy (optionnel)
+
+Chaque device occupe un emplacement dense; niveaux, fenêtres de lissage
+(tableau 2-D circulaire), dates de mise à jour et tranches sont des
+colonnes. Lissage et tranches sont calculés pour tout le parc en quelques
+opérations vectorisées par interrogation, avec la même sémantique que
+`_Bounces` (mode POND_1H) et `level_band_index`. Les devices hors service
+(`Deadlines`) et l'ordre du plan (`plans._OrderedDevices`) restent tenus
+device par device. `compute` renvoie les seuls emplacements dont le niveau
+lissé, la tranche ou le rapport ont changé: eux seuls sont reportés dans
+les devices.
+"""
+
+# standard libs
+from typing import List, Mapping, Optional, Sequence
+
+# optional libs
+try:
+    import numpy as np
+except ImportError:  # numpy absent: le stockage en colonnes est indisponible
+    np = None
+
+
+class FleetStore:
+    """Colonnes du parc, indexées par emplacement"""
+    _columns = ('level_in', 'level_out', 'filled', 'position', 'last_update', 'band', 'pending', 'reported')
+
+    def __init__(self: object, window: int = 12, empty_level: float = 25.0, capacity: int = 64) -> None:
+        """Initialisation de la classe
+
+        Args:
+
+            - window (int): taille de la fenêtre de lissage (12: une heure à 5 minutes)
+            - empty_level (float): niveau vide (%)
+            - capacity (int): nombre d'emplacements alloués d'avance
+        """
+        if np is None:
+            raise ImportError('numpy est requis pour le stockage en colonnes')
+        self.window_size = window
+        self.slots: Mapping[str, int] = {}
+        self.hw_ids: List[str] = []
+        self.names: List[str] = []
+        self.size = 0
+        self.empty_level = empty_level
+        self.level_in = np.full(capacity, 100.0)
+        self.level_out = np.full(capacity, 100.0)
+        self.window = np.zeros((capacity, window))
+        self.filled = np.zeros(capacity, dtype=bool)
+        self.position = np.zeros(capacity, dtype=np.intp)
+        self.last_update = np.zeros(capacity)
+        self.band = np.zeros(capacity, dtype=np.int8)
+        self.pending = np.zeros(capacity, dtype=bool)
+        # nouveau rapport (niveau ou date) depuis le dernier `compute`
+        self.reported = np.zeros(capacity, dtype=bool)
+
+    def slot(self: object, hw_id: str, name: str = '') -> int:
+        """Emplacement du device (alloué à la première demande)"""
+        slot = self.slots.get(hw_id)
+        if slot is None:
+            if self.size == len(self.level_in):
+                self._grow()
+            slot = self.size
+            self.size += 1
+            self.slots[hw_id] = slot
+            self.hw_ids.append(hw_id)
+            self.names.append(name)
+        elif name:
+            self.names[slot] = name
+        return slot
+
+    def update(self: object, hw_id: str, bat_lev: float, epoch: float, name: str = '') -> int:
+        """Enregistre une nouvelle valeur (O(1)); calculée au prochain `compute`"""
+        slot = self.slot(hw_id, name)
+        if bat_lev != self.level_in[slot] or epoch != self.last_update[slot]:
+            self.reported[slot] = True
+        self.level_in[slot] = bat_lev
+        self.last_update[slot] = epoch
+        self.pending[slot] = True
+        return slot
+
+    def load(
+            self: object,
+            hw_id: str,
+            samples: Sequence[float],
+            bat_lev_in: float,
+            bat_lev: float,
+            epoch: float,
+            name: str = '') -> int:
+        """Reprise de l'état d'un device lissé ailleurs (`_Bounces`), sans nouvel échantillon
+
+        Args:
+
+            - samples (list): fenêtre de lissage, de la plus ancienne à la plus
+                récente valeur; incomplète, elle sera remplie par la prochaine valeur
+        """
+        slot = self.slot(hw_id, name)
+        self.filled[slot] = len(samples) == self.window_size
+        if self.filled[slot]:
+            self.window[slot] = samples
+        self.position[slot] = 0
+        self.level_in[slot] = bat_lev_in
+        self.level_out[slot] = bat_lev
+        self.last_update[slot] = epoch
+        self.band[slot] = self.bands(self.level_out[slot:slot + 1])[0]
+        self.pending[slot] = self.reported[slot] = False
+        return slot
+
+    def samples(self: object, hw_id: str) -> List[float]:
+        """Fenêtre de lissage du device, de la plus ancienne à la plus récente valeur"""
+        slot = self.slots[hw_id]
+        if not self.filled[slot]:
+            return []
+        return np.roll(self.window[slot], -self.position[slot]).tolist()
+
+    def remove(self: object, hw_id: str) -> None:
+        """Libère l'emplacement du device; le dernier emplacement occupé prend sa place"""
+        slot = self.slots.pop(hw_id, None)
+        if slot is None:
+            return
+        last = self.size - 1
+        if slot != last:
+            for attr in self._columns + ('window',):
+                column = getattr(self, attr)
+                column[slot] = column[last]
+            moved = self.hw_ids[slot] = self.hw_ids[last]
+            self.names[slot] = self.names[last]
+            self.slots[moved] = slot
+        self.hw_ids.pop()
+        self.names.pop()
+        self.level_in[last] = self.level_out[last] = 100.0
+        self.filled[last] = self.pending[last] = self.reported[last] = False
+        self.position[last] = 0
+        self.size = last
+
+    def compute(self: object) -> 'np.ndarray':
+        """Lissage et tranches des emplacements mis à jour, pour tout le parc
+
+        Returns:
+
+            - np.ndarray: emplacements dont le niveau lissé, la tranche ou le rapport ont changé
+        """
+        size = self.size
+        pending = self.pending[:size]
+        rows = np.flatnonzero(pending)
+        level_out, band = self.level_out[rows], self.band[rows]
+        if rows.size:
+            new = self.level_in[rows]
+            # réinitialisation: retour au plein après être passé sous le niveau vide
+            reset = (new >= 100 - self.empty_level) & (self.level_out[rows] <= self.empty_level)
+            self.filled[rows[reset]] = False
+            # première valeur: elle remplit toute la fenêtre
+            first = ~self.filled[rows]
+            self.window[rows[first]] = new[first, np.newaxis]
+            self.filled[rows[first]] = True
+            # valeurs suivantes: écriture circulaire
+            rest = rows[~first]
+            self.window[rest, self.position[rest]] = new[~first]
+            self.position[rest] = (self.position[rest] + 1) % self.window_size
+            self.level_out[rows] = self.window[rows].mean(axis=1)
+            pending[:] = False
+        self.band[:size] = self.bands(self.level_out[:size])
+        changed = rows[(self.level_out[rows] != level_out) | (self.band[rows] != band) | self.reported[rows]]
+        self.reported[rows] = False
+        return changed
+
+    def bands(self: object, levels: 'np.ndarray') -> 'np.ndarray':
+        """Tranches de niveau (index dans `core.BANDS`)"""
+        level_delta = (100 - self.empty_level) / 3
+        thresholds = np.array((
+            0,
+            self.empty_level,
+            self.empty_level + level_delta,
+            self.empty_level + 2 * level_delta
+        ))
+        return np.searchsorted(thresholds, levels, side='left').astype(np.int8)
+
+    def _grow(self: object) -> None:
+        """Double la capacité de toutes les colonnes"""
+        capacity = 2 * len(self.level_in)
+        for attr in self._columns:
+            column = getattr(self, attr)
+            grown = np.full(capacity, 100.0) if attr in ('level_in', 'level_out') else (
+                np.zeros(capacity, dtype=column.dtype)
+            )
+            grown[:len(column)] = column
+            setattr(self, attr, grown)
+        window = np.zeros((capacity, self.window_size))
+        window[:len(self.window)] = self.window
+        self.window = window
+
+    def __len__(self: object) -> int:
+        """Nombre d'emplacements occupés"""
+        return self.size
+
+    def __str__(self: object) -> str:
+        """Wrapper pour str()"""
+        return '<FleetStore>{}/{} slots'.format(self.size, len(self.level_in))
+
+    def __repr__(self: object) -> str:
+        """Wrapper pour repr()"""
+        return str(self)
+
+
+def fleet_store(window: int = 12, empty_level: float = 25.0) -> Optional[FleetStore]:
+    """FleetStore si numpy est disponible, sinon None"""
+    if np is None:
+        return None
+    return FleetStore(window, empty_level)
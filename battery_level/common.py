@@ -3,13 +3,14 @@
 """Utilitaires"""
 
 # standards libs
-from datetime import datetime
-from time import strptime
-
+import logging
 
 # Domoticz lib
 import Domoticz
 
+# local libs
+from battery_level.core import LOGGER, last_update_2_datetime  # pylint:disable=unused-import
+
 
 def debug(*args: tuple, **kwargs: dict) -> None:
     """Extended debug"""
@@ -19,31 +20,19 @@ def debug(*args: tuple, **kwargs: dict) -> None:
         Domoticz.Debug('{}: {}'.format(key, arg))
 
 
-def last_update_2_datetime(last_update: str) -> datetime:
-    """conversion de la valeur last_update de domoticz en datetime"""
-    if isinstance(last_update, type(None)):
-        return datetime.now()
-    if isinstance(last_update, datetime):
-        return last_update
-    dz_format = r'%Y-%m-%d %H:%M:%S'
-    try:  # python > 3.7
-        last_update_dt = datetime.strptime(
-            last_update,
-            dz_format
-        )
-    except TypeError:  # python < 3.8
-        try:
-            last_update_dt = datetime(
-                *(strptime(last_update, dz_format)[0:6])
-            )
-        except AttributeError:
-            Domoticz.Error("datetime.strptime('{}', '{}')".format(
-                last_update,
-                dz_format
-            ))
-            Domoticz.Error("time.strptime('{}', '{}')".format(
-                last_update,
-                dz_format
-            ))
-            last_update_dt = datetime.now()
-    return last_update_dt
+class _DomoticzHandler(logging.Handler):
+    """Redirige les messages du noyau vers le journal Domoticz"""
+
+    def emit(self: object, record: logging.LogRecord) -> None:
+        """Ecriture d'un message"""
+        message = self.format(record)
+        if record.levelno >= logging.ERROR:
+            Domoticz.Error(message)
+        elif record.levelno >= logging.INFO:
+            Domoticz.Status(message)
+        else:
+            Domoticz.Debug(message)
+
+
+LOGGER.addHandler(_DomoticzHandler())
+LOGGER.setLevel(logging.DEBUG)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Devices de commande du plugin
+
+Les devices de commande occupent les unités hautes (à partir de
+`FIRST_CONTROL_UNIT`) et ont un DeviceID préfixé par `CONTROL_PREFIX`: ils
+sont exclus des devices de batterie, du plan et du tri.
+"""
+
+# standard libs
+from typing import Callable, Mapping, Optional
+
+# Domoticz lib
+import Domoticz
+
+CONTROL_PREFIX = 'bat_lev_'
+FIRST_CONTROL_UNIT = 240
+
+
+def is_control(device: Domoticz.Device) -> bool:
+    """True pour un device de commande"""
+    return device.DeviceID.startswith(CONTROL_PREFIX)
+
+
+class Controls:
+    """Collection des devices de commande et de leurs actions"""
+    _devices: Mapping[int, Domoticz.Device] = {}
+    _handlers: Mapping[int, Callable[[str, int], None]] = {}
+    _init_done = False
+
+    def __new__(cls: object, devices: Optional[Mapping[int, Domoticz.Device]] = None) -> object:
+        """Initialisation de la classe"""
+        if not cls._init_done or isinstance(devices, dict):
+            cls._devices = devices
+            cls._handlers = {}
+            cls._init_done = True
+        return super(Controls, cls).__new__(cls)
+
+    @classmethod
+    def register(
+            cls: object,
+            unit: int,
+            name: str,
+            handler: Optional[Callable[[str, int], None]] = None,
+            **params: dict) -> Optional[Domoticz.Device]:
+        """Crée, si besoin, le device de commande 'name' à l'unité 'unit'
+
+        Args:
+
+            - unit (int): unité réservée (>= FIRST_CONTROL_UNIT)
+            - name (str): nom du device; le DeviceID en est dérivé
+            - handler (callable): action (commande, niveau) reçue par onCommand
+            - params: paramètres de création (TypeName, Switchtype...)
+
+        Returns:
+
+            - Domoticz.Device: le device, ou None si l'unité est prise
+        """
+        device_id = '{}{}'.format(CONTROL_PREFIX, name.lower().replace(' ', '_'))
+        device = cls._devices.get(unit)
+        if device is None:
+            Domoticz.Device(Name=name, Unit=unit, DeviceID=device_id, **params).Create()
+            device = cls._devices.get(unit)
+        elif device.DeviceID != device_id:
+            Domoticz.Error('Unité {} occupée par {}: commande "{}" indisponible'.format(unit, device.Name, name))
+            return None
+        if handler is not None:
+            cls._handlers[unit] = handler
+        return device
+
+    @classmethod
+    def on_command(cls: object, unit: int, command: str, level: int = 0) -> bool:
+        """Transmet une commande à l'action du device; False si ce n'est pas un device de commande"""
+        handler = cls._handlers.get(unit)
+        if handler is None:
+            return False
+        handler(command, level)
+        return True
+
+    @classmethod
+    def remove(cls: object, unit: int) -> bool:
+        """Device supprimé; True si c'était un device de commande (recréé au prochain démarrage)"""
+        return cls._handlers.pop(unit, None) is not None
+
+    @classmethod
+    def switch(cls: object, unit: int, state: bool) -> None:
+        """Etat d'un interrupteur de commande"""
+        device = cls._devices.get(unit)
+        if device is not None and device.nValue != int(state):
+            device.Update(int(state), 'On' if state else 'Off')
+
+    @classmethod
+    def __str__(cls: object) -> str:
+        """Wrapper pour str()"""
+        return '<Controls>{}'.format(sorted(cls._handlers))
+
+    @classmethod
+    def __repr__(cls: object) -> str:
+        """Wrapper pour repr()"""
+        return str(cls)
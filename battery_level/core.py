@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Noyau d'agrégation, indépendant de Domoticz
+
+Regroupement des matériels, lissage des valeurs et tranches de niveau;
+utilisé par le plugin comme par les outils hors Domoticz (cli).
+"""
+
+# standard libs
+import logging
+import re
+from collections import deque, namedtuple
+from datetime import datetime
+from statistics import mean
+from time import strptime
+from typing import Callable, Iterable, List, Mapping, Optional, Tuple, Union
+
+LOGGER = logging.getLogger('battery_level')
+
+# images (tranches de niveau), de la plus basse à la plus haute
+BANDS = (
+    'pyBattLev_ko',
+    'pyBattLev_empty',
+    'pyBattLev_low',
+    'pyBattLev_ok',
+    'pyBattLev'
+)
+
+
+def last_update_2_datetime(last_update: str) -> datetime:
+    """conversion de la valeur last_update de domoticz en datetime"""
+    if isinstance(last_update, type(None)):
+        return datetime.now()
+    if isinstance(last_update, datetime):
+        return last_update
+    dz_format = r'%Y-%m-%d %H:%M:%S'
+    try:  # python > 3.7
+        last_update_dt = datetime.strptime(
+            last_update,
+            dz_format
+        )
+    except TypeError:  # python < 3.8
+        try:
+            last_update_dt = datetime(
+                *(strptime(last_update, dz_format)[0:6])
+            )
+        except AttributeError:
+            LOGGER.error("datetime.strptime('%s', '%s')", last_update, dz_format)
+            LOGGER.error("time.strptime('%s', '%s')", last_update, dz_format)
+            last_update_dt = datetime.now()
+    return last_update_dt
+
+
+_SOURCE_PREFIX = re.compile(r'R\d+-')
+
+
+def source_prefix(hw_id: str) -> str:
+    """Préfixe de la source du hw_id ('R1-'...; vide pour le Domoticz local)
+
+    La clé du matériel peut elle-même contenir des '-': seul le préfixe
+    'R<n>-' des sources distantes est reconnu.
+    """
+    match = _SOURCE_PREFIX.match(hw_id)
+    return match.group(0) if match else ''
+
+
+def split_hw_id(hw_id: str) -> Tuple[str, int, int, str]:
+    """Décompose un hw_id (voir `_HardWares._build_hw_id`)
+
+    Returns:
+
+        - tuple: (préfixe de la source, HardwareTypeVal, HardwareID, clé du matériel)
+            HardwareTypeVal et HardwareID sont tronqués à deux chiffres
+
+    Raises:
+
+        - ValueError: le hw_id n'a pas été construit par le plugin
+    """
+    prefix = source_prefix(hw_id)
+    local_id = hw_id[len(prefix):]
+    return prefix, int(local_id[:2]), int(local_id[2:4]), local_id[4:]
+
+
+def level_band_index(bat_lev: float, empty_level: float) -> int:
+    """Tranche de niveau, index dans BANDS
+
+    0: hors service; 1: vide; puis trois tranches égales entre le niveau
+    vide et 100%
+    """
+    level_delta = (100 - empty_level) / 3
+    if bat_lev > empty_level + 2 * level_delta:
+        return 4
+    if bat_lev > empty_level + level_delta:
+        return 3
+    if bat_lev > empty_level:
+        return 2
+    if bat_lev > 0:
+        return 1
+    return 0
+
+
+def level_band(bat_lev: float, empty_level: float) -> str:
+    """Tranche de niveau, nom de l'image Domoticz"""
+    return BANDS[level_band_index(bat_lev, empty_level)]
+
+
+def _tail_key(datas: dict) -> str:
+    """Clé par défaut: les 4 derniers caractères de l'ID"""
+    return str(datas['ID'])[-4:]
+
+
+def _zwave_node_key(datas: dict) -> str:
+    """Clé zwave: le noeud, tous capteurs confondus"""
+    return '00{}'.format(str(datas['ID'])[-4:-2])
+
+
+_IEEE_ADDRESS = re.compile(r'0x([0-9a-fA-F]{16})|((?:[0-9a-fA-F]{2}:){7}[0-9a-fA-F]{2})')
+
+
+def _ieee_node_key(datas: dict) -> Optional[str]:
+    """Clé zigbee (Zigbee2MQTT, deCONZ...): fin de l'adresse IEEE du noeud, si présente"""
+    match = _IEEE_ADDRESS.search(str(datas['ID']))
+    if match is None:
+        return None
+    return (match.group(1) or match.group(2).replace(':', ''))[-8:].upper()
+
+
+def _battery_level(datas: dict) -> float:
+    """Niveau de batterie par défaut"""
+    return float(datas['BatteryLevel'])
+
+
+def _first_key(*keys: Callable[[dict], Optional[str]]) -> Callable[[dict], str]:
+    """Première clé non vide parmi 'keys'"""
+    def key(datas: dict) -> str:
+        for key_function in keys[:-1]:
+            result = key_function(datas)
+            if result is not None:
+                return result
+        return keys[-1](datas)
+    return key
+
+
+# Règles de regroupement par HardwareTypeVal: (clé du matériel, niveau de batterie)
+# Le hw_id est le DeviceID des devices du plugin: changer la clé d'un type
+# recrée ses devices. Les clés historiques restent donc celles par défaut.
+_GROUPING_RULES: Mapping[int, Tuple[Callable[[dict], str], Callable[[dict], float]]] = {}
+_DEFAULT_RULE = (_tail_key, _battery_level)
+# HardwareTypeVal regroupés d'abord par adresse IEEE (sur demande, voir `ieee_grouping`)
+_IEEE_TYPES: set = set()
+# Champs lus par les règles, par HardwareTypeVal, en plus des champs de l'empreinte
+_RULE_FIELDS: Mapping[int, Tuple[str, ...]] = {}
+_FINGERPRINT_FIELDS = ('BatteryLevel', 'LastUpdate', 'Name', 'ID', 'HardwareID', 'HardwareTypeVal', 'HardwareType')
+
+
+def register_grouping_rule(
+        hardware_types: Iterable[int],
+        key: Callable[[dict], str] = _DEFAULT_RULE[0],
+        battery: Callable[[dict], float] = _battery_level,
+        fields: Iterable[str] = ()) -> None:
+    """Ajoute une règle de regroupement et d'extraction du niveau de batterie
+
+    Args:
+
+        - hardware_types (iterable): HardwareTypeVal concernés
+        - key (callable): device de l'api domoticz -> clé du matériel;
+            les devices de même clé partagent la même batterie
+        - battery (callable): device de l'api domoticz -> niveau de batterie
+        - fields (iterable): champs lus par 'key' ou 'battery' hors des
+            champs usuels (ID, BatteryLevel...); un device n'est traité de
+            nouveau que si l'un de ces champs change
+    """
+    for hardware_type in hardware_types:
+        _GROUPING_RULES[int(hardware_type)] = (key, battery)
+        _RULE_FIELDS[int(hardware_type)] = _FINGERPRINT_FIELDS + tuple(fields)
+    _HardWares.compile_rules()
+
+
+def ieee_grouping(hardware_types: Iterable[int]) -> None:
+    """Regroupement par adresse IEEE (zigbee) pour les HardwareTypeVal donnés
+
+    La clé IEEE passe avant la clé de la règle du type; les autres types
+    gardent leur clé. Les hw_id des devices dont l'ID contient une adresse
+    IEEE changent: leurs devices sont recréés.
+    """
+    _IEEE_TYPES.clear()
+    _IEEE_TYPES.update(int(hardware_type) for hardware_type in hardware_types)
+    _HardWares.compile_rules()
+
+
+class _HardWares:
+    """Collections des matériels"""
+    materials: Mapping[str, Tuple[float, str, datetime]] = {}
+    _dispatch: Mapping[int, Tuple[Callable[[dict], str], Callable[[dict], float]]] = {}
+    _prefixes: Mapping[Tuple[int, int], str] = {}
+    _brands: Mapping[str, str] = {}
+    # dernière interrogation complète où le matériel a été vu: (préfixe, cycle)
+    _seen: Mapping[str, Tuple[str, int]] = {}
+    _cycles: Mapping[str, int] = {}
+    # empreinte du dernier enregistrement traité, par (préfixe, idx): (empreinte, hw_id, cycle)
+    _fingerprints: Mapping[Tuple[str, str], Tuple[int, Optional[str], int]] = {}
+
+    @classmethod
+    def compile_rules(cls: object) -> None:
+        """Table de répartition des règles, par HardwareTypeVal"""
+        cls._dispatch = dict(_GROUPING_RULES)
+        for hardware_type in _IEEE_TYPES:
+            key, battery = cls._dispatch.get(hardware_type, _DEFAULT_RULE)
+            cls._dispatch[hardware_type] = (_first_key(_ieee_node_key, key), battery)
+        cls._fingerprints = {}
+
+    @classmethod
+    def items(cls: object) -> Tuple[str, float, str, datetime]:
+        """for...in... extended wrapper"""
+        for key, value in cls.materials.items():
+            yield (key, *value)
+
+    @classmethod
+    def update(cls: object, datas: dict, prefix: str = '') -> bool:
+        """Ajoute ou met à jour un matériel
+
+        Args:
+
+            - datas (dict): device de l'api domoticz
+            - prefix (str): préfixe de la source (vide pour le Domoticz local)
+
+        Returns:
+
+            - bool: False si l'enregistrement est inchangé depuis la dernière interrogation
+        """
+        cycle = cls._cycles.get(prefix, 0)
+        record = (prefix, datas.get('idx'))
+        fingerprint = hash(tuple(
+            datas.get(field)
+            for field in _RULE_FIELDS.get(datas['HardwareTypeVal'], _FINGERPRINT_FIELDS)
+        ))
+        cached = cls._fingerprints.get(record) if record[1] is not None else None
+        if cached is not None and cached[0] == fingerprint:
+            if cached[1] is not None:
+                cls._seen[cached[1]] = (prefix, cycle)
+            cls._fingerprints[record] = (fingerprint, cached[1], cycle)
+            return False
+        hw_id = None
+        key, battery = cls._dispatch.get(datas['HardwareTypeVal'], _DEFAULT_RULE)
+        battery_level = battery(datas)
+        if 0 < battery_level <= 100:
+            brand = cls._brands.get(datas['HardwareType'])
+            if brand is None:
+                brand = cls._brands[datas['HardwareType']] = datas['HardwareType'].split()[0]
+            hw_id = prefix + cls._hw_id_prefix(datas) + key(datas)
+            cls._seen[hw_id] = (prefix, cycle)
+            # first time hw_id is found
+            last_updated = last_update_2_datetime(datas['LastUpdate'])
+            if hw_id not in cls.materials:
+                name = '{}: {}'.format(brand, datas['Name'])
+            else:
+                name = cls._refactor_name(hw_id, brand, datas['Name'])
+                old_last_updated = cls.materials[hw_id][2]
+                if last_updated < old_last_updated:
+                    last_updated = old_last_updated
+            # update materials
+            cls.materials.update({
+                hw_id: [
+                    battery_level,
+                    name,
+                    last_updated
+                ]
+            })
+        if record[1] is not None:
+            cls._fingerprints[record] = (fingerprint, hw_id, cycle)
+        return True
+
+    @classmethod
+    def record_hw_id(cls: object, datas: dict, prefix: str = '') -> Optional[str]:
+        """hw_id auquel l'enregistrement a été rattaché lors de sa dernière mise à jour"""
+        return cls._fingerprints.get((prefix, datas.get('idx')), (None, None))[1]
+
+    @classmethod
+    def records(cls: object, hw_ids: Mapping[str, object], prefix: str = '') -> List[Tuple[object, str]]:
+        """Enregistrements de la source 'prefix' rattachés aux matériels 'hw_ids'
+
+        Returns:
+
+            - list: (valeur de 'hw_ids' pour le matériel, idx de l'enregistrement)
+        """
+        return [
+            (hw_ids[hw_id], idx) for (record_prefix, idx), (_, hw_id, _) in cls._fingerprints.items()
+            if record_prefix == prefix and hw_id in hw_ids
+        ]
+
+    @classmethod
+    def source_hw_ids(cls: object, prefix: str = '') -> List[str]:
+        """Matériels connus de la source 'prefix' (vus ou repris des devices existants)"""
+        return [hw_id for hw_id, (hw_prefix, _) in cls._seen.items() if hw_prefix == prefix]
+
+    @classmethod
+    def seen(cls: object, hw_id: str) -> None:
+        """Marque le matériel comme vu lors de l'interrogation en cours de sa source"""
+        prefix = source_prefix(hw_id)
+        cls._seen[hw_id] = (prefix, cls._cycles.get(prefix, 0))
+
+    @classmethod
+    def end_cycle(cls: object, prefix: str = '', max_age: int = 0) -> List[str]:
+        """Fin d'une interrogation complète de la source 'prefix'
+
+        Les matériels de la source absents depuis plus de 'max_age'
+        interrogations (0: jamais) sont oubliés.
+
+        Returns:
+
+            - list: hw_id oubliés
+        """
+        cycle = cls._cycles[prefix] = cls._cycles.get(prefix, 0) + 1
+        if not max_age:
+            return []
+        evicted = [
+            hw_id for hw_id, (hw_prefix, seen) in cls._seen.items()
+            if hw_prefix == prefix and cycle - seen > max_age
+        ]
+        for hw_id in evicted:
+            del cls._seen[hw_id]
+            cls.materials.pop(hw_id, None)
+        for record in [
+                record for record, (_, _, seen) in cls._fingerprints.items()
+                if record[0] == prefix and cycle - seen > max_age
+        ]:
+            del cls._fingerprints[record]
+        return evicted
+
+    @classmethod
+    def __repr__(cls: object) -> str:
+        """repr() Wrapper"""
+        return str(cls.materials)
+
+    @classmethod
+    def __str__(cls: object) -> str:
+        """str() Wrapper"""
+        return str(cls.materials)
+
+    @classmethod
+    def _build_hw_id(cls: object, datas: dict) -> str:
+        """Identifiant du matériel: type (2), matériel (2), clé de la règle"""
+        key = cls._dispatch.get(datas['HardwareTypeVal'], _DEFAULT_RULE)[0]
+        return cls._hw_id_prefix(datas) + key(datas)
+
+    @classmethod
+    def _hw_id_prefix(cls: object, datas: dict) -> str:
+        """Type (2) et matériel (2) du hw_id, mis en cache"""
+        index = (datas['HardwareTypeVal'], datas['HardwareID'])
+        prefix = cls._prefixes.get(index)
+        if prefix is None:
+            prefix = cls._prefixes[index] = '{}{}'.format(
+                ('0{}'.format(datas['HardwareTypeVal']))[-2:],
+                ('0{}'.format(datas['HardwareID']))[-2:]
+            )
+        return prefix
+
+    @classmethod
+    def _refactor_name(cls: object, hw_id: str, brand: str, name: str) -> str:
+        """Re-construit le nom du device"""
+        old_list = cls.materials[hw_id][1].split()
+        common_list = list(set(old_list) & set(
+            ('{}: {}'.format(brand, name)).split()))
+        new_list = []
+        for word in old_list:
+            if word in common_list:
+                new_list.append(word)
+        new_str = ' '.join(new_list).rstrip(" -")
+        if new_str == "{}: ".format(brand):
+            new_str += '{}'.format(hw_id)
+        return new_str
+
+
+# openzwave et plugins python (zwave...): par noeud
+register_grouping_rule((21, 94), _zwave_node_key)
+
+
+class _Bounces:
+    """Gestion des rebonds des valeurs"""
+    _BOUNCEMODES = namedtuple(
+        'Modes', ['DISABLED', 'SYSTEMATIC', 'POND_1H', 'POND_1D'])
+    _MINMAX = namedtuple('minmax', ['MIN', 'MAX', 'MIN_RESET', 'MAX_RESET'])
+
+    def __init__(
+            self: object,
+            mode: int,
+            mini: Union[str, int, float] = 0,
+            maxi: Union[str, int, float] = 100,
+            empty_level: float = 25.0) -> None:
+        """Initialisation de la classe"""
+        self._modes = self._BOUNCEMODES(0, 1, 2, 4)
+        self._bounce_mode = mode
+        self._min_max = self._MINMAX(
+            mini,
+            maxi,
+            empty_level,
+            100 - empty_level
+        )
+        self.last_value_out = self.last_value_in = 100.0
+        self._pond = 12
+        if mode == 4:
+            self._pond = 288
+        self._datas = deque(maxlen=self._pond)
+
+    def set_empty_level(self: object, empty_level: float) -> None:
+        """Nouveau niveau vide (seuils de réinitialisation); la fenêtre est conservée"""
+        self._min_max = self._min_max._replace(MIN_RESET=empty_level, MAX_RESET=100 - empty_level)
+
+    def window(self: object) -> List[float]:
+        """Fenêtre de lissage, de la plus ancienne à la plus récente valeur"""
+        return list(self._datas)
+
+    def load_window(self: object, samples: Iterable[float]) -> None:
+        """Reprise d'une fenêtre de lissage tenue ailleurs (stockage en colonnes)"""
+        self._datas.clear()
+        self._datas.extend(samples)
+
+    def steady(self: object, new_data: Union[str, int, float]) -> bool:
+        """True si la valeur 'new_data' ne changerait rien: entrée, sortie et fenêtre y sont déjà"""
+        value = float(new_data)
+        if value != self.last_value_in or value != self.last_value_out:
+            return False
+        if self._bounce_mode == self._modes.DISABLED or self._bounce_mode & self._modes.SYSTEMATIC:
+            return True
+        return len(self._datas) == self._pond and self._datas.count(value) == self._pond
+
+    def _update(self: object, new_data: Union[str, int, float]) -> float:
+        """Mise à jour des données"""
+        try:
+            assert type(new_data) in [str, int, float]
+        except AssertionError:
+            return self.last_value_out
+        self.last_value_in = float(new_data)
+        # reset system
+        if (
+                self.last_value_in >= self._min_max.MAX_RESET
+                and self.last_value_out <= self._min_max.MIN_RESET
+        ):
+            self._datas.clear()
+            self.last_value_out = self.last_value_in
+        # return as is
+        if self._bounce_mode == self._modes.DISABLED:
+            self.last_value_out = self.last_value_in
+        # no bounce; always remembering the lowest value
+        elif self._bounce_mode & self._modes.SYSTEMATIC:
+            if self.last_value_in < self.last_value_out:
+                self.last_value_out = self.last_value_in
+        else:
+            self._datas.append(self.last_value_in)
+            if len(self._datas) == 1:
+                self._datas *= self._pond
+            self.last_value_out = mean(self._datas)
+        return self.last_value_out
+
+    def __str__(self: object) -> str:
+        """Wrapper pour str()"""
+        return '{} {}'.format(self._modes, self._bounce_mode)
+
+    def __repr__(self: object) -> str:
+        """Wrapper pour repr()"""
+        return str(self)
+
+    def __float__(self: object) -> float:
+        """Wrapper pour float()"""
+        return self.last_value_out
+
+    def __int__(self: object) -> int:
+        """Wrapper pour int()"""
+        return int(self.last_value_out)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Lecture directe de la base Domoticz (SQLite, lecture seule)
+
+Remplace, pour le Domoticz local, la requète `type=devices`: les seules
+colonnes utiles de `DeviceStatus` et `Hardware` sont lues, sans rendu JSON
+ni aller-retour HTTP. Les enregistrements ont la forme attendue par
+`_HardWares.update`:
+
+    - idx, ID, Name, BatteryLevel, LastUpdate: colonnes de DeviceStatus
+    - HardwareID, HardwareTypeVal: identifiant et type du matériel
+    - HardwareType: libellé du type, appris des réponses `type=devices`
+      (il n'est pas en base); tant qu'un matériel n'a pas de libellé connu,
+      `UnknownHardwareType` signale qu'il faut passer par l'api
+
+La base est ouverte en lecture seule (`mode=ro`, `query_only`), ce qui
+laisse Domoticz seul écrivain et fonctionne avec le journal WAL.
+
+    python -m battery_level.database /opt/domoticz/domoticz.db
+"""
+
+# standard libs
+import json
+import sqlite3
+import sys
+from typing import List, Mapping, Optional
+from urllib.request import pathname2url
+
+_QUERY = '''
+    SELECT d.ID, d.DeviceID, d.Name, d.BatteryLevel, d.LastUpdate, d.HardwareID, h.Type, h.Name
+    FROM DeviceStatus AS d JOIN Hardware AS h ON h.ID = d.HardwareID
+    WHERE d.Used = 1 AND h.Enabled = 1 AND d.BatteryLevel > 0 AND d.BatteryLevel <= 100
+'''
+
+
+class UnknownHardwareType(LookupError):
+    """Matériel dont le libellé du type n'a pas encore été lu par l'api"""
+
+
+class DeviceDatabase:
+    """Base Domoticz en lecture seule"""
+    # libellé du type par matériel (HardwareID), commun aux ouvertures successives
+    _hardware_types: Mapping[int, str] = {}
+
+    def __init__(self: object, path: str, timeout: float = 2.0) -> None:
+        """Initialisation de la classe
+
+        Args:
+
+            - path (str): chemin de domoticz.db
+            - timeout (float): attente maximale (s) d'un verrou posé par Domoticz
+        """
+        self.path = path
+        self.timeout = timeout
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @classmethod
+    def learn(cls: object, records: List[dict]) -> None:
+        """Libellés des types de matériel d'une réponse `type=devices` du Domoticz local"""
+        for record in records:
+            if 'HardwareID' in record and 'HardwareType' in record:
+                cls._hardware_types[record['HardwareID']] = record['HardwareType']
+
+    def records(self: object, hardware_names: bool = False) -> List[dict]:
+        """Devices utilisés d'un matériel activé ayant un niveau de batterie, au format de l'api
+
+        Args:
+
+            - hardware_names (bool): nom du matériel à défaut de libellé connu
+
+        Raises:
+
+            - sqlite3.Error: base absente, illisible ou verrouillée
+            - UnknownHardwareType: libellé d'un matériel inconnu (interrogation par l'api)
+        """
+        if self._connection is None:
+            self._connection = sqlite3.connect(
+                'file:{}?mode=ro'.format(pathname2url(self.path)),
+                uri=True,
+                timeout=self.timeout,
+                check_same_thread=False
+            )
+            self._connection.execute('PRAGMA query_only = ON')
+        try:
+            rows = self._connection.execute(_QUERY).fetchall()
+        except sqlite3.Error:
+            self.close()
+            raise
+        unknown = sorted({row[7] for row in rows if row[5] not in self._hardware_types})
+        if unknown and not hardware_names:
+            raise UnknownHardwareType('type de matériel inconnu: {}'.format(', '.join(unknown)))
+        return [{
+            'idx': str(idx),
+            'ID': device_id,
+            'Name': name,
+            'BatteryLevel': battery_level,
+            'LastUpdate': last_update,
+            'HardwareID': hardware_id,
+            'HardwareTypeVal': hardware_type_val,
+            'HardwareType': self._hardware_types.get(hardware_id, hardware_name)
+        } for idx, device_id, name, battery_level, last_update, hardware_id, hardware_type_val, hardware_name in rows]
+
+    def close(self: object) -> None:
+        """Fermeture de la base"""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def __str__(self: object) -> str:
+        """Wrapper pour str()"""
+        return '<DeviceDatabase>{}'.format(self.path)
+
+    def __repr__(self: object) -> str:
+        """Wrapper pour repr()"""
+        return str(self)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Point d'entrée: affiche les enregistrements lus (JSON)"""
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        sys.stderr.write('usage: python -m battery_level.database <domoticz.db>\n')
+        return 2
+    database = DeviceDatabase(argv[0])
+    try:
+        json.dump(database.records(hardware_names=True), sys.stdout, indent=2)
+    except sqlite3.Error as exc:
+        sys.stderr.write('{}\n'.format(exc))
+        return 1
+    finally:
+        database.close()
+    sys.stdout.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
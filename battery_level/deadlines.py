@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Détection des devices hors service par échéances"""
+
+# standard libs
+from heapq import heappop, heappush
+from typing import List, Mapping, Set, Tuple
+
+# local libs
+from battery_level.core import split_hw_id
+
+
+class Deadlines:
+    """Échéances des prochains rapports attendus (tas binaire)
+
+    Chaque device a une échéance: dernier rapport + délai. Le délai est
+    appris de l'intervalle observé entre deux rapports (moyenne glissante),
+    à défaut de celui des devices du même type de matériel, à défaut du
+    délai par défaut. Le contrôle ne coûte que O(log n) par échéance
+    dépassée; un device ne passe hors service qu'une fois, jusqu'à son
+    prochain rapport.
+    """
+    _alpha = 0.3
+
+    def __init__(
+            self: object,
+            default_timeout: float = 1800,
+            factor: float = 3.0,
+            min_timeout: float = 600,
+            max_timeout: float = 172800) -> None:
+        """Initialisation de la classe
+
+        Args:
+
+            - default_timeout (float): délai (s) tant que rien n'est appris
+            - factor (float): délai = factor * intervalle appris
+            - min_timeout, max_timeout (float): bornes du délai appris (s)
+        """
+        self.default_timeout = default_timeout
+        self.factor = factor
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.dead: Set[str] = set()
+        self._heap: List[Tuple[float, str]] = []
+        self._deadline: Mapping[str, float] = {}
+        self._last: Mapping[str, float] = {}
+        self._interval: Mapping[str, float] = {}
+        self._type_interval: Mapping[int, float] = {}
+
+    def timeout(self: object, hw_id: str) -> float:
+        """Délai (s) avant de considérer le device hors service"""
+        interval = self._interval.get(hw_id)
+        if interval is None:
+            interval = self._type_interval.get(self._hardware_type(hw_id))
+        if interval is None:
+            return self.default_timeout
+        return min(max(interval * self.factor, self.min_timeout), self.max_timeout)
+
+    def report(self: object, hw_id: str, epoch: float) -> bool:
+        """Enregistre un rapport du device
+
+        Returns:
+
+            - bool: True si le device était hors service
+        """
+        last = self._last.get(hw_id)
+        if last is not None:
+            if epoch <= last:  # pas de nouveau rapport
+                return False
+            self._learn(hw_id, epoch - last)
+        self._last[hw_id] = epoch
+        deadline = epoch + self.timeout(hw_id)
+        self._deadline[hw_id] = deadline
+        heappush(self._heap, (deadline, hw_id))
+        if hw_id in self.dead:
+            self.dead.discard(hw_id)
+            return True
+        return False
+
+    def expired(self: object, now: float) -> List[str]:
+        """Devices passant hors service à 'now' (une seule fois chacun)"""
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, hw_id = heappop(self._heap)
+            # entrée périmée: le device a fait un rapport depuis
+            if self._deadline.get(hw_id) != deadline:
+                continue
+            del self._deadline[hw_id]
+            self.dead.add(hw_id)
+            expired.append(hw_id)
+        return expired
+
+    def is_dead(self: object, hw_id: str) -> bool:
+        """True si le device est hors service"""
+        return hw_id in self.dead
+
+    def discard(self: object, hw_id: str) -> None:
+        """Oublie le device (l'entrée du tas devient périmée)"""
+        self._deadline.pop(hw_id, None)
+        self._last.pop(hw_id, None)
+        self._interval.pop(hw_id, None)
+        self.dead.discard(hw_id)
+
+    def _learn(self: object, hw_id: str, interval: float) -> None:
+        """Moyenne glissante des intervalles, par device et par type de matériel"""
+        for mapping, key in (
+                (self._interval, hw_id),
+                (self._type_interval, self._hardware_type(hw_id))
+        ):
+            previous = mapping.get(key)
+            mapping[key] = interval if previous is None else (
+                previous + self._alpha * (interval - previous)
+            )
+
+    @staticmethod
+    def _hardware_type(hw_id: str) -> int:
+        """HardwareTypeVal du device"""
+        try:
+            return split_hw_id(hw_id)[1]
+        except ValueError:
+            return -1
+
+    def __len__(self: object) -> int:
+        """Nombre d'échéances en cours"""
+        return len(self._deadline)
+
+    def __str__(self: object) -> str:
+        """Wrapper pour str()"""
+        return '<Deadlines>{} scheduled - {} dead'.format(len(self), len(self.dead))
+
+    def __repr__(self: object) -> str:
+        """Wrapper pour repr()"""
+        return str(self)
@@ -3,179 +3,44 @@
 """Domoticz devices"""
 
 # standard libs
-from collections import deque, namedtuple
-from datetime import datetime, timedelta
-from statistics import mean
-from typing import Iterable, Iterator, List, Mapping, Tuple, Union
+from datetime import datetime
+from threading import RLock
+from typing import Iterable, Iterator, List, Mapping, Optional, Tuple
 from urllib.parse import quote_plus
 
 # Domoticz lib
 import Domoticz
 
 # local libs
-from battery_level.common import debug, last_update_2_datetime
+from battery_level.columnar import FleetStore, fleet_store
+from battery_level.common import debug
+from battery_level.controls import FIRST_CONTROL_UNIT, Controls, is_control
+from battery_level.core import BANDS, _Bounces, _HardWares, last_update_2_datetime, level_band
+from battery_level.deadlines import Deadlines
+from battery_level.fleet_stats import FleetStats
+from battery_level.history import History
 from battery_level.images import Images
+from battery_level.metrics import Metrics
 from battery_level.plugin_config import PluginConfig
 from battery_level.requests import Requests
-
-
-class _HardWares:
-    """Collections des matériels"""
-    materials: Mapping[str, Tuple[float, str, datetime]] = {}
-
-    @classmethod
-    def items(cls: object) -> Tuple[str, float, str, datetime]:
-        """for...in... extended wrapper"""
-        for key, value in cls.materials.items():
-            yield (key, *value)
-
-    @classmethod
-    def update(cls: object, datas: dict) -> bool:
-        """Ajoute ou met à jour un matériel"""
-        battery_level = float(datas['BatteryLevel'])
-        if 0 < battery_level <= 100:
-            brand = datas['HardwareType'].split()[0]
-            hw_id = cls._build_hw_id(datas)
-            # first time hw_id is found
-            last_updated = last_update_2_datetime(datas['LastUpdate'])
-            if hw_id not in cls.materials:
-                name = '{}: {}'.format(brand, datas['Name'])
-            else:
-                name = cls._refactor_name(hw_id, brand, datas['Name'])
-                old_last_updated = cls.materials[hw_id][2]
-                if last_updated < old_last_updated:
-                    last_updated = old_last_updated
-            # update materials
-            cls.materials.update({
-                hw_id: [
-                    battery_level,
-                    name,
-                    last_updated
-                ]
-            })
-
-    @classmethod
-    def __repr__(cls: object) -> str:
-        """repr() Wrapper"""
-        return str(cls.materials)
-
-    @classmethod
-    def __str__(cls: object) -> str:
-        """str() Wrapper"""
-        return str(cls.materials)
-
-    @classmethod
-    def _build_hw_id(cls: object, datas: dict) -> str:
-        """[DOCSTRING]"""
-        return '{}{}{}'.format(
-            ('0{}'.format(datas['HardwareTypeVal']))[-2:],
-            ('0{}'.format(datas['HardwareID']))[-2:],
-            cls._decode_hw_id(datas)
-        )
-
-    @classmethod
-    def _refactor_name(cls: object, hw_id: str, brand: str, name: str) -> str:
-        """Re-construit le nom du device"""
-        old_list = cls.materials[hw_id][1].split()
-        common_list = list(set(old_list) & set(
-            ('{}: {}'.format(brand, name)).split()))
-        new_list = []
-        for word in old_list:
-            if word in common_list:
-                new_list.append(word)
-        new_str = ' '.join(new_list).rstrip(" -")
-        if new_str == "{}: ".format(brand):
-            new_str += '{}'.format(hw_id)
-        return new_str
-
-    @staticmethod
-    def _decode_hw_id(datas: dict) -> str:
-        """[DOCSTRING]"""
-        hw_id = datas['ID']
-        # openzwave
-        if datas['HardwareTypeVal'] in (21, 94):
-            hw_id = '00{}'.format(hw_id[-4:-2])
-        return str(hw_id)[-4:]
-
-
-class _Bounces:
-    """Gestion des rebonds des valeurs"""
-    _BOUNCEMODES = namedtuple(
-        'Modes', ['DISABLED', 'SYSTEMATIC', 'POND_1H', 'POND_1D'])
-    _MINMAX = namedtuple('minmax', ['MIN', 'MAX', 'MIN_RESET', 'MAX_RESET'])
-
-    def __init__(
-            self: object,
-            mode: int,
-            mini: Union[str, int, float] = 0,
-            maxi: Union[str, int, float] = 100) -> None:
-        """Initialisation de la classe"""
-        self._modes = self._BOUNCEMODES(0, 1, 2, 4)
-        self._bounce_mode = mode
-        self._min_max = self._MINMAX(
-            mini,
-            maxi,
-            PluginConfig.empty_level,
-            100 - PluginConfig.empty_level
-        )
-        self.last_value_out = self.last_value_in = 100.0
-        self._pond = 12
-        if mode == 4:
-            self._pond = 288
-        self._datas = deque(maxlen=self._pond)
-
-    def _update(self: object, new_data: Union[str, int, float]) -> float:
-        """Mise à jour des données"""
-        try:
-            assert type(new_data) in [str, int, float]
-        except AssertionError:
-            return self.last_value_out
-        self.last_value_in = float(new_data)
-        # reset system
-        if (
-                self.last_value_in >= self._min_max.MAX_RESET
-                and self.last_value_out <= self._min_max.MIN_RESET
-        ):
-            self._datas.clear()
-            self.last_value_out = self.last_value_in
-        # return as is
-        if self._bounce_mode == self._modes.DISABLED:
-            self.last_value_out = self.last_value_in
-        # no bounce; always remembering the lowest value
-        elif self._bounce_mode & self._modes.SYSTEMATIC:
-            if self.last_value_in < self.last_value_out:
-                self.last_value_out = self.last_value_in
-        else:
-            self._datas.append(self.last_value_in)
-            if len(self._datas) == 1:
-                self._datas *= self._pond
-            self.last_value_out = mean(self._datas)
-        return self.last_value_out
-
-    def __str__(self: object) -> str:
-        """Wrapper pour str()"""
-        return '{} {}'.format(self._modes, self._bounce_mode)
-
-    def __repr__(self: object) -> str:
-        """Wrapper pour repr()"""
-        return str(self)
-
-    def __float__(self: object) -> float:
-        """Wrapper pour float()"""
-        return self.last_value_out
-
-    def __int__(self: object) -> int:
-        """Wrapper pour int()"""
-        return int(self.last_value_out)
+from battery_level.snapshot import Snapshot
+from battery_level.sources import Sources
 
 
 class _Device(_Bounces):
     """Elément device"""
 
-    def __init__(self: object, unit_id: int, name: str, last_update: str, bat_level: str) -> None:
+    def __init__(
+            self: object,
+            unit_id: int,
+            name: str,
+            last_update: str,
+            bat_level: str,
+            hw_id: str = '') -> None:
         """Initialisation de la classe"""
-        _Bounces.__init__(self, 2, 0, 100)
+        _Bounces.__init__(self, 2, 0, 100, PluginConfig.empty_level)
         self.unit_id = int(unit_id)
+        self.hw_id = hw_id
         self.name = ''
         self.last_update = None
         self.bat_lev = 0
@@ -197,17 +62,16 @@ class _Device(_Bounces):
             self.last_update
         ))
         self.name = kwargs.get('name', self.name)
-        self._detect_device_down()
         self._set_image_id()
+        History.append(self.hw_id, self.last_value_in, self.bat_lev)
 
-    def _detect_device_down(self: object) -> None:
-        """Detect device down"""
-        max_time = self.last_update + timedelta(minutes=30)
-        if max_time < datetime.now():
-            Domoticz.Error('batterie déchargée: {}'.format(
-                self.name
-            ))
-            self.bat_lev = self._update(0)
+    def set_state(self: object, bat_lev_in: float, bat_lev: float, image_id: str, epoch: float) -> None:
+        """Mise à jour depuis un calcul externe (stockage en colonnes)"""
+        self.last_value_in = float(bat_lev_in)
+        self.last_value_out = self.bat_lev = float(bat_lev)
+        self.image_id = image_id
+        self.last_update = datetime.fromtimestamp(epoch)
+        History.append(self.hw_id, self.last_value_in, self.bat_lev)
 
     def _set_image_id(self: object) -> None:
         """Define Domoticz image ID
@@ -215,16 +79,7 @@ class _Device(_Bounces):
         Returns:
             str: the Domoticz image id
         """
-        if self.bat_lev > PluginConfig.empty_level + 2 * PluginConfig.level_delta:
-            self.image_id = "pyBattLev"
-        elif self.bat_lev > PluginConfig.empty_level + PluginConfig.level_delta:
-            self.image_id = "pyBattLev_ok"
-        elif self.bat_lev > PluginConfig.empty_level:
-            self.image_id = "pyBattLev_low"
-        elif self.bat_lev > 0:
-            self.image_id = "pyBattLev_empty"
-        else:
-            self.image_id = "pyBattLev_ko"
+        self.image_id = level_band(self.bat_lev, PluginConfig.empty_level)
 
     def __str__(self: object) -> str:
         """Wrapper pour str()"""
@@ -242,8 +97,55 @@ class _Device(_Bounces):
         return str(self)
 
 
+class _ChangeSet:
+    """Changements à reporter vers Domoticz après une agrégation"""
+
+    def __init__(self: object) -> None:
+        """Initialisation de la classe"""
+        self.created: List[Tuple[str, int, str]] = []
+        self.evicted: List[Tuple[str, int, str]] = []
+        self.levels: Mapping[str, Tuple[float, str]] = {}
+        self.errors: List[str] = []
+        self.status: List[str] = []
+        self.debug: List[str] = []
+        # relève partielle (requètes 'rid='): pas une interrogation complète
+        self.partial = False
+
+    def __str__(self: object) -> str:
+        """Wrapper pour str()"""
+        return '<ChangeSet>{} created - {} evicted - {} levels - {} errors'.format(
+            len(self.created),
+            len(self.evicted),
+            len(self.levels),
+            len(self.errors)
+        )
+
+    def __repr__(self: object) -> str:
+        """Wrapper pour repr()"""
+        return str(self)
+
+
 class Devices(_HardWares, Iterable[_Device]):
     """Collection des devices"""
+    _lock = RLock()
+    _deadlines = Deadlines()
+    _store: Optional[FleetStore] = None
+    _notifications: List[str] = []
+    _metrics_names: Mapping[str, str] = {}
+    _evicted_units: set = set()
+    _stats = FleetStats()
+    # devices de synthèse: (statistique, unité, nom, unité affichée)
+    _summary_devices = (
+        ('min', 249, 'Battery minimum', '%'),
+        ('p10', 250, 'Battery 10th percentile', '%'),
+        ('median', 251, 'Battery median', '%'),
+        ('empty', 252, 'Batteries empty', 'devices'),
+        ('dead', 253, 'Batteries dead', 'devices'),
+    )
+    _summary: Mapping[str, float] = {}
+    _summary_enabled = False
+    # hw_id dont le niveau ou le nom a changé depuis la dernière synchronisation de l'ordre du plan
+    _plan_dirty: set = set()
     _devices: Mapping[str, Domoticz.Device] = {}
     _map_devices: Mapping[str, _Device] = {}
     _urls = {
@@ -274,25 +176,55 @@ class Devices(_HardWares, Iterable[_Device]):
     @classmethod
     def _init_map(cls: object) -> None:
         """Initialisation du mapping"""
-        for device in cls._devices.values():
-            cls._map_devices.update({
-                device.DeviceID: _Device(
-                    device.Unit,
-                    device.Name,
-                    device.LastUpdate,
-                    device.sValue
-                )
-            })
+        with cls._lock:
+            for device in cls._devices.values():
+                if is_control(device):
+                    continue
+                cls._map_devices.update({
+                    device.DeviceID: _Device(
+                        device.Unit,
+                        device.Name,
+                        device.LastUpdate,
+                        device.sValue,
+                        device.DeviceID
+                    )
+                })
+                cls.seen(device.DeviceID)
+                cls._stats.set(device.DeviceID, cls._map_devices[device.DeviceID].bat_lev)
         debug(cls._map_devices)
 
     @classmethod
-    def _check_devices(cls: object) -> None:
-        """Ajout/mise à jour des devices"""
-        unit_ids_all = set(range(1, 255))
+    def _check_devices(
+            cls: object,
+            changes: '_ChangeSet',
+            hw_keys: Iterable[str],
+            partial: bool = False,
+            reported: Optional[Iterable[str]] = None) -> None:
+        """Ajout/mise à jour interne des devices
+
+        Aucun appel à l'API Domoticz: les créations et mises à jour à
+        reporter sont consignées dans 'changes'. Seuls les matériels
+        'hw_keys' (ceux de la source interrogée) sont traités: les autres
+        sources ne reçoivent ni échantillon ni mise à jour. Hors relève
+        partielle, ceux qui n'ont pas été relevés sont passés à 0.
+
+        Les matériels hors de 'reported' (enregistrements inchangés, tous
+        rapportés par défaut) n'ont pas de nouveau rapport à enregistrer
+        dans les échéances. Leur lissage reçoit tout de même un échantillon
+        à chaque interrogation, la fenêtre couvrant une durée (12 relèves):
+        seul un device stable (entrée, sortie et fenêtre déjà à ce niveau)
+        n'a ni lissage, ni historique, ni statistique du parc à mettre à
+        jour. Le niveau reste reporté pour chaque device (`Touch`).
+        """
+        hw_keys = list(hw_keys)
+        unit_ids_all = set(range(1, FIRST_CONTROL_UNIT))
         unit_ids = set(
             sorted({dev.unit_id for dev in cls._map_devices.values()}))
+        materials = ((hw_key, *cls.materials[hw_key]) for hw_key in hw_keys if hw_key in cls.materials)
+        reported = None if reported is None else set(reported)
+        steady = set()
         # check devices
-        for hw_key, hw_batlevel, hw_name, hw_last_update in cls.items():
+        for hw_key, hw_batlevel, hw_name, hw_last_update in materials:
             # Création
             if hw_key not in cls._map_devices:
                 unit_ids_free = unit_ids_all - unit_ids
@@ -300,95 +232,472 @@ class Devices(_HardWares, Iterable[_Device]):
                     unit_id = unit_ids_free.pop()
                     unit_ids.add(unit_id)
                 else:
-                    Domoticz.Error('Plus de device disponible!')
-                    return
+                    changes.errors.append('Plus de device disponible!')
+                    break
                 cls._map_devices.update({
                     hw_key: _Device(
                         unit_id,
                         hw_name,
                         hw_last_update,
-                        hw_batlevel
+                        hw_batlevel,
+                        hw_key
                     )
                 })
-                Domoticz.Status('Création: {}'.format(hw_name))
-                params = {
-                    'Name': hw_name,
-                    'Unit': unit_id,
-                    'DeviceID': hw_key,
-                    'TypeName': "Custom",
-                    'Options': {"Custom": "1;%"}
-                }
-                # auto use of device
-                if PluginConfig.use_every_devices:
-                    params.update({'Used': 1})
-                Domoticz.Device(**params).Create()
-                # add notification request
-                if PluginConfig.notify_all:
-                    Requests.add(
-                        verb="GET",
-                        url=''.join(cls._urls["notif"]).format(
-                            cls._devices[unit_id].ID,
-                            quote_plus(
-                                '{} batterie déchargée!'.format(hw_name)),
-                            PluginConfig.empty_level
-                        )
-                    )
+                changes.created.append((hw_key, unit_id, hw_name))
             # Mise à jour interne
-            cls._map_devices[hw_key].update(
-                bat_lev=hw_batlevel,
-                last_update=hw_last_update
-            )
-        # Mise à jour Domoticz
-        debug('Internal device view', **cls._map_devices)
-        for device in cls._devices.values():
-            int_device = cls._map_devices[device.DeviceID]
-            if device.DeviceID not in cls.materials:  # device down
-                int_device.update(bat_lev=0)
-            if float(device.sValue) != int_device.bat_lev:
-                device.Update(
-                    0,
-                    str(round(int_device.bat_lev, 1)),
-                    Image=Images()[int_device.image_id]
-                )
+            fresh = reported is None or hw_key in reported
+            if fresh and cls._deadlines.report(hw_key, hw_last_update.timestamp()):
+                changes.status.append('Device de nouveau actif: {}'.format(hw_name))
+            bat_lev = 0 if cls._deadlines.is_dead(hw_key) else hw_batlevel
+            if cls._store is None:
+                if not fresh and cls._map_devices[hw_key].steady(bat_lev):
+                    steady.add(hw_key)
+                    continue
+                cls._map_devices[hw_key].update(bat_lev=bat_lev, last_update=hw_last_update)
             else:
-                device.Touch()
+                cls._store.update(
+                    hw_key,
+                    bat_lev,
+                    hw_last_update.timestamp(),
+                    cls._map_devices[hw_key].name
+                )
+        for hw_key in hw_keys:
+            int_device = cls._map_devices.get(hw_key)
+            if not partial and int_device is not None and hw_key not in cls.materials:  # device down
+                if cls._store is None:
+                    int_device.update(bat_lev=0)
+                else:
+                    cls._store.update(hw_key, 0, int_device.last_update.timestamp())
+        if cls._store is not None:
+            steady = set(hw_keys) - set(cls._store_to_devices())
+        for hw_key in hw_keys:
+            int_device = cls._map_devices.get(hw_key)
+            if int_device is None:
+                continue
+            changes.levels[hw_key] = (round(int_device.bat_lev, 1), int_device.image_id)
+            if hw_key not in steady:
+                cls._stats.set(hw_key, int_device.bat_lev, cls._deadlines.is_dead(hw_key))
+        changes.debug.append('Internal device view: {}'.format(cls._map_devices))
+
+    @classmethod
+    def _evict(cls: object, hw_key: str, changes: '_ChangeSet') -> None:
+        """Oubli d'un matériel disparu; la suppression du device Domoticz est consignée dans 'changes'"""
+        int_device = cls._map_devices.pop(hw_key, None)
+        cls._deadlines.discard(hw_key)
+        cls._stats.discard(hw_key)
+        if cls._store is not None:
+            cls._store.remove(hw_key)
+        if int_device is not None:
+            changes.evicted.append((hw_key, int_device.unit_id, int_device.name))
+
+    @classmethod
+    def hot_records(cls: object, prefix: str, threshold: float, limit: int) -> List[str]:
+        """idx des enregistrements de la source à relever rapidement
+
+        Matériels au niveau inférieur ou égal à 'threshold' (%) puis
+        matériels hors service, les plus bas d'abord; au plus 'limit'.
+        """
+        with cls._lock:
+            hot = {
+                hw_key: (cls._deadlines.is_dead(hw_key), int_device.bat_lev)
+                for hw_key, int_device in cls._map_devices.items()
+                if int_device.bat_lev <= threshold or cls._deadlines.is_dead(hw_key)
+            }
+            return [idx for _, idx in sorted(cls.records(hot, prefix))[:limit]]
 
     @classmethod
     def remove(cls: object, unit_id: int) -> None:
         """Retire le device"""
-        remove = 0
-        for key, value in cls._map_devices.items():
-            if value.unit_id == unit_id:
-                remove = key
-                break
-        if remove:
-            Domoticz.Status('Removing: {}'.format(
-                cls._devices[cls._map_devices[remove]].Name
-            ))
-            cls._map_devices.pop(remove)
+        if unit_id in cls._evicted_units:
+            cls._evicted_units.discard(unit_id)
             return
+        if any(unit_id == unit for _, unit, _, _ in cls._summary_devices):
+            cls._summary.clear()
+            return
+        with cls._lock:
+            remove = 0
+            for key, value in cls._map_devices.items():
+                if value.unit_id == unit_id:
+                    remove = key
+                    break
+            if remove:
+                Domoticz.Status('Removing: {}'.format(cls._map_devices[remove].name))
+                cls._map_devices.pop(remove)
+                cls._plan_dirty.add(remove)
+                cls._deadlines.discard(remove)
+                cls._stats.discard(remove)
+                Snapshot.remove(remove)
+                cls.publish_summary()
+                return
         Domoticz.Error('Device not found! ({})'.format(unit_id))
 
     @classmethod
-    def build_from_hardware(cls: object, hardwares: dict) -> None:
+    def modified(cls: object, unit_id: int) -> Optional[Domoticz.Device]:
+        """Device modifié dans Domoticz: le nom est repris dans le device interne
+
+        Returns:
+
+            - Domoticz.Device: le device de batterie renommé, sinon None
+        """
+        device = cls._devices.get(unit_id)
+        if device is None or is_control(device):
+            return None
+        with cls._lock:
+            int_device = cls._map_devices.get(device.DeviceID)
+            if int_device is None or int_device.name == device.Name:
+                return None
+            int_device.name = device.Name
+            cls._plan_dirty.add(device.DeviceID)
+            if cls._store is not None:
+                cls._store.slot(device.DeviceID, device.Name)
+            cls._export_metrics(device.DeviceID)
+        return device
+
+    @classmethod
+    def check_deadlines(cls: object, now: float) -> None:
+        """Passe hors service les devices dont l'échéance de rapport est dépassée"""
+        with cls._lock:
+            expired = cls._deadlines.expired(now)
+            for hw_id in expired:
+                int_device = cls._map_devices.get(hw_id)
+                if int_device is None:
+                    continue
+                Domoticz.Error('batterie déchargée: {} (pas de nouvelles depuis {})'.format(
+                    int_device.name,
+                    int_device.last_update
+                ))
+                if cls._store is None:
+                    int_device.update(bat_lev=0)
+                else:
+                    cls._store.update(hw_id, 0, int_device.last_update.timestamp())
+                    cls._store_to_devices()
+                device = cls._devices.get(int_device.unit_id)
+                if device is not None:
+                    device.Update(
+                        0,
+                        str(round(int_device.bat_lev, 1)),
+                        Image=Images()[int_device.image_id]
+                    )
+                    cls._plan_dirty.add(hw_id)
+                cls._stats.set(hw_id, 0, True)
+                cls._export_metrics(hw_id)
+            if expired:
+                cls.publish_summary()
+                Snapshot.publish()
+
+    @classmethod
+    def configure_store(cls: object, enabled: bool) -> None:
+        """Active le stockage en colonnes (numpy), alimenté par l'état courant
+
+        Les fenêtres de lissage passent d'un stockage à l'autre: tenues par
+        le stockage en colonnes tant qu'il est actif, elles sont rendues aux
+        devices quand il est désactivé.
+        """
+        with cls._lock:
+            if cls._store is not None:
+                for hw_key in cls._store.hw_ids:
+                    int_device = cls._map_devices.get(hw_key)
+                    if int_device is not None:
+                        int_device.load_window(cls._store.samples(hw_key))
+            cls._store = fleet_store(empty_level=PluginConfig.empty_level) if enabled else None
+            if enabled and cls._store is None:
+                Domoticz.Error('numpy non disponible: stockage en colonnes désactivé')
+                return
+            if cls._store is not None:
+                for hw_key, int_device in cls._map_devices.items():
+                    cls._store.load(
+                        hw_key,
+                        int_device.window(),
+                        int_device.last_value_in,
+                        int_device.bat_lev,
+                        int_device.last_update.timestamp(),
+                        int_device.name
+                    )
+                    int_device.load_window(())
+
+    @classmethod
+    def refresh_bands(cls: object) -> None:
+        """Nouveau niveau vide: seuils de lissage et images, sans perdre l'état des devices"""
+        with cls._lock:
+            for int_device in cls._map_devices.values():
+                int_device.set_empty_level(PluginConfig.empty_level)
+                int_device._set_image_id()  # pylint:disable=protected-access
+            if cls._store is not None:
+                store = cls._store
+                store.empty_level = PluginConfig.empty_level
+                store.band[:store.size] = store.bands(store.level_out[:store.size])
+                for slot, hw_key in enumerate(store.hw_ids):
+                    int_device = cls._map_devices.get(hw_key)
+                    if int_device is not None:
+                        int_device.image_id = BANDS[store.band[slot]]
+            for hw_key, int_device in cls._map_devices.items():
+                device = cls._devices.get(int_device.unit_id)
+                if device is not None and device.Image != Images()[int_device.image_id]:
+                    device.Update(device.nValue, device.sValue, Image=Images()[int_device.image_id])
+                cls._export_metrics(hw_key)
+            cls.publish_summary()
+            Snapshot.publish()
+
+    @classmethod
+    def _store_to_devices(cls: object) -> List[str]:
+        """Calcul vectorisé du parc puis report dans les seuls devices qui ont changé
+
+        Returns:
+
+            - list: hw_id des devices mis à jour
+        """
+        store = cls._store
+        updated = []
+        for slot in store.compute():
+            int_device = cls._map_devices.get(store.hw_ids[slot])
+            if int_device is not None:
+                int_device.set_state(
+                    store.level_in[slot],
+                    store.level_out[slot],
+                    BANDS[store.band[slot]],
+                    store.last_update[slot]
+                )
+                updated.append(store.hw_ids[slot])
+        return updated
+
+    @classmethod
+    def configure_deadlines(cls: object, default_timeout: float) -> None:
+        """Délai par défaut (s) avant de considérer un device hors service"""
+        cls._deadlines.default_timeout = default_timeout
+
+    @classmethod
+    def build_from_hardware(cls: object, hardwares: dict, prefix: str = '', partial: bool = False) -> None:
         """[summary]
 
         Args:
 
             - hardwares (dict): les devices obtenus de l'api domoticz
+            - prefix (str): préfixe des hw_id de la source
+            - partial (bool): relève partielle (voir `compute_changes`)
         """
-        for data in hardwares:
-            cls.update(data)
-        debug('Detected hardwares', **cls.materials)
-        cls._check_devices()
+        cls.apply_changes(cls.compute_changes(hardwares, prefix, partial))
+
+    @classmethod
+    def compute_changes(cls: object, hardwares: dict, prefix: str = '', partial: bool = False) -> '_ChangeSet':
+        """Agrégation et mise à jour interne; utilisable hors du thread du plugin
+
+        Args:
+
+            - hardwares (dict): les devices obtenus de l'api domoticz
+            - prefix (str): préfixe des hw_id de la source
+            - partial (bool): relève partielle (requètes 'rid='): seuls les
+                matériels dont un enregistrement a changé sont traités, sans
+                fin de cycle (ni éviction)
+        """
+        changes = _ChangeSet()
+        changes.partial = partial
+        with cls._lock:
+            if partial:
+                updated = {
+                    cls.record_hw_id(data, prefix) for data in hardwares if cls.update(data, prefix)
+                }
+                updated.discard(None)
+                cls._check_devices(changes, updated, partial=True)
+                return changes
+            reported = {cls.record_hw_id(data, prefix) for data in hardwares if cls.update(data, prefix)}
+            for hw_key in cls.end_cycle(prefix, PluginConfig.evict_cycles):
+                cls._evict(hw_key, changes)
+            changes.debug.append('Detected hardwares: {}'.format(cls.materials))
+            cls._check_devices(changes, cls.source_hw_ids(prefix), reported=reported)
+        return changes
+
+    @classmethod
+    def apply_changes(cls: object, changes: '_ChangeSet') -> None:
+        """Report des changements vers Domoticz (thread du plugin uniquement)"""
+        debug(*changes.debug)
+        for hw_key, unit_id, hw_name in changes.created:
+            Domoticz.Status('Création: {}'.format(hw_name))
+            params = {
+                'Name': hw_name,
+                'Unit': unit_id,
+                'DeviceID': hw_key,
+                'TypeName': "Custom",
+                'Options': {"Custom": "1;%"}
+            }
+            # auto use of device
+            if PluginConfig.use_every_devices:
+                params.update({'Used': 1})
+            Domoticz.Device(**params).Create()
+            cls._plan_dirty.add(hw_key)
+            # add notification request
+            if PluginConfig.notify_all:
+                cls._notifications.append(''.join(cls._urls["notif"]).format(
+                    cls._devices[unit_id].ID,
+                    quote_plus(
+                        '{} batterie déchargée!'.format(hw_name)),
+                    PluginConfig.empty_level
+                ))
+        for hw_key, unit_id, hw_name in changes.evicted:
+            Domoticz.Status('Suppression (matériel disparu): {}'.format(hw_name))
+            cls._plan_dirty.add(hw_key)
+            device = cls._devices.get(unit_id)
+            if device is not None:
+                cls._evicted_units.add(unit_id)
+                device.Delete()
+            for metric in (
+                    'battery_level_percent',
+                    'battery_level_band',
+                    'battery_level_last_update_timestamp_seconds',
+                    'battery_level_dead'
+            ):
+                Metrics.remove(metric, hw_id=hw_key)
+            old_name = cls._metrics_names.pop(hw_key, None)
+            if old_name is not None:
+                Metrics.remove('battery_level_device_info', hw_id=hw_key, name=old_name)
+            Snapshot.remove(hw_key)
+        # notifications différées tant que Domoticz est surchargé
+        while cls._notifications and not Sources.shedding():
+            Requests.add(verb="GET", url=cls._notifications.pop(0))
+        for error in changes.errors:
+            Domoticz.Error(error)
+        for status in changes.status:
+            Domoticz.Status(status)
+        # Mise à jour Domoticz
+        for device in cls._devices.values():
+            if device.DeviceID not in changes.levels:
+                continue
+            bat_lev, image_id = changes.levels[device.DeviceID]
+            if float(device.sValue) != bat_lev:
+                device.Update(
+                    0,
+                    str(bat_lev),
+                    Image=Images()[image_id]
+                )
+                cls._plan_dirty.add(device.DeviceID)
+            else:
+                device.Touch()
+        with cls._lock:
+            for hw_key in changes.levels:
+                cls._export_metrics(hw_key)
+            cls.publish_summary()
+            Snapshot.publish()
+
+    @classmethod
+    def setup_summary(cls: object, enabled: bool) -> None:
+        """Devices de synthèse du parc (minimum, 10e centile, médiane, vides, hors service)
+
+        Les devices existants ne sont pas supprimés à la désactivation.
+        """
+        cls._summary_enabled = enabled
+        cls._summary = {}
+        if not enabled:
+            return
+        for _, unit, name, label in cls._summary_devices:
+            Controls.register(unit, name, TypeName='Custom', Options={'Custom': '1;{}'.format(label)}, Used=1)
+        with cls._lock:
+            cls.publish_summary()
+
+    @classmethod
+    def publish_summary(cls: object) -> None:
+        """Mise à jour des devices de synthèse dont la statistique a changé"""
+        if not cls._summary_enabled:
+            return
+        stats = cls._stats.summary(PluginConfig.empty_level)
+        for stat, unit, _, _ in cls._summary_devices:
+            value = stats[stat]
+            if value is None or cls._summary.get(stat) == value:
+                continue
+            device = cls._devices.get(unit)
+            if device is None or not is_control(device):
+                continue
+            device.Update(0, str(round(value, 1)))
+            cls._summary[stat] = value
+
+    @classmethod
+    def setup_snapshot(cls: object, path: str) -> None:
+        """Instantané partagé du parc (chemin vide: désactivé), alimenté par l'état courant"""
+        with cls._lock:
+            Snapshot.setup(path)
+            for hw_key, int_device in cls._map_devices.items():
+                cls._export_snapshot(hw_key, int_device)
+            Snapshot.publish()
+
+    @classmethod
+    def _export_snapshot(cls: object, hw_key: str, int_device: _Device) -> None:
+        """État du device dans l'instantané partagé"""
+        Snapshot.set(
+            hw_key,
+            int_device.name,
+            round(int_device.bat_lev, 1),
+            BANDS.index(int_device.image_id),
+            int_device.last_update.timestamp(),
+            cls._deadlines.is_dead(hw_key)
+        )
+
+    @classmethod
+    def _export_metrics(cls: object, hw_key: str) -> None:
+        """Métriques et état partagé du device"""
+        int_device = cls._map_devices.get(hw_key)
+        if int_device is None:
+            return
+        cls._export_snapshot(hw_key, int_device)
+        Metrics.set('battery_level_percent', round(int_device.bat_lev, 1), hw_id=hw_key)
+        Metrics.set('battery_level_band', BANDS.index(int_device.image_id), hw_id=hw_key)
+        Metrics.set(
+            'battery_level_last_update_timestamp_seconds',
+            int_device.last_update.timestamp(),
+            hw_id=hw_key
+        )
+        Metrics.set('battery_level_dead', cls._deadlines.is_dead(hw_key), hw_id=hw_key)
+        old_name = cls._metrics_names.get(hw_key)
+        if old_name != int_device.name:
+            if old_name is not None:
+                Metrics.remove('battery_level_device_info', hw_id=hw_key, name=old_name)
+            Metrics.set('battery_level_device_info', 1, hw_id=hw_key, name=int_device.name)
+            cls._metrics_names[hw_key] = int_device.name
+
+    @classmethod
+    def plan_entries(cls: object) -> List[Tuple[str, int, str, float]]:
+        """Devices de batterie pour l'ordre du plan: (hw_id, idx Domoticz, nom, niveau affiché)
+
+        Les niveaux viennent des devices internes (pas de relecture de
+        sValue); les changements en attente sont oubliés.
+        """
+        with cls._lock:
+            cls._plan_dirty = set()
+            return [
+                (hw_key, device.ID, device.Name, round(int_device.bat_lev, 1))
+                for hw_key, int_device, device in cls._plan_devices(cls._map_devices)
+            ]
+
+    @classmethod
+    def plan_changes(cls: object) -> List[Tuple[str, Optional[int], str, float]]:
+        """Devices dont le niveau ou le nom a changé depuis le dernier appel
+
+        Returns:
+
+            - list: (hw_id, idx Domoticz, nom, niveau affiché); idx None pour un device supprimé
+        """
+        with cls._lock:
+            dirty, cls._plan_dirty = cls._plan_dirty, set()
+            present = {
+                hw_key: (hw_key, device.ID, device.Name, round(int_device.bat_lev, 1))
+                for hw_key, int_device, device in cls._plan_devices(dirty)
+            }
+            return [present.get(hw_key, (hw_key, None, '', 0.0)) for hw_key in dirty]
+
+    @classmethod
+    def _plan_devices(cls: object, hw_keys: Iterable[str]) -> Iterator[Tuple[str, _Device, Domoticz.Device]]:
+        """(hw_id, device interne, device Domoticz) des devices existants parmi 'hw_keys'"""
+        for hw_key in hw_keys:
+            int_device = cls._map_devices.get(hw_key)
+            device = None if int_device is None else cls._devices.get(int_device.unit_id)
+            if device is not None:
+                yield hw_key, int_device, device
 
     @classmethod
     def values(cls: object) -> List[_Device]:
-        """Liste des devices"""
-        return cls._devices.values()
+        """Liste des devices de batterie"""
+        return [device for device in cls._devices.values() if not is_control(device)]
 
     @classmethod
     def __iter__(cls: object) -> Iterator[_Device]:
         """Wrapper for ... in ..."""
         for device in cls._devices.values():
-            yield device
+            if not is_control(device):
+                yield device
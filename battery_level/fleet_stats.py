@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Statistiques du parc tenues à jour à chaque changement de niveau
+
+Les niveaux sont comptés par pas de 0,1% dans un arbre de Fenwick
+(1001 cases, de 0 à 100%): ajout, retrait, rang et quantile en O(log n),
+sans parcourir le parc. Les devices hors service sont comptés à part.
+"""
+
+# standard libs
+from math import ceil
+from typing import List, Mapping, Optional
+
+_STEPS = 1000
+
+
+class FenwickTree:
+    """Arbre de Fenwick (sommes préfixes) sur des cases 0..size-1"""
+
+    def __init__(self: object, size: int) -> None:
+        """Initialisation de la classe"""
+        self.size = size
+        self._tree: List[int] = [0] * (size + 1)
+        self._top = 1 << (size.bit_length() - 1)
+
+    def add(self: object, index: int, delta: int) -> None:
+        """Ajoute 'delta' à la case 'index'"""
+        index += 1
+        while index <= self.size:
+            self._tree[index] += delta
+            index += index & -index
+
+    def prefix(self: object, index: int) -> int:
+        """Somme des cases 0..index"""
+        total = 0
+        index += 1
+        while index > 0:
+            total += self._tree[index]
+            index -= index & -index
+        return total
+
+    def find(self: object, rank: int) -> int:
+        """Plus petite case dont la somme préfixe atteint 'rank' (>= 1)"""
+        position = 0
+        bit = self._top
+        while bit:
+            following = position + bit
+            if following <= self.size and self._tree[following] < rank:
+                position = following
+                rank -= self._tree[following]
+            bit >>= 1
+        return position
+
+
+class FleetStats:
+    """Niveaux du parc et devices hors service"""
+
+    def __init__(self: object) -> None:
+        """Initialisation de la classe"""
+        self._tree = FenwickTree(_STEPS + 1)
+        self._buckets: Mapping[str, int] = {}
+        self.dead: set = set()
+
+    def set(self: object, hw_id: str, bat_lev: float, dead: bool = False) -> None:
+        """Niveau du device (O(log n), rien si la case ne change pas)"""
+        if dead:
+            self._remove(hw_id)
+            self.dead.add(hw_id)
+            return
+        self.dead.discard(hw_id)
+        bucket = min(_STEPS, max(0, int(round(bat_lev * _STEPS / 100))))
+        old = self._buckets.get(hw_id)
+        if old == bucket:
+            return
+        if old is not None:
+            self._tree.add(old, -1)
+        self._tree.add(bucket, 1)
+        self._buckets[hw_id] = bucket
+
+    def discard(self: object, hw_id: str) -> None:
+        """Retire le device"""
+        self._remove(hw_id)
+        self.dead.discard(hw_id)
+
+    def quantile(self: object, ratio: float) -> Optional[float]:
+        """Niveau au quantile 'ratio' (0: minimum, 0.5: médiane), None si vide"""
+        if not self._buckets:
+            return None
+        rank = max(1, ceil(ratio * len(self._buckets)))
+        return self._tree.find(rank) * 100 / _STEPS
+
+    def count_below(self: object, bat_lev: float) -> int:
+        """Nombre de devices dont le niveau est inférieur ou égal à 'bat_lev'"""
+        return self._tree.prefix(min(_STEPS, int(round(bat_lev * _STEPS / 100))))
+
+    def summary(self: object, empty_level: float) -> Mapping[str, Optional[float]]:
+        """Minimum, 10e centile, médiane, nombre de devices vides et hors service"""
+        return {
+            'min': self.quantile(0),
+            'p10': self.quantile(0.1),
+            'median': self.quantile(0.5),
+            'empty': self.count_below(empty_level),
+            'dead': len(self.dead)
+        }
+
+    def _remove(self: object, hw_id: str) -> None:
+        """Retire le niveau du device de l'arbre"""
+        bucket = self._buckets.pop(hw_id, None)
+        if bucket is not None:
+            self._tree.add(bucket, -1)
+
+    def __len__(self: object) -> int:
+        """Nombre de devices en service"""
+        return len(self._buckets)
+
+    def __str__(self: object) -> str:
+        """Wrapper pour str()"""
+        return '<FleetStats>{} devices - {} dead'.format(len(self._buckets), len(self.dead))
+
+    def __repr__(self: object) -> str:
+        """Wrapper pour repr()"""
+        return str(self)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Enregistreur de vol: derniers évènements du plugin, en mémoire
+
+Un anneau préalloué garde les derniers évènements sous forme de tuples
+(epoch, type, valeurs...): requète envoyée ou reçue, latence, profondeur de
+file, transitions de l'état du plan, erreurs. L'enregistrement ne fait
+qu'une affectation dans une liste; il reste actif en permanence. L'anneau
+est écrit dans un fichier sur erreur, sur blocage ou à la demande.
+"""
+
+# standard libs
+import os
+from datetime import datetime
+from time import strftime, time
+from typing import List, Optional, Tuple
+
+
+class FlightRecorder:
+    """Anneau des derniers évènements"""
+    SENT = 'sent'
+    RECEIVED = 'recv'
+    PLAN = 'plan'
+    ERROR = 'error'
+    _ring: List[Optional[tuple]] = []
+    _size = 0
+    _next = 0
+    _folder = ''
+    _min_interval = 60.0
+    _last_dump = 0.0
+
+    @classmethod
+    def setup(cls: object, folder: str, size: int = 2048) -> None:
+        """Allocation de l'anneau ('size' évènements; 0: désactivé)"""
+        cls._folder = folder
+        cls._size = max(0, size)
+        cls._ring = [None] * cls._size
+        cls._next = 0
+
+    @classmethod
+    def record(cls: object, *event: tuple) -> None:
+        """Enregistre un évènement: (type, valeurs...)"""
+        if cls._size:
+            cls._ring[cls._next] = (time(),) + event
+            cls._next = (cls._next + 1) % cls._size
+
+    @classmethod
+    def events(cls: object) -> List[tuple]:
+        """Evènements enregistrés, du plus ancien au plus récent"""
+        return [event for event in cls._ring[cls._next:] + cls._ring[:cls._next] if event is not None]
+
+    @classmethod
+    def dump(cls: object, reason: str, force: bool = False) -> Optional[str]:
+        """Ecrit l'anneau dans 'flight-<date>-<ms>.txt' (au plus une fois par minute, sauf 'force')
+
+        Returns:
+
+            - str: chemin du fichier, ou None si rien n'a été écrit
+        """
+        now = time()
+        if not cls._size or (not force and now - cls._last_dump < cls._min_interval):
+            return None
+        cls._last_dump = now
+        path = os.path.join(cls._folder, 'flight-{}-{:03d}.txt'.format(
+            strftime('%Y%m%d-%H%M%S'),
+            int(now * 1000) % 1000
+        ))
+        with open(path, 'w', encoding='utf-8') as flight_file:
+            flight_file.write('# {}\n'.format(reason))
+            for event in cls.events():
+                flight_file.write('{}\t{}\n'.format(
+                    datetime.fromtimestamp(event[0]).isoformat(timespec='milliseconds'),
+                    '\t'.join(str(value) for value in event[1:])
+                ))
+        return path
+
+    @classmethod
+    def __len__(cls: object) -> int:
+        """Nombre d'évènements enregistrés"""
+        return sum(1 for event in cls._ring if event is not None)
+
+    @classmethod
+    def __str__(cls: object) -> str:
+        """Wrapper pour str()"""
+        return '<FlightRecorder>{} slots'.format(cls._size)
+
+    @classmethod
+    def __repr__(cls: object) -> str:
+        """Wrapper pour repr()"""
+        return str(cls)
+
+
+def plan_flags(status: int) -> Tuple[str, ...]:
+    """Drapeaux lisibles de l'état du plan"""
+    names = ('GET_PLANS', 'ADD_PLAN', 'GET_PLAN_DEVICES', 'MOVE_PLAN_DEVICE')
+    return tuple(name for bit, name in enumerate(names) if status & (1 << bit))
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Régulation des requètes sortantes selon la latence (AIMD)"""
+
+# standard libs
+from collections import deque
+from typing import Deque, Optional, Tuple
+
+
+class Governor:
+    """Fenêtre de requètes en vol, réglée sur le temps de réponse
+
+    Chaque réponse mesure le temps aller-retour de sa requète (les réponses
+    HTTP arrivent dans l'ordre des envois). Sous la latence cible, la fenêtre
+    croît d'une requète par aller-retour (1 / fenêtre par réponse); au-delà,
+    elle est divisée par deux. Au-dessus de la latence de délestage, le
+    travail non essentiel (tri des widgets, notifications) est suspendu
+    jusqu'au retour sous la latence cible.
+    """
+    _alpha = 0.3
+
+    def __init__(
+            self: object,
+            target_latency: float = 0.5,
+            shed_latency: float = 2.0,
+            max_window: float = 8.0,
+            lost_after: float = 30.0) -> None:
+        """Initialisation de la classe
+
+        Args:
+
+            - target_latency (float): latence (s) sous laquelle la fenêtre croît
+            - shed_latency (float): latence moyenne (s) déclenchant le délestage
+            - max_window (float): nombre maximal de requètes en vol
+            - lost_after (float): délai (s) au-delà duquel une requète est perdue
+        """
+        self.target_latency = target_latency
+        self.shed_latency = shed_latency
+        self.max_window = max_window
+        self.lost_after = lost_after
+        self.window = 1.0
+        self.latency: Optional[float] = None
+        self.last_rtt: Optional[float] = None
+        self.shedding = False
+        self._in_flight: Deque[Tuple[float, dict]] = deque()
+
+    def can_send(self: object) -> bool:
+        """True si une requète de plus peut partir"""
+        return len(self._in_flight) < int(self.window)
+
+    def sent(self: object, request: dict, now: float) -> None:
+        """Enregistre l'envoi d'une requète"""
+        self._in_flight.append((now, request))
+
+    def received(self: object, now: float) -> Optional[dict]:
+        """Enregistre une réponse; renvoie la requète correspondante"""
+        if not self._in_flight:
+            return None
+        sent, request = self._in_flight.popleft()
+        self.last_rtt = now - sent
+        if self.latency is None:
+            self.latency = self.last_rtt
+        else:
+            self.latency += self._alpha * (self.last_rtt - self.latency)
+        if self.last_rtt <= self.target_latency:
+            self.window = min(self.window + 1 / self.window, self.max_window)
+        else:
+            self._decrease()
+        if self.latency > self.shed_latency:
+            self.shedding = True
+        elif self.latency <= self.target_latency:
+            self.shedding = False
+        return request
+
+    def expire(self: object, now: float) -> int:
+        """Oublie les requètes sans réponse depuis trop longtemps
+
+        Returns:
+
+            - int: nombre de requètes perdues
+        """
+        lost = 0
+        while self._in_flight and self._in_flight[0][0] + self.lost_after < now:
+            self._in_flight.popleft()
+            lost += 1
+        if lost:
+            self._decrease()
+            self.shedding = True
+        return lost
+
+    def reset(self: object) -> None:
+        """Connexion perdue: plus aucune requète en vol"""
+        self._in_flight.clear()
+
+    def in_flight(self: object) -> int:
+        """Nombre de requètes en vol"""
+        return len(self._in_flight)
+
+    def _decrease(self: object) -> None:
+        """Diminution multiplicative de la fenêtre"""
+        self.window = max(self.window / 2, 1.0)
+
+    def __str__(self: object) -> str:
+        """Wrapper pour str()"""
+        return '<Governor>window: {:.2f} - in flight: {} - latency: {} - shedding: {}'.format(
+            self.window,
+            len(self._in_flight),
+            'n/a' if self.latency is None else '{:.3f}s'.format(self.latency),
+            self.shedding
+        )
+
+    def __repr__(self: object) -> str:
+        """Wrapper pour repr()"""
+        return str(self)
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Historique des niveaux de batterie
+
+Chaque device dispose d'un fichier anneau à enregistrements fixes, projeté
+en mémoire (mmap). Un échantillon est un triplet (epoch, brut, lissé):
+
+    - en-tête (32 octets): magic, version, capacité, nombre, tête d'écriture
+    - enregistrements (16 octets): epoch (double), brut (float), lissé (float)
+
+L'écriture est en O(1) et aucun objet Python n'est conservé par échantillon.
+`HistoryReader` lit un fichier sans le créer ni le modifier, y compris
+pendant que le plugin l'écrit.
+"""
+
+# standard libs
+import mmap
+import os
+import re
+import struct
+from time import time
+from typing import Iterator, List, Mapping, Optional, Tuple
+
+# local libs
+from battery_level.core import LOGGER
+
+_MAGIC = b'BLHIST'
+_VERSION = 1
+_HEADER = struct.Struct('<6sHIII12x')
+_COUNTERS = struct.Struct('<II')
+_COUNTERS_OFFSET = 12
+_RECORD = struct.Struct('<dff')
+
+
+class _RingView:
+    """Lecture chronologique d'un fichier anneau projeté en mémoire"""
+    path = ''
+    capacity = 0
+    _map: Optional[mmap.mmap] = None
+
+    def _counters(self: object) -> Tuple[int, int]:
+        """Nombre d'échantillons et tête d'écriture, lus dans l'en-tête projeté
+
+        L'écrivain les y met à jour à chaque ajout: un lecteur suit ainsi un
+        fichier en cours d'écriture.
+        """
+        return _COUNTERS.unpack_from(self._map, _COUNTERS_OFFSET)
+
+    @staticmethod
+    def _check(path: str, magic: bytes, version: int, capacity: int) -> None:
+        """Contrôle de l'en-tête"""
+        if magic != _MAGIC or version != _VERSION or not capacity:
+            raise ValueError('Fichier historique invalide: {}'.format(path))
+
+    def _record(self: object, index: int, count: int, head: int) -> Tuple[float, float, float]:
+        """Échantillon à l'index chronologique 'index'"""
+        slot = (head - count + index) % self.capacity
+        return _RECORD.unpack_from(self._map, _HEADER.size + slot * _RECORD.size)
+
+    def _bisect(self: object, epoch: float, count: int, head: int) -> int:
+        """Premier index chronologique dont l'epoch est >= 'epoch'"""
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if self._record(middle, count, head)[0] < epoch:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def range(
+            self: object,
+            start: Optional[float] = None,
+            end: Optional[float] = None) -> Iterator[Tuple[float, float, float]]:
+        """Échantillons tels que start <= epoch < end, dans l'ordre chronologique"""
+        count, head = self._counters()
+        index = 0 if start is None else self._bisect(start, count, head)
+        stop = count if end is None else self._bisect(end, count, head)
+        for position in range(index, stop):
+            yield self._record(position, count, head)
+
+    def downsample(
+            self: object,
+            step: float,
+            start: Optional[float] = None,
+            end: Optional[float] = None) -> List[Tuple[float, float, float]]:
+        """Moyennes (brut, lissé) par tranche de 'step' secondes
+
+        Returns:
+
+            - list: (début de tranche, moyenne brute, moyenne lissée)
+        """
+        buckets = []
+        bucket = None
+        total_raw = total_smoothed = 0.0
+        count = 0
+        for epoch, raw, smoothed in self.range(start, end):
+            current = epoch - epoch % step
+            if current != bucket:
+                if count:
+                    buckets.append((bucket, total_raw / count, total_smoothed / count))
+                bucket = current
+                total_raw = total_smoothed = 0.0
+                count = 0
+            total_raw += raw
+            total_smoothed += smoothed
+            count += 1
+        if count:
+            buckets.append((bucket, total_raw / count, total_smoothed / count))
+        return buckets
+
+    def close(self: object) -> None:
+        """Fermeture du fichier"""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def __len__(self: object) -> int:
+        """Nombre d'échantillons enregistrés"""
+        return self._counters()[0]
+
+    def __str__(self: object) -> str:
+        """Wrapper pour str()"""
+        return '<{}>{}: {}/{}'.format(type(self).__name__, self.path, len(self), self.capacity)
+
+    def __repr__(self: object) -> str:
+        """Wrapper pour repr()"""
+        return str(self)
+
+
+class HistoryRing(_RingView):
+    """Fichier anneau d'un device (écriture, plugin)"""
+
+    def __init__(self: object, path: str, capacity: int = 105120) -> None:
+        """Ouverture (ou création) du fichier
+
+        Le descripteur du fichier est fermé une fois la projection faite:
+        seul celui de la projection reste ouvert.
+
+        Args:
+
+            - path (str): chemin du fichier
+            - capacity (int): nombre d'échantillons (ignoré si le fichier existe)
+        """
+        self.path = path
+        exists = os.path.isfile(path) and os.path.getsize(path) >= _HEADER.size
+        with open(path, 'r+b' if exists else 'w+b') as ring_file:
+            if exists:
+                magic, version, capacity, self._count, self._head = _HEADER.unpack(
+                    ring_file.read(_HEADER.size)
+                )
+                self._check(path, magic, version, capacity)
+            else:
+                self._count = self._head = 0
+                ring_file.write(_HEADER.pack(_MAGIC, _VERSION, capacity, 0, 0))
+            self.capacity = capacity
+            ring_file.truncate(_HEADER.size + capacity * _RECORD.size)
+            self._map = mmap.mmap(ring_file.fileno(), 0)
+
+    def append(self: object, epoch: float, raw: float, smoothed: float) -> None:
+        """Ajoute un échantillon (O(1))"""
+        _RECORD.pack_into(
+            self._map,
+            _HEADER.size + self._head * _RECORD.size,
+            epoch,
+            raw,
+            smoothed
+        )
+        self._head = (self._head + 1) % self.capacity
+        if self._count < self.capacity:
+            self._count += 1
+        _COUNTERS.pack_into(self._map, _COUNTERS_OFFSET, self._count, self._head)
+
+    def close(self: object) -> None:
+        """Fermeture du fichier"""
+        if self._map is not None:
+            self._map.flush()
+        super().close()
+
+
+class HistoryReader(_RingView):
+    """Fichier anneau en lecture seule (outils, scripts)
+
+    Le fichier n'est jamais créé ni modifié; l'en-tête est relu à chaque
+    lecture pour suivre un fichier que le plugin est en train d'écrire.
+    """
+
+    def __init__(self: object, path: str) -> None:
+        """Ouverture du fichier"""
+        self.path = path
+        with open(path, 'rb') as ring_file:
+            self._map = mmap.mmap(ring_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(self._map) < _HEADER.size:
+                raise ValueError('Fichier historique invalide: {}'.format(path))
+            magic, version, self.capacity, _, _ = _HEADER.unpack_from(self._map)
+            self._check(path, magic, version, self.capacity)
+        except ValueError:
+            self.close()
+            raise
+
+    def __enter__(self: object) -> object:
+        """Wrapper pour with"""
+        return self
+
+    def __exit__(self: object, *_args: tuple) -> None:
+        """Wrapper pour with"""
+        self.close()
+
+
+class History:
+    """Collection des historiques, un fichier anneau par device"""
+    folder = ''
+    size = 0
+    _rings: Mapping[str, HistoryRing] = {}
+
+    @classmethod
+    def setup(cls: object, folder: str, size: int) -> None:
+        """Paramétrage; size == 0 désactive l'historique"""
+        cls.close()
+        cls.folder = folder
+        cls.size = size
+        if cls.size:
+            os.makedirs(cls.folder, exist_ok=True)
+
+    @classmethod
+    def path(cls: object, hw_id: str) -> str:
+        """Chemin du fichier historique du device"""
+        return os.path.join(cls.folder, '{}.hist'.format(re.sub(r'[^\w-]', '_', hw_id)))
+
+    @classmethod
+    def ring(cls: object, hw_id: str) -> Optional[HistoryRing]:
+        """Fichier anneau du device (ouverture à la demande)"""
+        if not cls.size or not hw_id:
+            return None
+        if hw_id not in cls._rings:
+            path = cls.path(hw_id)
+            try:
+                cls._rings[hw_id] = HistoryRing(path, cls.size)
+            except ValueError as exc:
+                # fichier corrompu ou d'une autre version: recréé, l'interrogation continue
+                LOGGER.error('%s: fichier recréé', exc)
+                os.remove(path)
+                cls._rings[hw_id] = HistoryRing(path, cls.size)
+        return cls._rings[hw_id]
+
+    @classmethod
+    def append(
+            cls: object,
+            hw_id: str,
+            raw: float,
+            smoothed: float,
+            epoch: Optional[float] = None) -> None:
+        """Ajoute un échantillon à l'historique du device"""
+        ring = cls.ring(hw_id)
+        if ring is not None:
+            ring.append(time() if epoch is None else epoch, raw, smoothed)
+
+    @classmethod
+    def close(cls: object) -> None:
+        """Fermeture de tous les fichiers"""
+        for ring in cls._rings.values():
+            ring.close()
+        cls._rings.clear()
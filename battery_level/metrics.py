@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Métriques du parc et du plugin, format d'exposition texte (Prometheus)"""
+
+# standard libs
+from typing import List, Mapping, Optional, Tuple
+
+
+class Metrics:
+    """Collection des métriques
+
+    Chaque série garde sa ligne de texte, reconstruite seulement quand sa
+    valeur change; chaque famille garde son bloc, reconstruit seulement
+    quand une de ses séries a changé. Une collecte ne fait que joindre les
+    blocs en cache.
+    """
+    _families: Mapping[str, Tuple[str, str]] = {
+        'battery_level_percent': ('gauge', 'Smoothed battery level (%)'),
+        'battery_level_band': ('gauge', 'Level band, 0 (dead) to 4 (full)'),
+        'battery_level_last_update_timestamp_seconds': ('gauge', 'Last report of the device (epoch)'),
+        'battery_level_dead': ('gauge', '1 if the device missed its report deadline'),
+        'battery_level_device_info': ('gauge', 'Device name, by hw_id'),
+        'battery_level_requests_queue_depth': ('gauge', 'Requests waiting to be sent'),
+        'battery_level_requests_in_flight': ('gauge', 'Requests sent and waiting for a response'),
+        'battery_level_request_latency_seconds': ('gauge', 'Average request round trip time'),
+        'battery_level_poll_duration_seconds': ('gauge', 'Last poll duration, request to devices update'),
+        'battery_level_bytes_parsed_total': ('counter', 'Bytes of API responses parsed'),
+        'battery_level_plan_moves_total': ('counter', 'Plan widget moves issued'),
+    }
+    _values: Mapping[str, Mapping[str, float]] = {}
+    _lines: Mapping[str, Mapping[str, str]] = {}
+    _blocks: Mapping[str, str] = {}
+    _dirty: set = set()
+    _body: Optional[str] = None
+
+    @classmethod
+    def set(cls: object, metric: str, value: float, **labels: dict) -> None:
+        """Valeur d'une série (ne fait rien si elle n'a pas changé)"""
+        key = cls._labels(labels)
+        series = cls._values.setdefault(metric, {})
+        if series.get(key) == value:
+            return
+        series[key] = value
+        cls._lines.setdefault(metric, {})[key] = '{}{} {}'.format(metric, key, cls._number(value))
+        cls._dirty.add(metric)
+        cls._body = None
+
+    @classmethod
+    def inc(cls: object, metric: str, amount: float = 1, **labels: dict) -> None:
+        """Incrémente une série (compteur)"""
+        cls.set(metric, cls._values.get(metric, {}).get(cls._labels(labels), 0) + amount, **labels)
+
+    @classmethod
+    def remove(cls: object, metric: str, **labels: dict) -> None:
+        """Retire une série"""
+        key = cls._labels(labels)
+        if key in cls._values.get(metric, {}):
+            del cls._values[metric][key]
+            del cls._lines[metric][key]
+            cls._dirty.add(metric)
+            cls._body = None
+
+    @classmethod
+    def render(cls: object) -> str:
+        """Texte d'exposition"""
+        if cls._body is None:
+            for name in cls._dirty:
+                metric_type, description = cls._families.get(name, ('untyped', name))
+                lines: List[str] = [
+                    '# HELP {} {}'.format(name, description),
+                    '# TYPE {} {}'.format(name, metric_type)
+                ]
+                lines.extend(cls._lines[name].values())
+                cls._blocks[name] = '\n'.join(lines) if cls._lines[name] else ''
+            cls._dirty.clear()
+            cls._body = ''.join(
+                '{}\n'.format(block) for block in cls._blocks.values() if block
+            )
+        return cls._body
+
+    @staticmethod
+    def _labels(labels: Mapping[str, str]) -> str:
+        """Etiquettes au format d'exposition"""
+        if not labels:
+            return ''
+        return '{{{}}}'.format(','.join(
+            '{}="{}"'.format(
+                key,
+                str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+            )
+            for key, value in sorted(labels.items())
+        ))
+
+    @staticmethod
+    def _number(value: float) -> str:
+        """Valeur au format d'exposition"""
+        if isinstance(value, bool):
+            return '1' if value else '0'
+        return repr(float(value)) if isinstance(value, float) else str(value)
+
+    @classmethod
+    def __str__(cls: object) -> str:
+        """Wrapper pour str()"""
+        return '<Metrics>{} series'.format(sum(len(series) for series in cls._values.values()))
+
+    @classmethod
+    def __repr__(cls: object) -> str:
+        """Wrapper pour repr()"""
+        return str(cls)
@@ -3,8 +3,9 @@
 """Gestion du plan"""
 
 # standards libs
+from bisect import bisect_left, bisect_right
 from operator import attrgetter
-from typing import List, Mapping
+from typing import List, Mapping, Optional, Tuple
 
 # Domoticz lib
 import Domoticz
@@ -12,14 +13,17 @@ import Domoticz
 # local libs
 from battery_level.common import debug
 from battery_level.devices import Devices
+from battery_level.metrics import Metrics
 from battery_level.plugin_config import PluginConfig
 from battery_level.requests import Requests
+from battery_level.sources import Sources
 
 
 class _OrderedListItem:
     """Elément de la liste ordonnée"""
+    __slots__ = ('devidx', 'name', 'bat_lev')
 
-    def __init__(self: object, devidx: int, name: str, bat_lev: int) -> None:
+    def __init__(self: object, devidx: int, name: str, bat_lev: float) -> None:
         """Initialisation de la classe"""
         self.devidx = devidx
         self.name = name
@@ -39,9 +43,18 @@ class _OrderedListItem:
 
 
 class _OrderedDevices:
-    """Collection ordonnée des devices"""
+    """Collection ordonnée des devices
+
+    Index persistant: les éléments sont gardés par ordre croissant (niveau,
+    nom) avec leurs clés; seuls les devices dont le niveau ou le nom a
+    changé (`Devices.plan_changes`) sont repositionnés, par dichotomie.
+    `ordered_list` est l'ordre d'affichage (inversé pour le tri décroissant).
+    """
     ordered_list: List[_OrderedListItem] = []
+    _items: List[_OrderedListItem] = []
+    _keys: List[Tuple[float, str]] = []
     _device_dict: Mapping[int, _OrderedListItem] = {}
+    _hw_ids: Mapping[str, int] = {}
 
     def __new__(cls: object) -> object:
         """Initialisation de la classe"""
@@ -50,25 +63,99 @@ class _OrderedDevices:
 
     @classmethod
     def init_devices(cls: object) -> None:
-        """Remplissage des listes"""
-        for device in Devices():
-            cls._update(device.ID, device.Name, float(device.sValue))
+        """Construction complète de l'index"""
+        cls._device_dict = {}
+        cls._hw_ids = {}
+        for hw_id, devidx, name, bat_lev in Devices.plan_entries():
+            cls._device_dict[devidx] = _OrderedListItem(devidx, name, bat_lev)
+            cls._hw_ids[hw_id] = devidx
         cls._sort()
 
+    @classmethod
+    def sync(cls: object) -> Optional[Tuple[int, int]]:
+        """Repositionne les devices dont le niveau ou le nom a changé
+
+        Returns:
+
+            - tuple: (première, dernière) positions modifiées dans l'ordre
+                d'affichage, ou None si l'ordre est inchangé
+        """
+        low = high = None
+        for hw_id, devidx, name, bat_lev in Devices.plan_changes():
+            span = cls._sync_item(hw_id, devidx, name, bat_lev)
+            if span is not None:
+                low = span[0] if low is None else min(low, span[0])
+                high = span[1] if high is None else max(high, span[1])
+        if low is None:
+            return None
+        cls._set_view()
+        if not cls._items:
+            return None
+        return min(low, len(cls._items) - 1), min(high, len(cls._items) - 1)
+
     @classmethod
     def values(cls: object) -> List[_OrderedListItem]:
         """Wrapper pour for ... in ... loop"""
         return cls.ordered_list
 
     @classmethod
-    def _update(cls: object, devidx: int, name: str, bat_lev: int, sort: bool = False) -> None:
-        """Ajoute un device"""
-        # mise à jour du dictionnaire des devices
-        cls._device_dict.update({
-            devidx: _OrderedListItem(devidx, name, bat_lev)
-        })
-        if sort:
-            cls._sort()
+    def _sync_item(
+            cls: object,
+            hw_id: str,
+            devidx: Optional[int],
+            name: str,
+            bat_lev: float) -> Optional[Tuple[int, int]]:
+        """Ajout, déplacement ou retrait d'un élément
+
+        Returns:
+
+            - tuple: (première, dernière) positions modifiées dans l'ordre
+                d'affichage, ou None
+        """
+        old_devidx = cls._hw_ids.get(hw_id)
+        item = None if old_devidx is None else cls._device_dict.get(old_devidx)
+        if item is not None and old_devidx == devidx:
+            if (item.bat_lev, item.name) == (bat_lev, name):
+                return None
+            old = cls._display(cls._take(item), 1)
+            item.bat_lev, item.name = bat_lev, name
+            new = cls._display(cls._place(item))
+            return min(old, new), max(old, new)
+        # device ajouté, supprimé, ou recréé sous un autre idx
+        positions = []
+        if item is not None:
+            positions.append(cls._display(cls._take(item), 1))
+            del cls._device_dict[old_devidx]
+            del cls._hw_ids[hw_id]
+        if devidx is not None:
+            item = _OrderedListItem(devidx, name, bat_lev)
+            cls._device_dict[devidx] = item
+            cls._hw_ids[hw_id] = devidx
+            positions.append(cls._display(cls._place(item)))
+        if not positions:
+            return None
+        # les éléments affichés après sont décalés
+        return min(positions), len(cls._items)
+
+    @classmethod
+    def _take(cls: object, item: _OrderedListItem) -> int:
+        """Retire l'élément de la liste; renvoie son ancienne position croissante"""
+        key = (item.bat_lev, item.name)
+        old = bisect_left(cls._keys, key)
+        while cls._items[old] is not item:
+            old += 1
+        del cls._items[old]
+        del cls._keys[old]
+        return old
+
+    @classmethod
+    def _place(cls: object, item: _OrderedListItem) -> int:
+        """Insère l'élément à sa place; renvoie sa position croissante"""
+        key = (item.bat_lev, item.name)
+        new = bisect_right(cls._keys, key)
+        cls._items.insert(new, item)
+        cls._keys.insert(new, key)
+        return new
 
     @classmethod
     def _sort(cls: object) -> None:
@@ -76,14 +163,42 @@ class _OrderedDevices:
 
         tri par niveau de batterie puis nom
         """
-        reverse = False
+        cls._items = sorted(cls._device_dict.values(), key=attrgetter('bat_lev', 'name'))
+        cls._keys = [(item.bat_lev, item.name) for item in cls._items]
+        cls._set_view()
+
+    @classmethod
+    def _set_view(cls: object) -> None:
+        """Ordre d'affichage selon le sens du tri"""
+        cls.ordered_list = cls._items[::-1] if PluginConfig.sort_descending else cls._items
+
+    @classmethod
+    def _display(cls: object, position: int, removed: int = 0) -> int:
+        """Position croissante -> position dans l'ordre d'affichage
+
+        'removed': éléments retirés depuis que la position a été lue
+        """
         if PluginConfig.sort_descending:
-            reverse = True
-        cls.ordered_list = sorted(
-            cls._device_dict.values(),
-            key=attrgetter('bat_lev', 'name'),
-            reverse=reverse
-        )
+            return len(cls._items) + removed - 1 - position
+        return position
+
+    @classmethod
+    def reposition(cls: object, devidx: int, name: str) -> Optional[Tuple[int, int]]:
+        """Nouveau nom d'un device: seul son élément est déplacé (dichotomie)
+
+        Returns:
+
+            - tuple: (ancienne, nouvelle) position dans l'ordre d'affichage,
+                ou None si le device n'est pas dans la liste
+        """
+        item = cls._device_dict.get(devidx)
+        if item is None:
+            return None
+        old = cls._display(cls._take(item), 1)
+        item.name = name
+        new = cls._display(cls._place(item))
+        cls._set_view()
+        return old, new
 
     @classmethod
     def __getitem__(cls: object, key: int) -> _OrderedListItem:
@@ -109,6 +224,11 @@ class Plans:
     GET_PLAN_DEVICES = 0x4
     MOVE_PLAN_DEVICE = 0x8
     _plan_devices_set = set()
+    # ligne du plan (idx de changeplandeviceorder) par device
+    _plan_rows: Mapping[int, str] = {}
+    # plan trié au dernier passage; seules les positions de '_span' sont alors à revoir
+    _plan_sorted = False
+    _span: Optional[Tuple[int, int]] = None
     urls = {
         "plans": "/json.htm?type=plans",
         "getplandevices": "/json.htm?idx={}&param=getplandevices&type=command",
@@ -153,6 +273,34 @@ class Plans:
             cls._status |= cls.GET_PLANS
             Requests.add("GET", cls.urls.get("plans"))
 
+    @classmethod
+    def status(cls: object) -> int:
+        """Etat courant (drapeaux GET_PLANS, ADD_PLAN, GET_PLAN_DEVICES, MOVE_PLAN_DEVICE)"""
+        return cls._status
+
+    @classmethod
+    def retarget(cls: object) -> None:
+        """Nouveau nom de plan: oubli du plan courant puis recherche (ou création) du nouveau"""
+        if cls._status & cls.MOVE_PLAN_DEVICE:
+            Domoticz.Heartbeat(10)
+        cls._plan_id = 0
+        cls._status = cls.INIT_PLANS
+        cls._plan_devices_set = set()
+        cls._plan_sorted = False
+        Domoticz.Configuration({})
+        if PluginConfig.create_plan:
+            cls._init_plan()
+
+    @classmethod
+    def resort(cls: object) -> None:
+        """Nouveau sens de tri: relance la vérification du plan"""
+        cls._plan_sorted = False
+        if not PluginConfig.sort_plan:
+            cls._suspend_sort()
+        elif cls._plan_id:
+            _OrderedDevices._set_view()  # pylint:disable=protected-access
+            cls.update(True)
+
     @classmethod
     def update(cls: object, force: bool = False) -> None:
         """Appel de mise à jour
@@ -192,9 +340,12 @@ class Plans:
     def check_plans_devices(cls: object, datas: list) -> None:
         """Reçoit la liste des devices dans le plan"""
         has_to_be_updated = False
-        # enregistrement local du plan des devices
-        for data in datas:
-            cls._plan_devices_set.add(int(data['devidx']))
+        # enregistrement local du plan des devices (les devices supprimés en sortent)
+        plan_devices_set = {int(data['devidx']) for data in datas}
+        if plan_devices_set != cls._plan_devices_set:
+            cls._plan_sorted = False
+        cls._plan_devices_set = plan_devices_set
+        cls._plan_rows = {int(data['devidx']): data['idx'] for data in datas}
         # Vérification présence device dans le plan
         for device in Devices():
             devidx = device.ID
@@ -211,50 +362,83 @@ class Plans:
         # si besoin, lancement d'une vérification du plan
         if has_to_be_updated:
             cls.update(True)
+        # Domoticz surchargé: le tri attendra
+        elif PluginConfig.sort_plan and Sources.shedding():
+            cls._suspend_sort()
         # sinon on commence le tri
         elif PluginConfig.sort_plan:
             if not cls._status & cls.MOVE_PLAN_DEVICE:
-                _OrderedDevices.init_devices()
+                cls._widen(_OrderedDevices.sync())
                 debug('Ordered list', *_OrderedDevices.ordered_list)
             cls._order_plan_devices(datas)
 
+    @classmethod
+    def device_modified(cls: object, devidx: int, name: str) -> None:
+        """Device renommé: repositionnement et seuls déplacements nécessaires dans le plan"""
+        positions = _OrderedDevices.reposition(devidx, name)
+        if positions is None or positions[0] == positions[1]:
+            return
+        # tri en cours ou impossible, plan pas encore vu trié (déplacements
+        # en vol, positions à revoir): le prochain cycle de tri s'en charge
+        if (
+                not PluginConfig.sort_plan
+                or not cls._plan_sorted
+                or cls._span is not None
+                or cls._status & cls.MOVE_PLAN_DEVICE
+                or devidx not in cls._plan_rows
+                or Sources.shedding()
+        ):
+            cls._widen((min(positions), max(positions)))
+            return
+        old, new = positions
+        for _ in range(abs(new - old)):
+            cls._move(cls._plan_rows[devidx], new > old)
+        # plan vérifié au prochain cycle de tri, une fois les déplacements faits
+        cls._widen((min(positions), max(positions)))
+
+    @classmethod
+    def _move(cls: object, plan_row: str, down: bool) -> None:
+        """Déplace une ligne du plan d'un cran"""
+        # vers le haut: way = 0
+        # /json.htm?idx=117&param=changeplandeviceorder&planid=13&type=command&way=0
+        # vers le bas: way = 1
+        # /json.htm?idx=117&param=changeplandeviceorder&planid=13&type=command&way=1
+        Metrics.inc('battery_level_plan_moves_total')
+        Requests.add(
+            'GET',
+            ''.join(cls.urls['changeplandeviceorder']).format(
+                plan_row,
+                cls._plan_id,
+                1 if down else 0
+            )
+        )
+
     @classmethod
     def _order_plan_devices(cls: object, datas: List[Mapping[str, str]]) -> None:
         """Tri des devices dans le plan"""
         def move_down(down: bool, plan_device: Mapping[str, str]) -> None:
             """bouge l'emplacement du device dans la plan"""
-            # vers le haut: way = 0
-            # /json.htm?idx=117&param=changeplandeviceorder&planid=13&type=command&way=0
-            # vers le bas: way = 1
-            # /json.htm?idx=117&param=changeplandeviceorder&planid=13&type=command&way=1
             if not cls._status & cls.MOVE_PLAN_DEVICE:
                 cls._status |= cls.MOVE_PLAN_DEVICE
                 Domoticz.Status('Début de tri des widgets')
                 Domoticz.Heartbeat(1)
-            way = 1 if down else 0
-            Requests.add(
-                'GET',
-                ''.join(cls.urls['changeplandeviceorder']).format(
-                    plan_device['idx'],
-                    cls._plan_id,
-                    way
-                )
-            )
+            cls._move(plan_device['idx'], down)
             cls.update(True)
 
-        order_index = 0
-        for item in _OrderedDevices.values():
-            plan_index = 0
-            for plan_device in datas:
-                if item.devidx == int(plan_device['devidx']):
-                    if order_index > plan_index:
-                        move_down(True, plan_device)
-                        return
-                    if order_index < plan_index:
-                        move_down(False, plan_device)
-                        return
-                plan_index += 1
-            order_index += 1
+        ordered = _OrderedDevices.values()
+        # comparaison O(n) à chaque appel: un déplacement manuel dans
+        # l'interface est repris; la recherche du déplacement seulement si écart
+        if [int(plan_device['devidx']) for plan_device in datas] == [item.devidx for item in ordered]:
+            move = None
+        else:
+            move = cls._find_move(ordered, datas, cls._span if cls._plan_sorted else None)
+            if move is None and cls._plan_sorted and cls._span is not None:
+                move = cls._find_move(ordered, datas)
+        if move is not None:
+            move_down(*move)
+            return
+        cls._plan_sorted = True
+        cls._span = None
         if cls._status & cls.MOVE_PLAN_DEVICE:
             cls._status ^= cls.MOVE_PLAN_DEVICE
             Domoticz.Heartbeat(10)
@@ -262,6 +446,65 @@ class Plans:
         # on autorise de nouveau la mise à jour cyclique
         cls._status ^= cls.GET_PLAN_DEVICES
 
+    @classmethod
+    def _widen(cls: object, span: Optional[Tuple[int, int]]) -> None:
+        """Ajoute des positions de l'ordre d'affichage à revoir dans le plan"""
+        if span is not None:
+            cls._span = span if cls._span is None else (min(cls._span[0], span[0]), max(cls._span[1], span[1]))
+
+    @classmethod
+    def _suspend_sort(cls: object) -> None:
+        """Suspend le tri des widgets, repris à une prochaine mise à jour"""
+        if cls._status & cls.MOVE_PLAN_DEVICE:
+            cls._status ^= cls.MOVE_PLAN_DEVICE
+            Domoticz.Heartbeat(10)
+            Domoticz.Status('Tri des widgets suspendu (Domoticz surchargé)')
+        cls._status &= ~cls.GET_PLAN_DEVICES
+
+    @staticmethod
+    def _find_move(
+            ordered: List[_OrderedListItem],
+            datas: List[Mapping[str, str]],
+            span: Optional[Tuple[int, int]] = None) -> Optional[Tuple[bool, Mapping[str, str]]]:
+        """Premier device du plan qui n'est pas à sa place
+
+        Args:
+
+            - ordered (list): ordre d'affichage attendu
+            - datas (list): devices du plan, dans l'ordre du plan
+            - span (tuple): (première, dernière) positions à examiner; toutes par défaut
+
+        Returns:
+
+            - tuple: (vers le bas, device du plan) ou None si le plan est trié
+        """
+        def index(rows: range) -> Mapping[int, int]:
+            """Position dans le plan des devices des lignes 'rows'"""
+            indexes = {}
+            for plan_index in rows:
+                indexes.setdefault(int(datas[plan_index]['devidx']), plan_index)
+            return indexes
+
+        first, last = span if span is not None else (0, len(ordered) - 1)
+        first, last = max(0, first), min(last, len(ordered) - 1)
+        plan_indexes = None
+        for order_index in range(first, last + 1):
+            item = ordered[order_index]
+            if order_index < len(datas) and int(datas[order_index]['devidx']) == item.devidx:
+                continue
+            # index du plan construit au premier écart seulement; hors de
+            # 'span' le plan est en ordre: le device est d'abord cherché dans 'span'
+            if plan_indexes is None:
+                plan_indexes = index(range(first, min(last + 1, len(datas))) if span else range(len(datas)))
+            plan_index = plan_indexes.get(item.devidx)
+            if plan_index is None and span is not None:
+                plan_indexes = index(range(len(datas)))
+                span = None
+                plan_index = plan_indexes.get(item.devidx)
+            if plan_index is not None and plan_index != order_index:
+                return order_index > plan_index, datas[plan_index]
+        return None
+
     @classmethod
     def __str__(cls: object) -> str:
         """Wrapper pour str()"""
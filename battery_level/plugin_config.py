@@ -3,7 +3,7 @@
 """Domoticz plugin configuration"""
 
 # standard libs
-from typing import Optional
+from typing import List, Optional, Tuple
 
 # local libs
 from battery_level.common import debug
@@ -20,6 +20,51 @@ class PluginConfig:
     sort_plan = False
     plan_name = ''
     debug_level = 0
+    home_folder = ''
+    # sources: la première est toujours le Domoticz local
+    sources: List[Tuple[str, str]] = [('127.0.0.1', '8080')]
+    # options avancées (champ Username: 'clé=valeur;clé=valeur')
+    history_size = 0
+    worker_thread = False
+    dead_timeout = 30.0
+    db_path = ''
+    columnar = False
+    evict_cycles = 0
+    flight_size = 2048
+    full_period = 0.0
+    hot_margin = 0.0
+    hot_period = 30.0
+    ieee_types = ''
+    metrics_port = 0
+    profile_cycles = 3
+    snapshot = False
+    summary = False
+    trace = False
+    trace_anonymize = False
+    _options_keys = {
+        'metrics_port': 'metrics_port',
+        'columnar': 'columnar',
+        'db_path': 'db_path',
+        'dead_timeout': 'dead_timeout',
+        'evict_cycles': 'evict_cycles',
+        'flight_size': 'flight_size',
+        'full_period': 'full_period',
+        'hot_margin': 'hot_margin',
+        'hot_period': 'hot_period',
+        'history': 'history_size',
+        'ieee_types': 'ieee_types',
+        'profile_cycles': 'profile_cycles',
+        'snapshot': 'snapshot',
+        'summary': 'summary',
+        'trace': 'trace',
+        'trace_anonymize': 'trace_anonymize',
+        'worker': 'worker_thread',
+    }
+    _options_defaults = {}
+    _reloadable = (
+        'empty_level', 'use_every_devices', 'notify_all', 'create_plan',
+        'sort_ascending', 'sort_descending', 'sort_plan', 'plan_name', 'debug_level', 'sources'
+    )
     _parameters = {}
     _init_done = False
 
@@ -33,17 +78,31 @@ class PluginConfig:
             cls._mode4()
             cls._mode5()
             cls._mode6()
+            cls._options()
+            cls._sources()
+            cls.home_folder = cls._parameters.get('HomeFolder', cls.home_folder)
             cls._init_done = True
         return super(PluginConfig, cls).__new__(cls)
 
+    @classmethod
+    def reload(cls: object, parameters: dict) -> set:
+        """Nouvelle interprétation des paramètres
+
+        Returns:
+
+            - set: noms des réglages modifiés
+        """
+        attrs = cls._reloadable + tuple(cls._options_keys.values())
+        before = {attr: getattr(cls, attr) for attr in attrs}
+        cls(parameters)
+        return {attr for attr in attrs if getattr(cls, attr) != before[attr]}
+
     @classmethod
     def _mode1(cls: object) -> None:
         """Interprétation mode 1 (empty_level, level_delta)"""
         cls.empty_level = float(cls._parameters.get('Mode1', cls.empty_level))
-        # fix: incorrect empty level
-        try:
-            assert 0 < cls.empty_level < 1
-        except AssertionError:
+        # fix: empty level given as a ratio
+        if 0 < cls.empty_level < 1:
             cls.empty_level *= 100
         try:
             assert 3 <= cls.empty_level <= 97
@@ -73,6 +132,7 @@ class PluginConfig:
     def _mode5(cls: object) -> None:
         """Interprétation mode 5 (sort_ascending, sort_descending, sort_plan)"""
         mode5 = int(cls._parameters.get('Mode5', 1))
+        cls.sort_ascending = cls.sort_descending = False
         if mode5 == 1:
             cls.sort_ascending = True
         elif mode5 == 0:
@@ -84,17 +144,58 @@ class PluginConfig:
         """Interprétation mode 6 (debug_level)"""
         cls.debug_level = int(cls._parameters.get('Mode6', cls.debug_level))
 
+    @classmethod
+    def _sources(cls: object) -> None:
+        """Interprétation Port (local) et Address (sources distantes 'hôte:port,...')"""
+        cls.sources = [('127.0.0.1', str(cls._parameters.get('Port') or 8080))]
+        for address in cls._parameters.get('Address', '').split(','):
+            host, _, port = address.strip().partition(':')
+            if host:
+                cls.sources.append((host, port or '8080'))
+
+    @classmethod
+    def parameters(cls: object) -> dict:
+        """Paramètres bruts du plugin"""
+        return dict(cls._parameters or {})
+
+    @classmethod
+    def _options(cls: object) -> None:
+        """Interprétation des options avancées (champ Username)"""
+        # les options absentes reprennent leur valeur par défaut
+        if not cls._options_defaults:
+            cls._options_defaults = {attr: getattr(cls, attr) for attr in cls._options_keys.values()}
+        for attr, value in cls._options_defaults.items():
+            setattr(cls, attr, value)
+        for option in cls._parameters.get('Username', '').split(';'):
+            key, _, value = option.partition('=')
+            key = key.strip()
+            if not key:
+                continue
+            if key not in cls._options_keys:
+                debug('Option inconnue: {}'.format(key))
+                continue
+            attr = cls._options_keys[key]
+            attr_type = type(getattr(cls, attr))
+            try:
+                if attr_type is bool:
+                    setattr(cls, attr, bool(int(value)))
+                else:
+                    setattr(cls, attr, attr_type(value.strip()))
+            except ValueError:
+                debug('Mauvaise valeur pour l\'option {}: {}'.format(key, value))
+
     @classmethod
     def __str__(cls: object) -> str:
         """Wrapper pour str()"""
-        return '<PluginConfig>{}% - {} - {} - {} - {} - {} - {}'.format(
+        return '<PluginConfig>{}% - {} - {} - {} - {} - {} - {} - {}'.format(
             cls.empty_level,
             cls.use_every_devices,
             cls.notify_all,
             cls.create_plan,
             cls.sort_plan,
             cls.sort_ascending,
-            cls.sort_descending
+            cls.sort_descending,
+            cls.sources
         )
 
     @classmethod
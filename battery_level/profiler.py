@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Profilage à la demande des callbacks du plugin (cProfile et tracemalloc)"""
+
+# standard libs
+import cProfile
+import os
+import tracemalloc
+from time import strftime
+from typing import Callable, Optional, Tuple
+
+
+class Profiler:
+    """Profil CPU et allocations mémoire sur un nombre donné d'interrogations
+
+    Seul le thread du plugin est profilé par cProfile; tracemalloc suit les
+    allocations de tous les threads.
+    """
+
+    def __init__(self: object, top: int = 25) -> None:
+        """Initialisation de la classe
+
+        Args:
+
+            - top (int): nombre de sites d'allocation écrits
+        """
+        self.top = top
+        self.cycles_left = 0
+        self._profile: Optional[cProfile.Profile] = None
+
+    @property
+    def active(self: object) -> bool:
+        """True pendant un profilage"""
+        return self._profile is not None
+
+    def start(self: object, cycles: int) -> None:
+        """Début du profilage, pour 'cycles' interrogations"""
+        if self._profile is None:
+            self._profile = cProfile.Profile()
+            tracemalloc.start()
+        self.cycles_left = max(1, cycles)
+
+    def call(self: object, function: Callable[..., None], *args: tuple) -> None:
+        """Appel profilé de 'function'"""
+        self._profile.runcall(function, *args)
+
+    def cycle_done(self: object) -> bool:
+        """Fin d'une interrogation; True quand le profilage est terminé"""
+        if self._profile is None:
+            return False
+        self.cycles_left -= 1
+        return self.cycles_left <= 0
+
+    def stop(self: object, folder: str) -> Tuple[str, str]:
+        """Fin du profilage; écrit le profil (.prof) et les principaux sites d'allocation
+
+        Returns:
+
+            - tuple: (fichier du profil, fichier des allocations)
+        """
+        stem = os.path.join(folder, 'profile-{}'.format(strftime('%Y%m%d-%H%M%S')))
+        self._profile.dump_stats('{}.prof'.format(stem))
+        self._profile = None
+        # les allocations du profileur lui-même ne sont pas retenues
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, cProfile.__file__),
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        with open('{}-alloc.txt'.format(stem), 'w', encoding='utf-8') as alloc_file:
+            alloc_file.write('traced memory: {} bytes (peak: {} bytes)\n'.format(current, peak))
+            for statistic in snapshot.statistics('lineno')[:self.top]:
+                alloc_file.write('{}\n'.format(statistic))
+        return '{}.prof'.format(stem), '{}-alloc.txt'.format(stem)
+
+    def __str__(self: object) -> str:
+        """Wrapper pour str()"""
+        return '<Profiler>{}'.format(
+            '{} cycle(s) left'.format(self.cycles_left) if self.active else 'idle'
+        )
+
+    def __repr__(self: object) -> str:
+        """Wrapper pour repr()"""
+        return str(self)
@@ -40,6 +40,15 @@ class Requests(Sized):
         ))
         return cls._last_out_datas
 
+    @classmethod
+    def new_queue(cls: object, name: str) -> type:
+        """Crée une file indépendante, de même interface (une par source)"""
+        return type(name, (cls,), {
+            '_queue': deque(),
+            '_last_in_datas': {},
+            '_last_out_datas': {}
+        })
+
     @classmethod
     def last_in(cls: object) -> Optional[dict]:
         """Renvoie le dernier élément inséré"""
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Instantané du parc partagé avec les processus locaux
+
+État courant de chaque device (hw_id, nom, niveau lissé, bande, dernier
+rapport, hors service) publié après chaque interrogation dans un fichier
+projeté en mémoire, à double tampon; disposition et lecture: voir
+`battery_level.snapshot_reader`.
+
+Chaque device a un emplacement fixe; seuls les emplacements modifiés
+depuis la dernière écriture d'un tampon y sont réécrits. Au-delà de la
+capacité, un nouveau fichier deux fois plus grand remplace l'ancien, qui
+est marqué fermé.
+"""
+
+# standard libs
+import mmap
+import os
+from time import time
+from typing import List, Mapping, Optional, Tuple
+
+# local libs
+from battery_level.snapshot_reader import (
+    BUFFER_HEADER, CLOSED, HEADER, MAGIC, PUBLISHED, RECORD, SEQUENCE, VERSION, buffer_offset
+)
+
+_MIN_CAPACITY = 256
+
+
+def _encode(text: str, size: int) -> bytes:
+    """Texte UTF-8 tronqué à 'size' octets sans couper de caractère"""
+    return text.encode('utf-8')[:size].decode('utf-8', 'ignore').encode('utf-8')
+
+
+class Snapshot:
+    """Écriture de l'instantané partagé"""
+    path = ''
+    _file = None
+    _map: Optional[mmap.mmap] = None
+    _capacity = 0
+    _active = 0
+    _generation = 0
+    _rows: Mapping[str, bytes] = {}
+    _slots: Mapping[str, int] = {}
+    _hw_ids: List[str] = []
+    # emplacements à réécrire, par tampon
+    _pending: Tuple[set, set] = (set(), set())
+
+    @classmethod
+    def setup(cls: object, path: str) -> None:
+        """Paramétrage; un chemin vide désactive l'instantané"""
+        cls.close()
+        cls.path = path
+        cls._rows = {}
+        cls._slots = {}
+        cls._hw_ids = []
+        cls._pending = (set(), set())
+        cls._generation = 0
+        if cls.path:
+            cls._open(_MIN_CAPACITY)
+
+    @classmethod
+    def set(
+            cls: object,
+            hw_id: str,
+            name: str,
+            level: float,
+            band: int,
+            last_update: float,
+            dead: bool) -> None:
+        """État du device (rien si inchangé), publié au prochain 'publish'"""
+        if cls._map is None:
+            return
+        row = RECORD.pack(
+            hw_id.encode('ascii', 'replace')[:32],
+            _encode(name, 64),
+            last_update,
+            level,
+            band,
+            dead
+        )
+        if cls._rows.get(hw_id) == row:
+            return
+        cls._rows[hw_id] = row
+        slot = cls._slots.get(hw_id)
+        if slot is None:
+            slot = cls._slots[hw_id] = len(cls._hw_ids)
+            cls._hw_ids.append(hw_id)
+        cls._touch(slot)
+
+    @classmethod
+    def remove(cls: object, hw_id: str) -> None:
+        """Retire le device; le dernier emplacement comble le trou"""
+        slot = cls._slots.pop(hw_id, None)
+        if slot is None:
+            return
+        del cls._rows[hw_id]
+        last = cls._hw_ids.pop()
+        if last != hw_id:
+            cls._hw_ids[slot] = last
+            cls._slots[last] = slot
+            cls._touch(slot)
+
+    @classmethod
+    def publish(cls: object, epoch: Optional[float] = None) -> None:
+        """Écrit le tampon inactif puis le désigne comme actif"""
+        if cls._map is None:
+            return
+        if len(cls._hw_ids) > cls._capacity:
+            cls._open(max(_MIN_CAPACITY, 1 << (len(cls._hw_ids) - 1).bit_length()))
+        buffer = 1 - cls._active
+        offset = buffer_offset(cls._capacity, buffer)
+        sequence = SEQUENCE.unpack_from(cls._map, offset)[0] + 1
+        SEQUENCE.pack_into(cls._map, offset, sequence)
+        pending = cls._pending[buffer]
+        start = offset + BUFFER_HEADER.size
+        for slot in pending:
+            if slot < len(cls._hw_ids):
+                cls._map[start + slot * RECORD.size:start + (slot + 1) * RECORD.size] = \
+                    cls._rows[cls._hw_ids[slot]]
+        pending.clear()
+        cls._generation += 1
+        BUFFER_HEADER.pack_into(
+            cls._map,
+            offset,
+            sequence + 1,
+            cls._generation,
+            time() if epoch is None else epoch,
+            len(cls._hw_ids)
+        )
+        cls._active = buffer
+        cls._write_header(PUBLISHED)
+
+    @classmethod
+    def close(cls: object) -> None:
+        """Fermeture du fichier, marqué fermé pour les lecteurs"""
+        if cls._map is None:
+            return
+        cls._write_header(CLOSED)
+        cls._map.flush()
+        cls._map.close()
+        cls._file.close()
+        cls._map = cls._file = None
+
+    @classmethod
+    def _open(cls: object, capacity: int) -> None:
+        """(Re)création du fichier, remplacé atomiquement"""
+        temp_path = '{}.tmp'.format(cls.path)
+        temp_file = open(temp_path, 'w+b')
+        temp_file.truncate(buffer_offset(capacity, 2))
+        temp_map = mmap.mmap(temp_file.fileno(), 0)
+        # le tampon 0 contient l'état courant avant que le fichier soit visible
+        rows = b''.join(cls._rows[hw_id] for hw_id in cls._hw_ids)
+        start = buffer_offset(capacity, 0) + BUFFER_HEADER.size
+        temp_map[start:start + len(rows)] = rows
+        BUFFER_HEADER.pack_into(temp_map, start - BUFFER_HEADER.size, 0, cls._generation, time(), len(cls._hw_ids))
+        HEADER.pack_into(temp_map, 0, MAGIC, VERSION, RECORD.size, capacity, PUBLISHED, 0, cls._generation)
+        # les lecteurs de l'ancien fichier le voient fermé et remplacé
+        os.replace(temp_path, cls.path)
+        cls.close()
+        cls._file, cls._map = temp_file, temp_map
+        cls._capacity = capacity
+        cls._active = 0
+        cls._pending = (set(), set(range(len(cls._hw_ids))))
+
+    @classmethod
+    def _write_header(cls: object, state: int) -> None:
+        """En-tête du fichier"""
+        HEADER.pack_into(
+            cls._map, 0, MAGIC, VERSION, RECORD.size, cls._capacity, state, cls._active, cls._generation
+        )
+
+    @classmethod
+    def _touch(cls: object, slot: int) -> None:
+        """Emplacement à réécrire dans les deux tampons"""
+        cls._pending[0].add(slot)
+        cls._pending[1].add(slot)
+
+    @classmethod
+    def __str__(cls: object) -> str:
+        """Wrapper pour str()"""
+        return '<Snapshot>{}: {}/{}'.format(cls.path, len(cls._hw_ids), cls._capacity)
+
+    @classmethod
+    def __repr__(cls: object) -> str:
+        """Wrapper pour repr()"""
+        return str(cls)
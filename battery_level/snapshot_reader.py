@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Lecture de l'instantané du parc publié par le plugin (sans appel HTTP)
+
+Module autonome (bibliothèque standard seule): il peut être copié tel quel
+à côté d'un script. Le fichier est projeté en mémoire et a une disposition
+fixe, en petit-boutiste:
+
+    - en-tête (64 octets): magic, version, taille d'un enregistrement,
+      capacité, état (0: publié, 1: fermé par le plugin), tampon actif,
+      génération
+    - deux tampons, chacun avec son en-tête (32 octets: séquence,
+      génération, epoch de publication, nombre d'enregistrements) suivi de
+      'capacité' enregistrements de 112 octets: hw_id (32 octets), nom
+      (64 octets, UTF-8), dernier rapport (epoch, double), niveau lissé
+      (float), bande (0: hors service à 4: plein), hors service (0/1)
+
+Le plugin écrit le tampon inactif puis le désigne comme actif. La séquence
+d'un tampon est impaire pendant son écriture: une lecture est valide si la
+séquence du tampon lu est paire et inchangée après la copie (seqlock).
+
+    python -m battery_level.snapshot_reader /opt/domoticz/plugins/BatteryLevel/snapshot.bin
+"""
+
+# standard libs
+import json
+import mmap
+import os
+import struct
+import sys
+from typing import List, NamedTuple, Optional
+
+MAGIC = b'BLSNAP'
+VERSION = 1
+HEADER = struct.Struct('<6sHIIIIQ32x')
+BUFFER_HEADER = struct.Struct('<QQdI4x')
+RECORD = struct.Struct('<32s64sdfBB2x')
+SEQUENCE = struct.Struct('<Q')
+PUBLISHED = 0
+CLOSED = 1
+
+
+def buffer_offset(capacity: int, buffer: int) -> int:
+    """Position du tampon 'buffer' (0 ou 1) dans le fichier"""
+    return HEADER.size + buffer * (BUFFER_HEADER.size + capacity * RECORD.size)
+
+
+class SnapshotRecord(NamedTuple):
+    """État publié d'un device"""
+    hw_id: str
+    name: str
+    level: float
+    band: int
+    last_update: float
+    dead: bool
+
+
+class Snapshot(NamedTuple):
+    """Instantané cohérent du parc"""
+    generation: int
+    epoch: float
+    closed: bool
+    records: List[SnapshotRecord]
+
+
+class SnapshotReader:
+    """Lecteur de l'instantané; le fichier est rouvert quand le plugin le remplace"""
+
+    def __init__(self: object, path: str) -> None:
+        """Ouverture du fichier"""
+        self.path = path
+        self._file = None
+        self._map: Optional[mmap.mmap] = None
+        self._inode = None
+        self._open()
+
+    def _open(self: object) -> None:
+        """Projection du fichier en lecture seule"""
+        self.close()
+        self._file = open(self.path, 'rb')
+        self._inode = os.fstat(self._file.fileno()).st_ino
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = HEADER.unpack_from(self._map)[:2]
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError('Instantané invalide: {}'.format(self.path))
+
+    def _replaced(self: object) -> bool:
+        """True si le fichier projeté n'est plus celui du chemin"""
+        try:
+            return os.stat(self.path).st_ino != self._inode
+        except OSError:
+            return False
+
+    def read(self: object, retries: int = 1000) -> Snapshot:
+        """Copie cohérente du tampon actif"""
+        for _ in range(retries):
+            _, _, _, capacity, state, active, _ = HEADER.unpack_from(self._map)
+            if state == CLOSED and self._replaced():
+                self._open()
+                continue
+            offset = buffer_offset(capacity, active)
+            sequence = SEQUENCE.unpack_from(self._map, offset)[0]
+            if sequence % 2:
+                continue
+            _, generation, epoch, count = BUFFER_HEADER.unpack_from(self._map, offset)
+            start = offset + BUFFER_HEADER.size
+            datas = self._map[start:start + min(count, capacity) * RECORD.size]
+            if SEQUENCE.unpack_from(self._map, offset)[0] != sequence:
+                continue
+            return Snapshot(generation, epoch, state == CLOSED, [
+                SnapshotRecord(
+                    hw_id.rstrip(b'\0').decode('ascii', 'replace'),
+                    name.rstrip(b'\0').decode('utf-8', 'replace'),
+                    round(level, 1),
+                    band,
+                    last_update,
+                    bool(dead)
+                )
+                for hw_id, name, last_update, level, band, dead in RECORD.iter_unpack(datas)
+            ])
+        raise TimeoutError('Instantané en cours d\'écriture: {}'.format(self.path))
+
+    def close(self: object) -> None:
+        """Fermeture du fichier"""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self: object) -> object:
+        """Wrapper pour with"""
+        return self
+
+    def __exit__(self: object, *_args: tuple) -> None:
+        """Wrapper pour with"""
+        self.close()
+
+    def __str__(self: object) -> str:
+        """Wrapper pour str()"""
+        return '<SnapshotReader>{}'.format(self.path)
+
+    def __repr__(self: object) -> str:
+        """Wrapper pour repr()"""
+        return str(self)
+
+
+def read_snapshot(path: str) -> Snapshot:
+    """Lecture unique de l'instantané"""
+    with SnapshotReader(path) as reader:
+        return reader.read()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Point d'entrée: affiche l'instantané (JSON)"""
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        sys.stderr.write('usage: python -m battery_level.snapshot_reader <snapshot.bin>\n')
+        return 2
+    try:
+        snapshot = read_snapshot(argv[0])
+    except (OSError, ValueError) as exc:
+        sys.stderr.write('{}\n'.format(exc))
+        return 1
+    json.dump({
+        'generation': snapshot.generation,
+        'epoch': snapshot.epoch,
+        'closed': snapshot.closed,
+        'devices': [record._asdict() for record in snapshot.records]
+    }, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Sources Domoticz interrogées (locale et distantes)"""
+
+# standard libs
+from time import time
+from typing import Iterator, List, Mapping, Optional, Tuple
+
+# Domoticz lib
+import Domoticz
+
+# local libs
+from battery_level.common import debug
+from battery_level.flight_recorder import FlightRecorder
+from battery_level.governor import Governor
+from battery_level.metrics import Metrics
+from battery_level.requests import Requests
+from battery_level.trace import Trace
+
+
+class Source:
+    """Instance Domoticz interrogée
+
+    La source 0 est le Domoticz local: elle utilise la file `Requests` et
+    n'a pas de préfixe. Les sources distantes ont leur propre file, leur
+    propre connexion et un préfixe 'R<n>-' pour leurs hw_id.
+    """
+
+    def __init__(self: object, index: int, address: str, port: str, delay: float = 0) -> None:
+        """Initialisation de la classe
+
+        Args:
+
+            - index (int): rang de la source (0: locale)
+            - address (str): adresse du serveur
+            - port (str): port du serveur
+            - delay (float): décalage (s) de la première interrogation
+        """
+        self.index = index
+        self.address = address
+        self.port = port
+        if index:
+            self.name = 'bat_lev_conn_{}'.format(index)
+            self.prefix = 'R{}-'.format(index)
+            self.requests = Requests.new_queue('Requests_{}'.format(index))
+        else:
+            self.name = 'bat_lev_conn'
+            self.prefix = ''
+            self.requests = Requests
+        self.next_poll = time() + delay
+        self.next_hot_poll = 0.0
+        self.connection: Optional[Domoticz.Connection] = None
+        self.governor = Governor()
+        self.poll_started: Optional[float] = None
+
+    @property
+    def is_local(self: object) -> bool:
+        """True pour le Domoticz local"""
+        return self.index == 0
+
+    def connect(self: object) -> None:
+        """Création de la connexion"""
+        self.connection = Domoticz.Connection(
+            Name=self.name,
+            Transport='TCP/IP',
+            Protocol='HTTP',
+            Address=self.address,
+            Port=self.port
+        )
+
+    def poll_due(self: object, now: float, period: float) -> bool:
+        """True si l'interrogation périodique est due; programme la suivante"""
+        if self.next_poll <= now:
+            self.next_poll += period
+            return True
+        return False
+
+    def hot_due(self: object, now: float, period: float) -> bool:
+        """True si la relève rapide est due; programme la suivante"""
+        if self.next_hot_poll <= now:
+            self.next_hot_poll = now + period
+            return True
+        return False
+
+    def send(self: object) -> None:
+        """Envoie les requètes en attente, dans la limite du régulateur (connexion si besoin)"""
+        now = time()
+        lost = self.governor.expire(now)
+        if lost:
+            Domoticz.Error('Requète(s) sans réponse ({})'.format(self))
+            FlightRecorder.record(FlightRecorder.ERROR, self.name, 'lost', lost)
+            path = FlightRecorder.dump('{} requète(s) sans réponse ({})'.format(lost, self.name))
+            if path is not None:
+                Domoticz.Status('Enregistreur de vol: {}'.format(path))
+        if self.requests():
+            if not self.connection.Connected():
+                if not self.connection.Connecting():
+                    self.connection.Connect()
+            else:
+                while self.requests() and self.governor.can_send():
+                    request = self.requests.get()
+                    self.connection.Send(request)
+                    Trace.request(self.name, request)
+                    self.governor.sent(request, now)
+                    FlightRecorder.record(
+                        FlightRecorder.SENT,
+                        self.name,
+                        request.get('URL'),
+                        len(self.requests()),
+                        self.governor.in_flight()
+                    )
+        self.export_metrics()
+
+    def poll_done(self: object) -> None:
+        """Fin de l'interrogation périodique (devices mis à jour)"""
+        if self.poll_started is not None:
+            Metrics.set(
+                'battery_level_poll_duration_seconds',
+                time() - self.poll_started,
+                source=self.name
+            )
+            self.poll_started = None
+
+    def export_metrics(self: object) -> None:
+        """Métriques de la file et du régulateur"""
+        Metrics.set('battery_level_requests_queue_depth', len(self.requests()), source=self.name)
+        Metrics.set('battery_level_requests_in_flight', self.governor.in_flight(), source=self.name)
+        if self.governor.latency is not None:
+            Metrics.set(
+                'battery_level_request_latency_seconds',
+                round(self.governor.latency, 4),
+                source=self.name
+            )
+
+    def disconnect(self: object) -> None:
+        """Fermeture de la connexion"""
+        if self.connection is not None and self.connection.Connected():
+            self.connection.Disconnect()
+
+    def __str__(self: object) -> str:
+        """Wrapper pour str()"""
+        return '<Source>{}: {}:{} ({})'.format(
+            self.name,
+            self.address,
+            self.port,
+            self.prefix or 'local'
+        )
+
+    def __repr__(self: object) -> str:
+        """Wrapper pour repr()"""
+        return str(self)
+
+
+class Sources:
+    """Collection des sources, indexées par nom de connexion"""
+    _sources: Mapping[str, Source] = {}
+
+    def __new__(cls: object, addresses: Optional[List[Tuple[str, str]]] = None, period: float = 300) -> object:
+        """Initialisation de la classe
+
+        Args:
+
+            - addresses (list): (adresse, port); le premier est le Domoticz local
+            - period (float): période d'interrogation, répartie entre les sources
+        """
+        if addresses is not None:
+            cls._sources = {}
+            for index, (address, port) in enumerate(addresses):
+                source = Source(index, address, port, index * period / len(addresses))
+                cls._sources[source.name] = source
+            debug(*cls._sources.values())
+        return super(Sources, cls).__new__(cls)
+
+    @classmethod
+    def get(cls: object, name: str) -> Optional[Source]:
+        """Source associée au nom de connexion"""
+        return cls._sources.get(name)
+
+    @classmethod
+    def local(cls: object) -> Source:
+        """Source locale"""
+        return cls._sources['bat_lev_conn']
+
+    @classmethod
+    def shedding(cls: object) -> bool:
+        """True si le Domoticz local est surchargé (travail non essentiel suspendu)"""
+        source = cls._sources.get('bat_lev_conn')
+        return source is not None and source.governor.shedding
+
+    @classmethod
+    def __iter__(cls: object) -> Iterator[Source]:
+        """Wrapper for ... in ..."""
+        for source in cls._sources.values():
+            yield source
+
+    @classmethod
+    def __len__(cls: object) -> int:
+        """Nombre de sources"""
+        return len(cls._sources)
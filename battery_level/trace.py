@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Enregistrement et lecture des échanges avec l'API Domoticz
+
+Une trace est un fichier JSON lines compressé (gzip). La première ligne
+décrit la trace (version, début, paramètres du plugin), chaque ligne
+suivante est un évènement:
+
+    - {"t": 1.2, "ev": "out", "conn": "bat_lev_conn", "verb": "GET", "url": "/json.htm?..."}
+    - {"t": 1.3, "ev": "in", "conn": "bat_lev_conn", "status": "200", "data": "{...}"}
+    - {"t": 0.1, "ev": "conn", "conn": "bat_lev_conn", "status": 0}
+    - {"t": 10.0, "ev": "hb"}
+
+Les noms de devices peuvent être anonymisés (empreinte stable du nom).
+"""
+
+# standard libs
+import gzip
+import json
+import re
+from hashlib import sha1
+from time import time
+from typing import IO, Iterator, Mapping, Optional
+
+TRACE_VERSION = 1
+_ANONYMIZED_TITLES = ('Devices', 'GetPlanDevices')
+_MESSAGE = re.compile(r'(tmsg=)[^&]*')
+
+
+def anonymize(byte_datas: bytes) -> str:
+    """Remplace les noms de devices d'une réponse JSON par leur empreinte"""
+    text = byte_datas.decode('utf-8', errors='replace')
+    try:
+        datas = json.loads(text)
+    except ValueError:
+        return text
+    if datas.get('title') not in _ANONYMIZED_TITLES:
+        return text
+    for item in datas.get('result', []):
+        for field in ('Name', 'Description'):
+            if item.get(field):
+                item[field] = 'device-{}'.format(sha1(item[field].encode()).hexdigest()[:8])
+    return json.dumps(datas)
+
+
+class Trace:
+    """Enregistreur de trace (inactif tant que `start` n'est pas appelé)"""
+    _file: Optional[IO[str]] = None
+    _start = 0.0
+    _anonymize = False
+
+    @classmethod
+    def start(cls: object, path: str, parameters: Mapping[str, str], anonymized: bool = False) -> None:
+        """Ouvre la trace 'path'"""
+        cls.stop()
+        cls._file = gzip.open(path, 'wt', encoding='utf-8')
+        cls._start = time()
+        cls._anonymize = anonymized
+        cls._write({
+            'version': TRACE_VERSION,
+            'start': cls._start,
+            'anonymized': anonymized,
+            'parameters': {
+                key: value for key, value in parameters.items()
+                if key not in ('Password', 'HomeFolder', 'StartupFolder', 'UserDataFolder', 'WebRoot')
+            }
+        })
+
+    @classmethod
+    def connect(cls: object, connection_name: str, status: int) -> None:
+        """Connexion établie (ou échouée)"""
+        if cls._file is not None:
+            cls._write({'t': time() - cls._start, 'ev': 'conn', 'conn': connection_name, 'status': status})
+
+    @classmethod
+    def request(cls: object, connection_name: str, request: Mapping[str, str]) -> None:
+        """Requète envoyée"""
+        if cls._file is not None:
+            cls._write({
+                't': time() - cls._start,
+                'ev': 'out',
+                'conn': connection_name,
+                'verb': request.get('Verb'),
+                'url': _MESSAGE.sub(r'\1', request.get('URL', '')) if cls._anonymize else request.get('URL')
+            })
+
+    @classmethod
+    def response(cls: object, connection_name: str, status: str, byte_datas: bytes) -> None:
+        """Réponse reçue"""
+        if cls._file is not None:
+            cls._write({
+                't': time() - cls._start,
+                'ev': 'in',
+                'conn': connection_name,
+                'status': status,
+                'data': anonymize(byte_datas) if cls._anonymize else (
+                    byte_datas.decode('utf-8', errors='replace')
+                )
+            })
+
+    @classmethod
+    def heartbeat(cls: object) -> None:
+        """Heartbeat"""
+        if cls._file is not None:
+            cls._write({'t': time() - cls._start, 'ev': 'hb'})
+
+    @classmethod
+    def stop(cls: object) -> None:
+        """Ferme la trace"""
+        if cls._file is not None:
+            cls._file.close()
+            cls._file = None
+
+    @classmethod
+    def _write(cls: object, event: Mapping[str, object]) -> None:
+        """Ecrit un évènement"""
+        cls._file.write(json.dumps(event, separators=(',', ':')))
+        cls._file.write('\n')
+
+
+def read_trace(path: str) -> Iterator[dict]:
+    """Lit une trace: en-tête puis évènements"""
+    with gzip.open(path, 'rt', encoding='utf-8') as trace:
+        for line in trace:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Thread de décodage et d'agrégation des réponses JSON/API"""
+
+# standard libs
+import json
+import sqlite3
+from queue import Empty, Queue
+from threading import Thread
+from typing import Any, Iterator, Tuple, Union
+
+# local libs
+from battery_level.database import DeviceDatabase, UnknownHardwareType
+from battery_level.devices import Devices
+from battery_level.sources import Source
+
+DATAS = 'datas'
+CHANGES = 'changes'
+ERROR = 'error'
+DATABASE_ERROR = 'database_error'
+
+
+class Worker:
+    """Décodage et agrégation hors du thread du plugin
+
+    Les réponses brutes sont transmises par une file; le thread décode le
+    JSON et, pour les devices, effectue l'agrégation (`Devices.compute_changes`).
+    Une base Domoticz transmise à la place d'une réponse est lue ici; si
+    elle est illisible (ou un type de matériel inconnu), le plugin se rabat
+    sur l'api (`DATABASE_ERROR`).
+    Aucun appel à l'API Domoticz n'est fait ici: les résultats sont relevés
+    par le plugin (`results`) et appliqués sur son propre thread.
+    """
+
+    def __init__(self: object) -> None:
+        """Initialisation de la classe"""
+        self._jobs: Queue = Queue()
+        self._results: Queue = Queue()
+        self._thread = Thread(name='bat_lev_worker', target=self._run, daemon=True)
+
+    def start(self: object) -> None:
+        """Démarrage du thread"""
+        self._thread.start()
+
+    def stop(self: object, timeout: float = 5) -> None:
+        """Arrêt du thread (à faire avant la fin de onStop)"""
+        if self._thread.is_alive():
+            self._jobs.put(None)
+            self._thread.join(timeout)
+
+    def submit(self: object, source: Source, byte_datas: Union[bytes, DeviceDatabase], partial: bool = False) -> None:
+        """Transmet une réponse brute (ou la base à lire) au thread; 'partial': relève partielle"""
+        self._jobs.put((source, byte_datas, partial))
+
+    def results(self: object) -> Iterator[Tuple[Source, str, Any, bool]]:
+        """Résultats disponibles: (source, DATAS|CHANGES|ERROR|DATABASE_ERROR, contenu, relève partielle)"""
+        while True:
+            try:
+                yield self._results.get_nowait()
+            except Empty:
+                return
+
+    def _run(self: object) -> None:
+        """Boucle du thread"""
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            source, byte_datas, partial = job
+            try:
+                if isinstance(byte_datas, DeviceDatabase):
+                    try:
+                        records = byte_datas.records()
+                    except (sqlite3.Error, UnknownHardwareType) as error:
+                        self._results.put((source, DATABASE_ERROR, error, partial))
+                        continue
+                    self._results.put((source, CHANGES, Devices.compute_changes(records, source.prefix), partial))
+                    continue
+                datas = json.loads(byte_datas)
+                if datas.get('status') == 'OK' and datas.get('title') == 'Devices':
+                    if source.is_local:
+                        DeviceDatabase.learn(datas.get('result', []))
+                    self._results.put((
+                        source,
+                        CHANGES,
+                        Devices.compute_changes(datas.get('result', []), source.prefix, partial),
+                        partial
+                    ))
+                else:
+                    self._results.put((source, DATAS, datas, partial))
+            except Exception as error:  # pylint:disable=broad-except
+                self._results.put((source, ERROR, '{}: {}'.format(type(error).__name__, error), partial))
+
+    def __str__(self: object) -> str:
+        """Wrapper pour str()"""
+        return '<Worker>{} - {} jobs - {} results'.format(
+            'alive' if self._thread.is_alive() else 'stopped',
+            self._jobs.qsize(),
+            self._results.qsize()
+        )
+
+    def __repr__(self: object) -> str:
+        """Wrapper pour repr()"""
+        return str(self)
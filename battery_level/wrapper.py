@@ -0,0 +1,555 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Wrapper pour le plugin"""
+
+# standards libs
+import json
+import os
+import sqlite3
+from functools import wraps
+from time import strftime, time
+from typing import Callable, Iterable, Mapping, Optional, Tuple
+
+# Domoticz lib
+import Domoticz
+
+# local libs
+from battery_level.common import debug
+from battery_level.controls import Controls
+from battery_level.core import ieee_grouping
+from battery_level.database import DeviceDatabase, UnknownHardwareType
+from battery_level.plugin_config import PluginConfig
+from battery_level.devices import Devices
+from battery_level.flight_recorder import FlightRecorder, plan_flags
+from battery_level.history import History
+from battery_level.requests import Requests
+from battery_level.images import Images
+from battery_level.metrics import Metrics
+from battery_level.plans import Plans
+from battery_level.profiler import Profiler
+from battery_level.snapshot import Snapshot
+from battery_level.sources import Source, Sources
+from battery_level.trace import Trace
+from battery_level.worker import CHANGES, DATABASE_ERROR, DATAS, Worker
+
+
+def _profiled(callback: Callable[..., None]) -> Callable[..., None]:
+    """Callback exécuté sous le profileur quand celui-ci est actif"""
+    @wraps(callback)
+    def profiled(self: object, *args: tuple) -> None:
+        if self._profiler.active:  # pylint:disable=protected-access
+            self._profiler.call(callback, self, *args)  # pylint:disable=protected-access
+        else:
+            callback(self, *args)
+    return profiled
+
+
+class Wrapper:
+    """Wrapper pour le plugin"""
+    _poll_period = 60 * 5
+    _overrides_file = 'parameters.json'
+    _snapshot_file = 'snapshot.bin'
+    _profiling_unit = 255
+    _flight_unit = 254
+    # état du plan inchangé au-delà de ce délai (s) avec une requète en attente: blocage
+    _stuck_timeout = 2 * _poll_period
+    _five_m_datas = (
+        "GET",
+        "/json.htm?type=devices&used=true"
+    )
+    # relève rapide des devices proches du vide: une requète par enregistrement
+    _hot_datas = (
+        "GET",
+        "/json.htm?type=devices&rid={}"
+    )
+    _hot_limit = 20
+
+    def __init__(self: object) -> None:
+        """Initialisation de la classe"""
+        self._worker: Optional[Worker] = None
+        self._metrics_conn: Optional[Domoticz.Connection] = None
+        self._database: Optional[DeviceDatabase] = None
+        self._profiler = Profiler()
+        self._plan_status = 0
+        self._plan_status_since = time()
+        self._parameters: dict = {}
+        self._overrides_mtime: Optional[float] = None
+
+    def on_start(self: object, **_kwargs: dict) -> None:
+        """Event démarrage"""
+        Domoticz.Debugging(PluginConfig.debug_level)
+        debug('{}'.format(PluginConfig()))
+        self._parameters = PluginConfig.parameters()
+        self._setup_history()
+        self._setup_grouping()
+        FlightRecorder.setup(PluginConfig.home_folder, PluginConfig.flight_size)
+        Devices.configure_deadlines(PluginConfig.dead_timeout * 60)
+        Devices.configure_store(PluginConfig.columnar)
+        self._setup_trace()
+        self._setup_database()
+        Plans()
+        Sources(PluginConfig.sources, self._full_period())
+        for source in Sources():
+            source.connect()
+        self._setup_worker()
+        self._setup_metrics()
+        Controls.register(self._profiling_unit, 'Profiling', self._on_profiling, TypeName='Switch', Used=1)
+        Controls.switch(self._profiling_unit, False)
+        Controls.register(
+            self._flight_unit, 'Flight recorder', self._on_flight_dump,
+            TypeName='Switch', Switchtype=9, Used=1
+        )
+        Devices.setup_summary(PluginConfig.summary)
+        self._setup_snapshot()
+
+    def on_stop(self: object) -> None:
+        """Event arrêt"""
+        if self._profiler.active:
+            self._stop_profiling()
+        PluginConfig.worker_thread = False
+        self._setup_worker()
+        for source in Sources():
+            source.disconnect()
+        PluginConfig.metrics_port = 0
+        self._setup_metrics()
+        History.close()
+        Snapshot.close()
+        Trace.stop()
+        PluginConfig.db_path = ''
+        self._setup_database()
+
+    def reload(self: object, parameters: dict) -> None:
+        """Nouveaux paramètres: seul ce qui en dépend est recalculé, l'état des devices est conservé"""
+        changed = PluginConfig.reload(parameters)
+        if not changed:
+            return
+        Domoticz.Status('Configuration rechargée: {}'.format(', '.join(sorted(changed))))
+        if 'debug_level' in changed:
+            Domoticz.Debugging(PluginConfig.debug_level)
+        if 'empty_level' in changed:
+            Devices.refresh_bands()
+        if 'history_size' in changed:
+            self._setup_history()
+        if 'flight_size' in changed:
+            FlightRecorder.setup(PluginConfig.home_folder, PluginConfig.flight_size)
+        if 'ieee_types' in changed:
+            self._setup_grouping()
+        if 'dead_timeout' in changed:
+            Devices.configure_deadlines(PluginConfig.dead_timeout * 60)
+        if 'columnar' in changed:
+            Devices.configure_store(PluginConfig.columnar)
+        if 'summary' in changed:
+            Devices.setup_summary(PluginConfig.summary)
+        if 'snapshot' in changed:
+            self._setup_snapshot()
+        if changed & {'trace', 'trace_anonymize'}:
+            self._setup_trace()
+        if 'db_path' in changed:
+            self._setup_database()
+        if 'worker_thread' in changed:
+            self._setup_worker()
+        if 'metrics_port' in changed:
+            self._setup_metrics()
+        if changed & {'plan_name', 'create_plan'}:
+            Plans.retarget()
+        elif changed & {'sort_ascending', 'sort_descending'}:
+            Plans.resort()
+        if 'sources' in changed:
+            Domoticz.Error('Sources modifiées: prises en compte au prochain démarrage du plugin')
+
+    def _check_overrides(self: object) -> None:
+        """Paramètres remplacés par le fichier 'parameters.json' du dossier du plugin
+
+        La modification du matériel dans Domoticz redémarre le plugin; ce
+        fichier permet de changer les réglages sans redémarrage. Il est relu
+        à chaque modification; sa suppression rétablit les paramètres de
+        Domoticz.
+        """
+        path = os.path.join(PluginConfig.home_folder, self._overrides_file)
+        try:
+            mtime: Optional[float] = os.stat(path).st_mtime
+        except OSError:
+            mtime = None
+        if mtime == self._overrides_mtime:
+            return
+        self._overrides_mtime = mtime
+        overrides = {}
+        if mtime is not None:
+            try:
+                with open(path, encoding='utf-8') as overrides_file:
+                    overrides = json.load(overrides_file)
+            except (OSError, ValueError) as exc:
+                Domoticz.Error('Paramètres illisibles ({}): {}'.format(path, exc))
+                return
+        self.reload(dict(self._parameters, **{key: str(value) for key, value in overrides.items()}))
+
+    def _setup_history(self: object) -> None:
+        """(Ré)ouverture de l'historique"""
+        History.close()
+        History.setup(
+            os.path.join(PluginConfig.home_folder, 'history'),
+            PluginConfig.history_size
+        )
+
+    @staticmethod
+    def _setup_grouping() -> None:
+        """Types de matériel regroupés par adresse IEEE (option 'ieee_types': '94,...')"""
+        try:
+            hardware_types = [int(value) for value in PluginConfig.ieee_types.split(',') if value.strip()]
+        except ValueError:
+            Domoticz.Error('Mauvaise valeur pour l\'option ieee_types: {}'.format(PluginConfig.ieee_types))
+            hardware_types = []
+        ieee_grouping(hardware_types)
+
+    @staticmethod
+    def _setup_snapshot() -> None:
+        """Ouverture ou fermeture de l'instantané partagé"""
+        Devices.setup_snapshot(
+            os.path.join(PluginConfig.home_folder, Wrapper._snapshot_file) if PluginConfig.snapshot else ''
+        )
+
+    @staticmethod
+    def _setup_trace() -> None:
+        """Démarrage ou arrêt de l'enregistrement des échanges"""
+        Trace.stop()
+        if PluginConfig.trace:
+            Trace.start(
+                os.path.join(PluginConfig.home_folder, 'trace-{}.jsonl.gz'.format(strftime('%Y%m%d-%H%M%S'))),
+                PluginConfig.parameters(),
+                PluginConfig.trace_anonymize
+            )
+
+    def _setup_database(self: object) -> None:
+        """Ouverture ou fermeture de la lecture directe de la base Domoticz"""
+        if self._database is not None:
+            self._database.close()
+            self._database = None
+        if PluginConfig.db_path:
+            self._database = DeviceDatabase(PluginConfig.db_path)
+
+    def _setup_worker(self: object) -> None:
+        """Démarrage ou arrêt du thread de traitement"""
+        if PluginConfig.worker_thread and self._worker is None:
+            self._worker = Worker()
+            self._worker.start()
+        elif not PluginConfig.worker_thread and self._worker is not None:
+            self._worker.stop()
+            self._apply_worker_results()
+            self._worker = None
+
+    def _setup_metrics(self: object) -> None:
+        """Ouverture, déplacement ou fermeture de l'écoute des métriques"""
+        if self._metrics_conn is not None:
+            if self._metrics_conn.Connected():
+                self._metrics_conn.Disconnect()
+            self._metrics_conn = None
+        if PluginConfig.metrics_port:
+            self._metrics_conn = Domoticz.Connection(
+                Name='bat_lev_metrics',
+                Transport='TCP/IP',
+                Protocol='HTTP',
+                Port=str(PluginConfig.metrics_port)
+            )
+            self._metrics_conn.Listen()
+
+    @_profiled
+    def on_connect(self: object, *args: Tuple[Domoticz.Connection, int, str]) -> None:
+        """Event connection
+
+        [args]:
+
+            - connection (Domoticz.Connection): Domoticz.Connection object
+            - status (int): 0 if no error
+            - description (str): failure reason
+        """
+        self._apply_worker_results()
+        connection, status, description = args
+        source = Sources.get(connection.Name)
+        if source is not None:
+            Trace.connect(connection.Name, status)
+            if status == 0:
+                source.send()
+            else:
+                Domoticz.Error('Erreur: {} ({}) - {}'.format(status, source, description))
+
+    @_profiled
+    def on_message(self: object, *args: Tuple[Domoticz.Connection, dict]) -> None:
+        """Event message
+
+        [args]:
+
+            - connection (Domoticz.Connection): Domoticz.Connection object
+            - dict containing:
+                - status: (str)
+                - headers: (dict)
+                - datas: (dict)
+
+        """
+        self._apply_worker_results()
+        connection, datas_1 = args
+        if self._is_metrics(connection):
+            self._serve_metrics(connection, datas_1)
+            return
+        source = Sources.get(connection.Name)
+        if source is not None:
+            request = source.governor.received(time())
+            partial = 'rid=' in (request or {}).get('URL', '')
+            status, _, byte_datas = datas_1.values()
+            Trace.response(connection.Name, status, byte_datas)
+            FlightRecorder.record(
+                FlightRecorder.RECEIVED,
+                source.name,
+                (request or {}).get('URL'),
+                status,
+                None if source.governor.last_rtt is None else round(source.governor.last_rtt, 4),
+                len(byte_datas)
+            )
+            try:
+                if status == '200':
+                    Metrics.inc('battery_level_bytes_parsed_total', len(byte_datas), source=source.name)
+                    if self._worker is not None:
+                        self._worker.submit(source, byte_datas, partial)
+                    else:
+                        self._on_datas(json.loads(byte_datas), source, partial)
+                else:
+                    Domoticz.Error('{}'.format(request))
+                    Domoticz.Error('Erreur: {} ({})'.format(status, source))
+                    self._flight_error('HTTP {} ({})'.format(status, source.name))
+            except Exception as exc:
+                self._flight_error('{}: {} ({})'.format(type(exc).__name__, exc, source.name))
+                raise
+            self._check_plan_status()
+            debug(source.governor)
+            source.send()
+
+    def on_disconnect(self: object, *args: Tuple[Domoticz.Connection]) -> None:
+        """Event déconnexion: les requètes en vol sont perdues"""
+        source = Sources.get(args[0].Name)
+        if source is not None:
+            source.governor.reset()
+
+    @_profiled
+    def on_heartbeat(self: object) -> None:
+        """Event heartbeat"""
+        self._apply_worker_results()
+        self._check_overrides()
+        Trace.heartbeat()
+        now = time()
+        self._check_plan_status(now)
+        Devices.check_deadlines(now)
+        for source in Sources():
+            if source.poll_due(now, self._full_period()):
+                source.poll_started = now
+                if source.is_local and self._database is not None:
+                    self._poll_database(source)
+                else:
+                    source.requests.add(*self._five_m_datas)
+                if source.is_local and PluginConfig.create_plan:
+                    Plans.update()
+            elif PluginConfig.hot_margin and source.hot_due(now, PluginConfig.hot_period):
+                self._hot_poll(source)
+            source.send()
+
+    def on_command(self: object, *args: Tuple[int, str, int, str]) -> None:
+        """Event commande
+
+        [args]:
+
+            - unit (int): unité du device
+            - command (str): commande ('On', 'Off', 'Set Level'...)
+            - level (int): niveau
+            - hue (str): couleur
+        """
+        unit, command, level = args[:3]
+        if not Controls.on_command(unit, command, level):
+            debug('Commande ignorée: {} {} ({})'.format(command, level, unit))
+
+    @staticmethod
+    def on_device_modified(unit_id: int) -> None:
+        """Event device modified: un renommage est repris aussitôt (device interne, ordre, plan)"""
+        debug(unit_id)
+        device = Devices.modified(unit_id)
+        if device is not None and PluginConfig.create_plan:
+            Plans.device_modified(device.ID, device.Name)
+
+    def on_device_removed(self: object, unit_id: int) -> None:
+        """Event device removed"""
+        if Controls.remove(unit_id):
+            return
+        Devices.remove(unit_id)
+        Requests.add(*self._five_m_datas)
+
+    def _is_metrics(self: object, connection: Domoticz.Connection) -> bool:
+        """True pour une connexion entrante sur l'écoute des métriques"""
+        if self._metrics_conn is None:
+            return False
+        parent = getattr(connection, 'Parent', None)
+        return connection.Name == 'bat_lev_metrics' or (
+            parent is not None and parent.Name == 'bat_lev_metrics'
+        )
+
+    @staticmethod
+    def _serve_metrics(connection: Domoticz.Connection, datas: dict) -> None:
+        """Réponse à une collecte des métriques"""
+        if datas.get('URL', '/metrics').split('?')[0] in ('/', '/metrics'):
+            connection.Send({
+                'Status': '200 OK',
+                'Headers': {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'},
+                'Data': Metrics.render()
+            })
+        else:
+            connection.Send({'Status': '404 Not Found', 'Data': ''})
+
+    def _on_profiling(self: object, command: str, _level: int) -> None:
+        """Interrupteur de profilage"""
+        if command == 'On' and not self._profiler.active:
+            self._profiler.start(PluginConfig.profile_cycles)
+            Controls.switch(self._profiling_unit, True)
+            Domoticz.Status('Profilage démarré pour {} interrogation(s)'.format(PluginConfig.profile_cycles))
+        elif command == 'Off' and self._profiler.active:
+            self._stop_profiling()
+
+    def _on_flight_dump(self: object, _command: str, _level: int) -> None:
+        """Bouton de l'enregistreur de vol"""
+        path = FlightRecorder.dump('demande', force=True)
+        if path is not None:
+            Domoticz.Status('Enregistreur de vol: {}'.format(path))
+
+    @staticmethod
+    def _flight_error(reason: str) -> None:
+        """Erreur: enregistrée puis écriture de l'enregistreur de vol"""
+        FlightRecorder.record(FlightRecorder.ERROR, reason)
+        path = FlightRecorder.dump(reason)
+        if path is not None:
+            Domoticz.Status('Enregistreur de vol: {}'.format(path))
+
+    def _check_plan_status(self: object, now: Optional[float] = None) -> None:
+        """Transitions de l'état du plan; écriture de l'enregistreur si l'état reste bloqué"""
+        now = time() if now is None else now
+        status = Plans.status()
+        if status != self._plan_status:
+            FlightRecorder.record(FlightRecorder.PLAN, '|'.join(plan_flags(status)) or 'INIT_PLANS')
+            self._plan_status = status
+            self._plan_status_since = now
+        elif (
+                PluginConfig.sort_plan
+                and status & (Plans.GET_PLAN_DEVICES | Plans.MOVE_PLAN_DEVICE)
+                and now - self._plan_status_since > self._stuck_timeout
+        ):
+            Domoticz.Error('Etat du plan bloqué depuis {:.0f}s: {}'.format(
+                now - self._plan_status_since,
+                '|'.join(plan_flags(status))
+            ))
+            self._flight_error('plan bloqué: {}'.format('|'.join(plan_flags(status))))
+            # une seule alerte par blocage
+            self._plan_status_since = now
+
+    def _stop_profiling(self: object) -> None:
+        """Fin du profilage: écriture des résultats, interrupteur éteint"""
+        profile_path, alloc_path = self._profiler.stop(PluginConfig.home_folder)
+        Controls.switch(self._profiling_unit, False)
+        Domoticz.Status('Profil écrit: {} - {}'.format(profile_path, alloc_path))
+
+    def _poll_done(self: object, source: Source) -> None:
+        """Fin d'une interrogation des devices"""
+        source.poll_done()
+        if source.is_local and self._profiler.cycle_done():
+            self._stop_profiling()
+
+    @staticmethod
+    def _full_period() -> float:
+        """Période (s) de l'interrogation complète (triplée par défaut avec la relève rapide)"""
+        if PluginConfig.full_period:
+            return PluginConfig.full_period * 60
+        return Wrapper._poll_period * (3 if PluginConfig.hot_margin else 1)
+
+    def _hot_poll(self: object, source: Source) -> None:
+        """Relève rapide des devices proches du vide ou hors service (requètes 'rid=')
+
+        Sautée si la file de la source n'est pas vide ou si le Domoticz
+        local est surchargé.
+        """
+        if source.requests() or source.governor.shedding:
+            return
+        for idx in Devices.hot_records(
+                source.prefix,
+                PluginConfig.empty_level + PluginConfig.hot_margin,
+                self._hot_limit
+        ):
+            source.requests.add(self._hot_datas[0], self._hot_datas[1].format(idx))
+
+    def _poll_database(self: object, source: Source) -> None:
+        """Interrogation des devices par la base Domoticz; l'api reste le recours"""
+        if self._worker is not None:
+            self._worker.submit(source, self._database)
+            return
+        try:
+            records = self._database.records()
+        except (sqlite3.Error, UnknownHardwareType) as exc:
+            self._database_failed(source, exc)
+            return
+        Devices.build_from_hardware(records, source.prefix)
+        self._poll_done(source)
+
+    def _database_failed(self: object, source: Source, exc: Exception) -> None:
+        """Base Domoticz illisible ou libellé inconnu: l'interrogation passe par l'api"""
+        if isinstance(exc, UnknownHardwareType):
+            debug('Interrogation par l\'api: {}'.format(exc))
+        else:
+            Domoticz.Error('Base Domoticz illisible ({}): {}'.format(self._database.path, exc))
+        source.requests.add(*self._five_m_datas)
+
+    def _apply_worker_results(self: object) -> None:
+        """Applique, sur le thread du plugin, les résultats du thread de traitement"""
+        if self._worker is None:
+            return
+        for source, kind, result, partial in self._worker.results():
+            if kind == CHANGES:
+                Devices.apply_changes(result)
+                if not partial:
+                    self._poll_done(source)
+            elif kind == DATAS:
+                self._on_datas(result, source, partial)
+            elif kind == DATABASE_ERROR:
+                self._database_failed(source, result)
+            else:
+                Domoticz.Error('Erreur: {} ({})'.format(result, source))
+
+    def _on_datas(self: object, datas: dict, source: Source, partial: bool = False) -> None:
+        """Traitement d'une réponse décodée ('partial': réponse d'une relève rapide)"""
+        if datas['status'] == 'OK':
+            self._dispatch_request(datas, source, partial)
+        else:
+            Domoticz.Error('Erreur: {}'.format(datas))
+
+    def _dispatch_request(self: object, datas: dict, source: Source, partial: bool = False) -> None:
+        """Traitement de la réponse d'une source"""
+        # FIX: missing result; happens when there's no item
+        if 'result' not in datas:
+            datas.update({'result': {}})
+        debug('API/JSON request: {} ({})'.format(datas['title'], source.name))
+        # Device
+        if datas['title'] == 'Devices':
+            if source.is_local:
+                DeviceDatabase.learn(datas['result'])
+            Devices.build_from_hardware(datas['result'], source.prefix, partial)
+            # une relève rapide n'est pas une interrogation complète
+            if not partial:
+                self._poll_done(source)
+        # les sources distantes ne servent qu'à la collecte des devices
+        if not source.is_local:
+            return
+        # Notifications
+        elif datas['title'] == 'AddNotification':
+            Domoticz.Status('Notification successfully added')
+        # Plan of devices
+        if PluginConfig.create_plan:
+            if datas['title'] == "Plans":
+                Plans.check_plans(datas['result'])
+            elif datas['title'] == "GetPlanDevices":
+                Plans.check_plans_devices(datas['result'])
+            elif datas['title'] == 'AddPlanActiveDevice':
+                Domoticz.Status('Device successfully added to plan')
+            elif datas['title'] == 'AddPlan':
+                Requests.add("GET", Plans.urls["plans"])
+                Domoticz.Status('Plan successfully added')
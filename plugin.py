@@ -25,9 +25,33 @@ Versions:
         <h4>Sort devices:</h4>
         <p>Devices can be sorted in plan view.<br/>
         None makes no sort.<br/>
-        Other ways, devices are first sort by percentage, then name; either ascending or descending.</p>
+        Other ways, devices are first sort by percentage, then name; either ascending or descending.</p><br/>
+        <h4>Local port:</h4>
+        <p>Port of the local Domoticz web server.</p><br/>
+        <h4>Remote Domoticz:</h4>
+        <p>Comma separated list of host:port of remote Domoticz instances to monitor too.<br/>
+        Their devices are prefixed by R1-, R2-... and merged with the local ones.</p><br/>
+        <h4>Advanced options:</h4>
+        <p>Semicolon separated list of key=value:<br/>
+        columnar: 1 computes smoothing and bands for the whole fleet with numpy (if installed).<br/>
+        db_path: path of domoticz.db, read directly (read only) instead of the JSON API for the local devices.<br/>
+        dead_timeout: minutes without report before a device is considered dead, until its report interval is learnt (30).<br/>
+        evict_cycles: full polls after which a vanished device and its plugin device are deleted (0, never; 2016 is one week).<br/>
+        flight_size: number of recent events kept in memory and written to flight-*.txt on errors or with the Flight recorder button (2048; 0 disables).<br/>
+        full_period: minutes between full polls (5, or 15 with hot_margin).<br/>
+        history: number of samples kept per device in the history files (0 disables; 105120 is one year at 5 minutes).<br/>
+        profile_cycles: number of polls profiled (cProfile and tracemalloc) when the Profiling switch is turned on (3).<br/>
+        snapshot: 1 publishes the state of every device after each poll in snapshot.bin, in the plugin folder, for local scripts (see battery_level/snapshot_reader.py).<br/>
+        summary: 1 creates fleet summary devices: minimum, 10th percentile and median level, empty and dead device counts.<br/>
+        ieee_types: comma separated HardwareTypeVal whose devices are grouped by the IEEE address found in their ID (zigbee; e.g. 94 for python plugins). Changes their device IDs: their devices are created again.<br/>
+        hot_margin: points above the empty level under which devices, and dead ones, are refreshed every hot_period seconds with per device requests (0 disables; hot_period: 30).<br/>
+        metrics_port: port of a local HTTP listener serving metrics in Prometheus text format (0 disables).<br/>
+        trace: 1 records the API traffic in a compressed trace file of the plugin folder (trace_anonymize: 1 hides device names).<br/>
+        worker: 1 parses and aggregates API responses in a background thread.</p>
     </description>
     <params>
+        <param field="Port" label="Local port" width="60px" required="true" default="8080" />
+        <param field="Address" label="Remote Domoticz" width="300px" default="" />
         <param field="Mode1" label="Empty level (%)" width="40px" required="true" default="25" />
         <param field="Mode2" label="Use every device">
             <options>
@@ -56,6 +80,7 @@ Versions:
                 <option label="Plugin" value="2" />
             </options>
         </param>
+        <param field="Username" label="Advanced options" width="300px" default="" />
     </params>
 </plugin>
 """
@@ -74,6 +99,7 @@ def onStart() -> None:  # pylint: disable=invalid-name
     battery_level.PluginConfig(Parameters)
     battery_level.Images(Images)
     battery_level.Devices(Devices)
+    battery_level.Controls(Devices)
     WRAPPER.on_start(
         settings=Settings
     )
@@ -95,16 +121,18 @@ def onMessage(*args) -> None:  # pylint: disable=invalid-name
     WRAPPER.on_message(*args)
 
 
-def onCommand(*_args) -> None:  # pylint: disable=invalid-name
+def onCommand(*args) -> None:  # pylint: disable=invalid-name
     """onCommand"""
+    WRAPPER.on_command(*args)
 
 
 def onNotification(*_args) -> None:  # pylint: disable=invalid-name
     """onNotification"""
 
 
-def onDisconnect(*_args) -> None:  # pylint: disable=invalid-name
+def onDisconnect(*args) -> None:  # pylint: disable=invalid-name
     """onDisconnect"""
+    WRAPPER.on_disconnect(*args)
 
 
 def onHeartbeat() -> None:  # pylint: disable=invalid-name
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Configuration des tests: module `Domoticz` de substitution, devices vierges"""
+
+# standard libs
+from datetime import datetime
+from typing import Callable, List
+
+# third party libs
+import pytest
+
+# local libs
+from tools import domoticz_stub
+
+domoticz_stub.install()
+
+# pylint:disable=wrong-import-position,protected-access
+from battery_level.core import _HardWares  # noqa: E402
+from battery_level.deadlines import Deadlines  # noqa: E402
+from battery_level.devices import Devices  # noqa: E402
+from battery_level.fleet_stats import FleetStats  # noqa: E402
+from battery_level.history import History  # noqa: E402
+from battery_level.images import Images  # noqa: E402
+from battery_level.plugin_config import PluginConfig  # noqa: E402
+
+
+def records(count: int, level: Callable[[int], float] = lambda index: 50, **fields: dict) -> List[dict]:
+    """Enregistrements `type=devices` synthétiques, un nœud zwave chacun"""
+    return [dict({
+        'idx': str(index),
+        'ID': '0000{:02X}01'.format(index),
+        'Name': 'room {} - motion'.format(index),
+        'BatteryLevel': level(index),
+        'HardwareType': 'OpenZWave USB',
+        'HardwareTypeVal': 21,
+        'HardwareID': 3,
+        'LastUpdate': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }, **fields) for index in range(count)]
+
+
+@pytest.fixture
+def devices(monkeypatch, tmp_path):
+    """Collection des devices vide, état de classe rétabli après le test"""
+    domoticz_stub.Devices.clear()
+    for attr, value in (
+            ('materials', {}), ('_seen', {}), ('_cycles', {}), ('_fingerprints', {})
+    ):
+        monkeypatch.setattr(_HardWares, attr, value)
+    for attr, value in (
+            ('_map_devices', {}), ('_deadlines', Deadlines()), ('_stats', FleetStats()),
+            ('_plan_dirty', set()), ('_store', None), ('_notifications', []),
+            ('_evicted_units', set()), ('_metrics_names', {}), ('_summary', {})
+    ):
+        monkeypatch.setattr(Devices, attr, value)
+    PluginConfig({
+        'Mode1': '25', 'Mode2': '1', 'Mode3': '0', 'Mode4': '', 'Mode5': '-1', 'Mode6': '0',
+        'Port': '8080', 'Address': '', 'Username': '', 'HomeFolder': str(tmp_path)
+    })
+    History.setup('', 0)
+    Images(domoticz_stub.Images)
+    Devices(domoticz_stub.Devices)
+    return Devices
@@ -0,0 +1,35 @@
+-- Extrait du schéma de domoticz.db: colonnes lues par battery_level.database
+CREATE TABLE Hardware (
+    ID INTEGER PRIMARY KEY,
+    Name VARCHAR(200) NOT NULL,
+    Enabled INTEGER DEFAULT 1,
+    Type INTEGER NOT NULL,
+    Address VARCHAR(200),
+    Port INTEGER
+);
+CREATE TABLE DeviceStatus (
+    ID INTEGER PRIMARY KEY,
+    HardwareID INTEGER NOT NULL,
+    DeviceID VARCHAR(25) NOT NULL,
+    Unit INTEGER DEFAULT 0,
+    Name VARCHAR(100) DEFAULT Unknown,
+    Used INTEGER DEFAULT 0,
+    Type INTEGER NOT NULL,
+    SubType INTEGER NOT NULL,
+    SignalLevel INTEGER DEFAULT 0,
+    BatteryLevel INTEGER DEFAULT 0,
+    nValue INTEGER DEFAULT 0,
+    sValue VARCHAR(200) DEFAULT '',
+    LastUpdate DATETIME DEFAULT (datetime('now', 'localtime'))
+);
+INSERT INTO Hardware VALUES (2, 'RFX', 1, 1, '', 0);
+INSERT INTO Hardware VALUES (3, 'Zwave stick', 1, 21, '', 0);
+INSERT INTO Hardware VALUES (5, 'Zigbee', 1, 94, '127.0.0.1', 9440);
+INSERT INTO Hardware VALUES (7, 'Old stick', 0, 21, '', 0);
+INSERT INTO DeviceStatus VALUES (1, 3, '0000AB01', 1, 'kitchen - motion', 1, 244, 62, 12, 80, 0, '', '2021-01-01 10:00:00');
+INSERT INTO DeviceStatus VALUES (2, 3, '0000AB02', 2, 'kitchen - temperature', 1, 80, 5, 12, 80, 0, '19.5', '2021-01-01 10:00:00');
+INSERT INTO DeviceStatus VALUES (3, 5, '0x00124b0012345678-01', 1, 'door', 1, 244, 73, 12, 55, 0, '', '2021-01-01 09:30:12');
+INSERT INTO DeviceStatus VALUES (4, 2, '6A03', 1, 'garden', 1, 80, 1, 7, 100, 0, '12.1', '2021-01-01 10:02:00');
+INSERT INTO DeviceStatus VALUES (5, 2, '6A04', 1, 'mains', 1, 80, 1, 7, 255, 0, '21.0', '2021-01-01 10:02:00');
+INSERT INTO DeviceStatus VALUES (6, 3, '0000CD01', 1, 'unused', 0, 244, 62, 12, 40, 0, '', '2021-01-01 10:00:00');
+INSERT INTO DeviceStatus VALUES (7, 7, '0000EF01', 1, 'attic - motion', 1, 244, 62, 12, 70, 0, '', '2021-01-01 10:00:00');
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Tests du stockage en colonnes: même résultat que le calcul device par device"""
+
+# standard libs
+import random
+
+# third party libs
+import pytest
+
+# local libs
+from battery_level.core import _Bounces, level_band_index
+
+columnar = pytest.importorskip('battery_level.columnar')
+pytest.importorskip('numpy')
+
+
+def test_store_matches_bounces_and_bands():
+    rand = random.Random(32)
+    store = columnar.FleetStore(window=12, empty_level=25.0, capacity=4)
+    bounces = {}
+    for step in range(300):
+        hw_id = 'hw{}'.format(rand.randrange(20))
+        if step % 50 == 49 and hw_id in bounces:
+            store.remove(hw_id)
+            del bounces[hw_id]
+            continue
+        level = rand.choice((rand.uniform(0, 100), 100.0, 5.0))
+        store.update(hw_id, level, step)
+        bounces.setdefault(hw_id, _Bounces(2, empty_level=25.0))._update(level)
+        store.compute()
+        for other, bounce in bounces.items():
+            slot = store.slots[other]
+            assert store.level_out[slot] == pytest.approx(bounce.last_value_out)
+            assert store.band[slot] == level_band_index(store.level_out[slot], 25.0)
+    assert sorted(store.hw_ids) == sorted(bounces)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Tests du noyau d'agrégation (règles de regroupement, hw_id, cache des empreintes)"""
+
+# third party libs
+import pytest
+
+# local libs
+# pylint:disable=protected-access
+from battery_level import core
+from battery_level.core import _HardWares, ieee_grouping, register_grouping_rule, source_prefix, split_hw_id
+
+
+def _record(hardware_type: int, device_id: str, idx: str = '1') -> dict:
+    """Enregistrement `type=devices` minimal"""
+    return {
+        'idx': idx, 'ID': device_id, 'Name': 'sensor', 'BatteryLevel': 80,
+        'HardwareType': 'Hardware', 'HardwareTypeVal': hardware_type, 'HardwareID': 3,
+        'LastUpdate': '2021-01-01 10:00:00'
+    }
+
+
+@pytest.fixture
+def hardwares(monkeypatch):
+    """Matériels vides; règles et regroupement IEEE rétablis après le test"""
+    for attr in ('materials', '_seen', '_cycles', '_fingerprints'):
+        monkeypatch.setattr(_HardWares, attr, {})
+    rules, fields = dict(core._GROUPING_RULES), dict(core._RULE_FIELDS)
+    yield _HardWares
+    core._GROUPING_RULES.clear()
+    core._GROUPING_RULES.update(rules)
+    core._RULE_FIELDS.clear()
+    core._RULE_FIELDS.update(fields)
+    ieee_grouping(())
+
+
+@pytest.mark.parametrize('hardware_type, device_id, hw_id', [
+    # identifiants d'avant le registre: ils sont les DeviceID des devices existants
+    (21, '0000AB01', '2103' + '00AB'),
+    (94, '0x00124b0012345678-01', '9403' + '008-'),
+    (1, '6A03', '0103' + '6A03'),
+    (15, '0x00124b0012345678', '1503' + '5678'),
+])
+def test_default_keys_keep_existing_hw_ids(hardwares, hardware_type, device_id, hw_id):
+    hardwares.update(_record(hardware_type, device_id))
+    assert list(hardwares.materials) == [hw_id]
+
+
+def test_ieee_grouping_is_opt_in_per_type(hardwares):
+    ieee_grouping((94,))
+    hardwares.update(_record(94, '0x00124b0012345678-01', '1'))
+    hardwares.update(_record(94, '0x00124b0012345678-02', '2'))
+    hardwares.update(_record(94, '0000AB01', '3'))
+    hardwares.update(_record(15, '0x00124b0012345678', '4'))
+    assert list(hardwares.materials) == ['940312345678', '940300AB', '15035678']
+
+
+@pytest.mark.parametrize('hw_id, prefix', [
+    ('21030012', ''),
+    ('9403008-', ''),
+    ('R2-9403008-', 'R2-'),
+    ('R12-21030012', 'R12-'),
+    ('my-own-device', ''),
+])
+def test_source_prefix_of_any_device_id(hw_id, prefix):
+    assert source_prefix(hw_id) == prefix
+
+
+def test_split_hw_id_with_dash_in_key():
+    assert split_hw_id('R2-9403008-') == ('R2-', 94, 3, '008-')
+    with pytest.raises(ValueError):
+        split_hw_id('my-own-device')
+
+
+def test_unchanged_record_is_skipped(hardwares):
+    record = _record(21, '0000AB01')
+    assert hardwares.update(record)
+    assert not hardwares.update(dict(record))
+    assert hardwares.record_hw_id(record) == '210300AB'
+
+
+@pytest.mark.parametrize('field, value', [
+    ('BatteryLevel', 60), ('LastUpdate', '2021-01-01 10:05:00'), ('Name', 'renamed'), ('ID', '0000CD01'),
+])
+def test_changed_field_is_processed_again(hardwares, field, value):
+    record = _record(21, '0000AB01')
+    hardwares.update(record)
+    assert hardwares.update(dict(record, **{field: value}))
+
+
+def test_rule_fields_are_fingerprinted(hardwares):
+    register_grouping_rule((77,), battery=lambda datas: float(datas['Data']), fields=('Data',))
+    record = dict(_record(77, '0000AB01'), Data='40')
+    hardwares.update(record)
+    assert not hardwares.update(dict(record))
+    assert hardwares.update(dict(record, Data='30'))
+    assert hardwares.materials['7703AB01'][0] == 30
+
+
+def test_compile_rules_clears_the_cache(hardwares):
+    record = _record(94, '0x00124b0012345678')
+    hardwares.update(record)
+    assert list(hardwares.materials) == ['94030056']
+    ieee_grouping((94,))
+    assert hardwares.update(dict(record))
+    assert '940312345678' in hardwares.materials
+
+
+def test_reused_idx_after_eviction_is_processed_again(hardwares):
+    record = _record(21, '0000AB01')
+    hardwares.update(record)
+    assert hardwares.end_cycle('', max_age=1) == []
+    assert hardwares.end_cycle('', max_age=1) == ['210300AB']
+    assert not hardwares.materials
+    assert hardwares.update(dict(record))
+    assert list(hardwares.materials) == ['210300AB']
+    hardwares.update(_record(21, '0000CD01'))
+    assert hardwares.record_hw_id(record) == '210300CD'
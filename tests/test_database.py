@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Tests de la lecture directe de la base Domoticz"""
+
+# standard libs
+import json
+import os
+import sqlite3
+from time import sleep, time
+
+# third party libs
+import pytest
+
+# local libs
+# pylint:disable=protected-access
+from battery_level.core import _HardWares
+from battery_level.database import DeviceDatabase, UnknownHardwareType
+from battery_level.sources import Source
+from battery_level.worker import CHANGES, DATABASE_ERROR, Worker
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def _answer() -> dict:
+    """Réponse `type=devices&used=true` correspondant à la base de test"""
+    with open(os.path.join(FIXTURES, 'devices.json'), encoding='utf-8') as json_file:
+        return json.load(json_file)
+
+
+@pytest.fixture
+def database(monkeypatch, tmp_path):
+    """domoticz.db de test, libellés des types de matériel oubliés"""
+    monkeypatch.setattr(DeviceDatabase, '_hardware_types', {})
+    path = str(tmp_path / 'domoticz.db')
+    connection = sqlite3.connect(path)
+    with open(os.path.join(FIXTURES, 'domoticz.sql'), encoding='utf-8') as sql_file:
+        connection.executescript(sql_file.read())
+    connection.close()
+    database = DeviceDatabase(path)
+    yield database
+    database.close()
+
+
+def _results(worker: Worker) -> list:
+    """Résultats du thread de traitement, attendus au plus une seconde"""
+    deadline = time() + 1
+    while time() < deadline:
+        results = list(worker.results())
+        if results:
+            return results
+        sleep(0.01)
+    return []
+
+
+def test_records_match_the_api_answer(database):
+    answer = _answer()['result']
+    DeviceDatabase.learn(answer)
+    expected = [
+        {key: record[key] for key in (
+            'idx', 'ID', 'Name', 'BatteryLevel', 'LastUpdate', 'HardwareID', 'HardwareTypeVal', 'HardwareType'
+        )}
+        for record in answer
+        if 0 < record['BatteryLevel'] <= 100
+    ]
+    assert sorted(database.records(), key=lambda record: record['idx']) == expected
+    # matériel désactivé (idx 7): absent de la réponse de l'api comme de la base
+    assert '7' not in {record['idx'] for record in answer}
+
+
+def test_records_give_the_api_hw_ids(database, monkeypatch):
+    for attr in ('materials', '_seen', '_cycles', '_fingerprints'):
+        monkeypatch.setattr(_HardWares, attr, {})
+    answer = _answer()['result']
+    DeviceDatabase.learn(answer)
+    for record in answer:
+        _HardWares.update(record)
+    from_api = dict(_HardWares.materials)
+    _HardWares.materials.clear()
+    _HardWares._fingerprints.clear()
+    for record in database.records():
+        _HardWares.update(record)
+    assert _HardWares.materials == from_api
+
+
+def test_unknown_hardware_type_needs_the_api(database):
+    DeviceDatabase.learn([record for record in _answer()['result'] if record['HardwareID'] != 5])
+    with pytest.raises(UnknownHardwareType, match='Zigbee'):
+        database.records()
+    labels = {record['HardwareID']: record['HardwareType'] for record in database.records(hardware_names=True)}
+    assert labels[5] == 'Zigbee'
+    assert labels[3] == 'OpenZWave USB'
+
+
+def test_missing_database_raises_sqlite_error(tmp_path):
+    with pytest.raises(sqlite3.Error):
+        DeviceDatabase(str(tmp_path / 'missing.db')).records()
+    assert not os.path.exists(str(tmp_path / 'missing.db'))
+
+
+def test_worker_falls_back_then_reads_the_database(database, devices):
+    source = Source(0, '127.0.0.1', '8080')
+    worker = Worker()
+    worker.start()
+    try:
+        worker.submit(source, database)
+        [(_, kind, error, _)] = _results(worker)
+        assert kind == DATABASE_ERROR and isinstance(error, UnknownHardwareType)
+        # la réponse de l'api apprend les libellés: la base suffit ensuite
+        worker.submit(source, json.dumps(_answer()).encode())
+        assert [kind for _, kind, _, _ in _results(worker)] == [CHANGES]
+        worker.submit(source, database)
+        [(_, kind, changes, partial)] = _results(worker)
+        assert kind == CHANGES and not partial and not changes.partial
+        worker.submit(source, DeviceDatabase(database.path + '.missing'))
+        [(_, kind, error, _)] = _results(worker)
+        assert kind == DATABASE_ERROR and isinstance(error, sqlite3.Error)
+    finally:
+        worker.stop()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Tests de la collection des devices (agrégation, sources)"""
+
+# third party libs
+import pytest
+
+# local libs
+# pylint:disable=protected-access
+from battery_level import devices as devices_module
+from battery_level.core import _Bounces
+from tools import domoticz_stub
+from tests.conftest import records
+
+
+def test_full_poll_only_touches_its_source(devices, monkeypatch):
+    devices.apply_changes(devices.compute_changes(records(3), ''))
+    devices.apply_changes(devices.compute_changes(records(2), 'R1-'))
+    samples = []
+    monkeypatch.setattr(
+        devices_module.History, 'append', lambda hw_id, *_args, **_kwargs: samples.append(hw_id)
+    )
+    changes = devices.compute_changes(records(2, lambda index: 40), 'R1-')
+    assert changes.levels and all(hw_id.startswith('R1-') for hw_id in changes.levels)
+    assert samples and all(hw_id.startswith('R1-') for hw_id in samples)
+
+
+def test_unreported_device_of_polled_source_goes_down(devices):
+    for unit, hw_id in ((1, '21030009'), (2, 'R1-21030009')):
+        device = domoticz_stub.Device(Name=hw_id, Unit=unit, DeviceID=hw_id)
+        device.sValue = '60'
+        device.Create()
+    devices(domoticz_stub.Devices)
+    devices.compute_changes(records(2), '')
+    levels = {hw_id: device.bat_lev for hw_id, device in devices._map_devices.items()}
+    assert levels['21030009'] < 60
+    assert levels['R1-21030009'] == 60
+
+
+def test_start_with_foreign_device_ids(devices):
+    for unit, hw_id in enumerate(('9403008-', 'R2-9403008-', 'my-own-device'), 1):
+        domoticz_stub.Device(Name=hw_id, Unit=unit, DeviceID=hw_id).Create()
+    devices(domoticz_stub.Devices)
+    assert devices.source_hw_ids('R2-') == ['R2-9403008-']
+    assert devices.source_hw_ids('') == ['9403008-', 'my-own-device']
+
+
+def test_vanished_device_kept_by_default(devices):
+    devices.apply_changes(devices.compute_changes(records(2), ''))
+    for _ in range(3000):
+        devices.compute_changes(records(1), '')
+    assert '21030001' in devices._map_devices
+
+
+def test_store_toggle_keeps_the_smoothing_window(devices):
+    pytest.importorskip('numpy')
+    bounces = [_Bounces(2, 0, 100, 25) for _ in range(3)]
+    for step, level in enumerate((80, 60, 40, 70, 65, 90, 30, 55, 45, 85, 25, 60, 75, 50, 35)):
+        if step % 5 == 2:
+            devices.configure_store(devices._store is None)
+        devices.compute_changes(records(3, lambda index, level=level: level - 10 * index), '')
+        for index, bounce in enumerate(bounces):
+            bounce._update(level - 10 * index)
+        assert [device.bat_lev for device in devices._map_devices.values()] == pytest.approx(
+            [bounce.last_value_out for bounce in bounces]
+        )
+
+
+def test_store_reports_only_changed_rows(devices, monkeypatch):
+    pytest.importorskip('numpy')
+    devices.configure_store(True)
+    devices.compute_changes(records(3), '')
+    samples = []
+    monkeypatch.setattr(
+        devices_module.History, 'append', lambda hw_id, *_args, **_kwargs: samples.append(hw_id)
+    )
+    devices.compute_changes(records(3), '')
+    assert not samples
+    devices.compute_changes(records(3, lambda index: 40 if index == 1 else 50), '')
+    assert samples == [devices.record_hw_id(records(3)[1], '')]
+
+
+@pytest.mark.parametrize('columnar', [False, True], ids=['deque', 'columnar'])
+def test_unchanged_records_skip_settled_devices(devices, monkeypatch, columnar):
+    if columnar:
+        pytest.importorskip('numpy')
+        devices.configure_store(True)
+    devices.compute_changes(records(3), '')
+    calls = {'samples': [], 'reports': [], 'stats': []}
+
+    def spy(owner: object, name: str, key: str) -> None:
+        """Consigne le hw_id de chaque appel de 'owner.name'"""
+        original = getattr(owner, name)
+
+        def call(hw_id, *args, **kwargs):
+            calls[key].append(hw_id)
+            return original(hw_id, *args, **kwargs)
+        monkeypatch.setattr(owner, name, call)
+
+    spy(devices_module.History, 'append', 'samples')
+    spy(devices._deadlines, 'report', 'reports')
+    spy(devices._stats, 'set', 'stats')
+    changed = records(3, lambda index: 40 if index == 1 else 50)
+    hw_id = devices.record_hw_id(records(3)[1], '')
+    devices.compute_changes(changed, '')
+    assert calls == {'samples': [hw_id], 'reports': [hw_id], 'stats': [hw_id]}
+    # enregistrement inchangé: pas de rapport, mais un échantillon par relève jusqu'à fenêtre stable
+    for poll in range(1, 13):
+        calls = {key: [] for key in calls}
+        changes = devices.compute_changes(changed, '')
+        assert len(changes.levels) == 3
+        assert calls == {'samples': [hw_id], 'reports': [], 'stats': [hw_id]} if poll < 12 else (
+            {'samples': [], 'reports': [], 'stats': []}
+        )
+    assert devices._map_devices[hw_id].bat_lev == 40
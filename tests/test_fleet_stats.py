@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Tests des statistiques du parc (arbre de Fenwick), comparées à un calcul direct"""
+
+# standard libs
+import random
+from bisect import bisect_left
+from itertools import accumulate
+from math import ceil
+
+# third party libs
+import pytest
+
+# local libs
+from battery_level.fleet_stats import FenwickTree, FleetStats
+
+
+def _bucket(bat_lev: float) -> int:
+    """Case (pas de 0,1%) du niveau"""
+    return min(1000, max(0, int(round(bat_lev * 10))))
+
+
+@pytest.mark.parametrize('size', [1, 2, 5, 8, 13, 1001])
+def test_fenwick_tree_matches_a_list(size):
+    rand = random.Random(size)
+    tree, cells = FenwickTree(size), [0] * size
+    for _ in range(500):
+        index, delta = rand.randrange(size), rand.choice((1, 1, 2, -1))
+        if cells[index] + delta < 0:
+            continue
+        tree.add(index, delta)
+        cells[index] += delta
+        prefixes = list(accumulate(cells))
+        assert all(tree.prefix(index) == prefixes[index] for index in range(0, size, max(1, size // 20)))
+        for rank in range(1, prefixes[-1] + 1, max(1, prefixes[-1] // 10)):
+            assert tree.find(rank) == bisect_left(prefixes, rank)
+
+
+def test_fleet_stats_match_a_full_sort():
+    rand = random.Random(44)
+    stats, levels, dead = FleetStats(), {}, set()
+    hw_ids = ['2103{:04X}'.format(index) for index in range(60)]
+    for step in range(2000):
+        hw_id = rand.choice(hw_ids)
+        action = rand.random()
+        if action < 0.1:
+            stats.discard(hw_id)
+            levels.pop(hw_id, None)
+            dead.discard(hw_id)
+        elif action < 0.2:
+            stats.set(hw_id, 0, True)
+            levels.pop(hw_id, None)
+            dead.add(hw_id)
+        else:
+            bat_lev = rand.choice((0, 100, 25, 24.96, rand.uniform(0, 100)))
+            stats.set(hw_id, bat_lev)
+            levels[hw_id] = bat_lev
+            dead.discard(hw_id)
+        buckets = sorted(_bucket(bat_lev) for bat_lev in levels.values())
+        assert len(stats) == len(buckets)
+        assert stats.dead == dead
+        for ratio in (0, 0.1, 0.5, 0.9, 1):
+            expected = buckets[max(1, ceil(ratio * len(buckets))) - 1] / 10 if buckets else None
+            assert stats.quantile(ratio) == expected, (step, ratio)
+        for bat_lev in (0, 10, 25, 24.96, 99.95, 100):
+            assert stats.count_below(bat_lev) == sum(bucket <= _bucket(bat_lev) for bucket in buckets)
+
+
+def test_summary_counts_empty_and_dead():
+    stats = FleetStats()
+    for hw_id, bat_lev in (('a', 10), ('b', 25), ('c', 60), ('d', 90)):
+        stats.set(hw_id, bat_lev)
+    stats.set('c', 0, True)
+    stats.set('e', 0, True)
+    stats.discard('e')
+    assert stats.summary(25) == {'min': 10.0, 'p10': 10.0, 'median': 25.0, 'empty': 2, 'dead': 1}
+    # un device revenu en service retrouve sa place dans l'arbre
+    stats.set('c', 60)
+    assert stats.summary(25) == {'min': 10.0, 'p10': 10.0, 'median': 25.0, 'empty': 2, 'dead': 0}
+    assert FleetStats().summary(25) == {'min': None, 'p10': None, 'median': None, 'empty': 0, 'dead': 0}
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Tests de l'historique des niveaux (fichiers anneau)"""
+
+# standard libs
+import os
+
+# third party libs
+import pytest
+
+# local libs
+from battery_level.history import History, HistoryReader, HistoryRing
+
+
+def _open_fds() -> int:
+    """Nombre de descripteurs ouverts par le processus"""
+    return len(os.listdir('/proc/self/fd'))
+
+
+def test_ring_wraps_in_chronological_order(tmp_path):
+    ring = HistoryRing(str(tmp_path / 'a.hist'), capacity=4)
+    for epoch in range(6):
+        ring.append(epoch, epoch, epoch / 2)
+    assert len(ring) == 4
+    assert [sample[0] for sample in ring.range()] == [2, 3, 4, 5]
+    assert [sample[0] for sample in ring.range(3, 5)] == [3, 4]
+    assert ring.downsample(2) == [(2, 2.5, 1.25), (4, 4.5, 2.25)]
+    ring.close()
+
+
+def test_ring_reopens_existing_file(tmp_path):
+    path = str(tmp_path / 'a.hist')
+    ring = HistoryRing(path, capacity=4)
+    ring.append(1, 10, 10)
+    ring.close()
+    ring = HistoryRing(path, capacity=100)
+    assert ring.capacity == 4
+    assert list(ring.range()) == [(1, 10, 10)]
+    ring.close()
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason='/proc absent')
+def test_ring_keeps_a_single_descriptor(tmp_path):
+    before = _open_fds()
+    rings = [HistoryRing(str(tmp_path / '{}.hist'.format(index)), capacity=8) for index in range(10)]
+    assert _open_fds() - before == 10
+    for ring in rings:
+        ring.close()
+    assert _open_fds() == before
+
+
+def test_reader_follows_the_writer(tmp_path):
+    path = str(tmp_path / 'a.hist')
+    ring = HistoryRing(path, capacity=4)
+    ring.append(1, 10, 10)
+    with HistoryReader(path) as reader:
+        assert len(reader) == 1
+        for epoch in range(2, 7):
+            ring.append(epoch, epoch, epoch)
+        assert [sample[0] for sample in reader.range()] == [3, 4, 5, 6]
+    ring.close()
+
+
+def test_reader_never_creates_or_alters(tmp_path):
+    path = tmp_path / 'absent.hist'
+    with pytest.raises(OSError):
+        HistoryReader(str(path))
+    assert not path.exists()
+    path.write_bytes(b'garbage' * 10)
+    with pytest.raises(ValueError):
+        HistoryReader(str(path))
+    assert path.read_bytes() == b'garbage' * 10
+
+
+def test_invalid_file_is_recreated(tmp_path):
+    History.setup(str(tmp_path), 8)
+    path = History.path('R1-0001')
+    with open(path, 'wb') as bad_file:
+        bad_file.write(b'\0' * 64)
+    History.append('R1-0001', 50, 50, epoch=1)
+    assert list(History.ring('R1-0001').range()) == [(1, 50, 50)]
+    History.setup('', 0)
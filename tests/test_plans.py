@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Tests de l'ordre du plan (index par dichotomie, positions à revoir), comparé à un tri complet"""
+
+# standard libs
+import random
+from typing import List, Mapping, Optional, Tuple
+
+# third party libs
+import pytest
+
+# local libs
+# pylint:disable=protected-access
+from battery_level.devices import Devices
+from battery_level.plans import Plans, _OrderedDevices
+from battery_level.plugin_config import PluginConfig
+
+
+class _Fleet:
+    """Devices du plan: (idx Domoticz, nom, niveau) par hw_id, changements en attente"""
+
+    def __init__(self: object, rand: random.Random, count: int) -> None:
+        """Initialisation de la classe"""
+        self.rand = rand
+        self.next_devidx = 100
+        self.devices: Mapping[str, Tuple[int, str, float]] = {}
+        self.dirty: set = set()
+        for _ in range(count):
+            self.add()
+        self.dirty = set()
+
+    def add(self: object) -> None:
+        """Nouveau device"""
+        self.next_devidx += 1
+        self.devices['2103{:04X}'.format(self.next_devidx)] = (
+            self.next_devidx, 'room {}'.format(self.rand.randrange(10)), self.level()
+        )
+        self.dirty.add('2103{:04X}'.format(self.next_devidx))
+
+    def level(self: object) -> float:
+        """Niveau affiché, avec des égalités"""
+        return self.rand.choice((10.0, 50.0, 100.0, round(self.rand.uniform(0, 100), 1)))
+
+    def change(self: object) -> None:
+        """Niveau, nom ou idx changé, device ajouté ou supprimé"""
+        action = self.rand.random()
+        hw_id = self.rand.choice(sorted(self.devices))
+        devidx, name, bat_lev = self.devices[hw_id]
+        if action < 0.1:
+            self.add()
+            return
+        if action < 0.2:
+            del self.devices[hw_id]
+        elif action < 0.25:
+            self.next_devidx += 1
+            self.devices[hw_id] = (self.next_devidx, name, bat_lev)
+        elif action < 0.35:
+            self.devices[hw_id] = (devidx, 'room {}'.format(self.rand.randrange(10)), bat_lev)
+        elif action < 0.9:
+            self.devices[hw_id] = (devidx, name, self.level())
+        self.dirty.add(hw_id)
+
+    def plan_entries(self: object) -> List[Tuple[str, int, str, float]]:
+        """Équivalent de `Devices.plan_entries`"""
+        self.dirty = set()
+        return [(hw_id,) + device for hw_id, device in self.devices.items()]
+
+    def plan_changes(self: object) -> List[Tuple[str, Optional[int], str, float]]:
+        """Équivalent de `Devices.plan_changes`"""
+        dirty, self.dirty = self.dirty, set()
+        return [(hw_id,) + self.devices.get(hw_id, (None, '', 0.0)) for hw_id in dirty]
+
+
+@pytest.fixture(params=[False, True], ids=['ascending', 'descending'])
+def fleet(request, monkeypatch):
+    """Parc aléatoire servant de `Devices`, index du plan vierge"""
+    monkeypatch.setattr(PluginConfig, 'sort_descending', request.param)
+    for attr, value in (('ordered_list', []), ('_items', []), ('_keys', []), ('_device_dict', {}), ('_hw_ids', {})):
+        monkeypatch.setattr(_OrderedDevices, attr, value)
+    fleet = _Fleet(random.Random(47), 40)
+    monkeypatch.setattr(Devices, 'plan_entries', fleet.plan_entries)
+    monkeypatch.setattr(Devices, 'plan_changes', fleet.plan_changes)
+    _OrderedDevices()
+    return fleet
+
+
+def _keys(items: list) -> List[Tuple[float, str]]:
+    """Clés de tri dans l'ordre donné"""
+    return [(item.bat_lev, item.name) for item in items]
+
+
+def _expected(fleet: _Fleet) -> List[Tuple[float, str]]:
+    """Ordre d'affichage par tri complet"""
+    return sorted(
+        ((bat_lev, name) for _, name, bat_lev in fleet.devices.values()), reverse=PluginConfig.sort_descending
+    )
+
+
+def _sorted_plan(plan: List[int], span: Optional[Tuple[int, int]]) -> int:
+    """Trie le plan comme Domoticz, un cran par déplacement; renvoie le nombre de déplacements"""
+    moves = 0
+    while True:
+        datas = [{'devidx': str(devidx), 'idx': str(devidx)} for devidx in plan]
+        move = Plans._find_move(_OrderedDevices.values(), datas, span)
+        assert move == Plans._find_move(_OrderedDevices.values(), datas)
+        if move is None:
+            return moves
+        down, plan_device = move
+        row = plan.index(int(plan_device['devidx']))
+        other = row + 1 if down else row - 1
+        plan[row], plan[other] = plan[other], plan[row]
+        moves += 1
+        assert moves < 10000
+
+
+def test_sync_matches_a_full_sort(fleet):
+    for _ in range(300):
+        before = [item.devidx for item in _OrderedDevices.values()]
+        for _ in range(fleet.rand.randint(0, 3)):
+            fleet.change()
+        span = _OrderedDevices.sync()
+        after = [item.devidx for item in _OrderedDevices.values()]
+        assert _keys(_OrderedDevices.values()) == _expected(fleet)
+        assert sorted(after) == sorted(devidx for devidx, _, _ in fleet.devices.values())
+        # hors des positions renvoyées, l'ordre d'affichage est inchangé
+        changed = [
+            index for index in range(max(len(before), len(after)))
+            if index >= len(before) or index >= len(after) or before[index] != after[index]
+        ]
+        if span is None:
+            assert not changed
+        elif after:
+            assert all(span[0] <= index for index in changed)
+            assert all(index <= span[1] for index in changed if index < len(after))
+
+
+def test_find_move_within_span_sorts_the_plan(fleet):
+    plan = [item.devidx for item in _OrderedDevices.values()]
+    for _ in range(100):
+        for _ in range(fleet.rand.randint(1, 3)):
+            fleet.change()
+        span = _OrderedDevices.sync()
+        # Domoticz retire les devices supprimés du plan, les nouveaux sont ajoutés à la fin
+        present = {item.devidx for item in _OrderedDevices.values()}
+        plan = [devidx for devidx in plan if devidx in present]
+        plan.extend(devidx for devidx in sorted(present - set(plan)))
+        _sorted_plan(plan, span)
+        assert plan == [item.devidx for item in _OrderedDevices.values()]
+
+
+def test_hand_reorder_of_a_sorted_plan_is_corrected(fleet, monkeypatch):
+    moves = []
+    monkeypatch.setattr(Plans, '_move', classmethod(lambda cls, plan_row, down: moves.append((plan_row, down))))
+    monkeypatch.setattr(Plans, 'update', classmethod(lambda cls, force=False: None))
+    monkeypatch.setattr(Plans, '_status', Plans.GET_PLAN_DEVICES)
+    monkeypatch.setattr(Plans, '_plan_sorted', True)
+    monkeypatch.setattr(Plans, '_span', None)
+    plan = [item.devidx for item in _OrderedDevices.values()]
+    Plans._order_plan_devices([{'devidx': str(devidx), 'idx': str(devidx)} for devidx in plan])
+    assert not moves
+    # déplacement manuel dans l'interface, plan pourtant marqué trié
+    plan.insert(5, plan.pop(20))
+    Plans._order_plan_devices([{'devidx': str(devidx), 'idx': str(devidx)} for devidx in plan])
+    assert moves
+
+
+@pytest.mark.parametrize('plan_sorted, span', [(True, None), (False, None), (True, (3, 4))])
+def test_rename_moves_only_a_plan_known_sorted(fleet, monkeypatch, plan_sorted, span):
+    moves = []
+    monkeypatch.setattr(Plans, '_move', classmethod(lambda cls, plan_row, down: moves.append((plan_row, down))))
+    monkeypatch.setattr(PluginConfig, 'sort_plan', True)
+    monkeypatch.setattr(Plans, '_status', Plans.GET_PLAN_DEVICES)
+    monkeypatch.setattr(Plans, '_plan_sorted', plan_sorted)
+    monkeypatch.setattr(Plans, '_span', span)
+    monkeypatch.setattr(Plans, '_plan_rows', {item.devidx: str(item.devidx) for item in _OrderedDevices.values()})
+    ordered = _OrderedDevices.values()
+    # device suivi d'un autre de même niveau: le nouveau nom le déplace dans son groupe
+    first = next(index for index in range(len(ordered) - 1) if ordered[index].bat_lev == ordered[index + 1].bat_lev)
+    devidx = ordered[first + 1 if PluginConfig.sort_descending else first].devidx
+    old = [item.devidx for item in ordered].index(devidx)
+    Plans.device_modified(devidx, 'zzz')
+    new = [item.devidx for item in _OrderedDevices.values()].index(devidx)
+    assert new != old
+    if plan_sorted and span is None:
+        assert moves == [(str(devidx), new > old)] * abs(new - old)
+    else:
+        assert not moves
+    assert Plans._span[0] <= min(old, new) and max(old, new) <= Plans._span[1]
+    # second renommage avant le prochain cycle de tri: déplacements en vol, rien n'est ajouté
+    moves.clear()
+    Plans.device_modified(devidx, '')
+    assert not moves
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Tests du thread de traitement et de l'application de ses résultats"""
+
+# standard libs
+import json
+from time import sleep, time
+
+# local libs
+# pylint:disable=protected-access
+from battery_level.sources import Source
+from battery_level.worker import CHANGES, DATAS, Worker
+from battery_level.wrapper import Wrapper
+from tests.conftest import records
+
+
+def _results(worker: Worker, count: int) -> list:
+    """'count' résultats du thread de traitement, attendus au plus une seconde"""
+    results = []
+    deadline = time() + 1
+    while len(results) < count and time() < deadline:
+        results.extend(worker.results())
+        sleep(0.01)
+    return results
+
+
+def test_results_carry_the_partial_flag(devices):
+    source = Source(0, '127.0.0.1', '8080')
+    worker = Worker()
+    worker.start()
+    try:
+        answer = {'status': 'OK', 'title': 'Devices', 'result': records(1)}
+        worker.submit(source, json.dumps(answer).encode(), True)
+        worker.submit(source, json.dumps({'status': 'ERR', 'title': 'Devices'}).encode(), True)
+        worker.submit(source, json.dumps({'status': 'OK', 'title': 'Plans'}).encode())
+        assert [(kind, partial) for _, kind, _, partial in _results(worker, 3)] == [
+            (CHANGES, True), (DATAS, True), (DATAS, False)
+        ]
+    finally:
+        worker.stop()
+
+
+def test_decoded_answers_keep_the_partial_flag(devices, monkeypatch):
+    source = Source(0, '127.0.0.1', '8080')
+    wrapper = Wrapper()
+    wrapper._worker = Worker()
+    wrapper._worker._results.put((source, DATAS, {'status': 'OK', 'title': 'Devices'}, True))
+    wrapper._worker._results.put((source, DATAS, {'status': 'OK', 'title': 'Plans'}, False))
+    calls = []
+    monkeypatch.setattr(wrapper, '_on_datas', lambda datas, source, partial=False: calls.append(
+        (datas['title'], partial)
+    ))
+    wrapper._apply_worker_results()
+    assert calls == [('Devices', True), ('Plans', False)]
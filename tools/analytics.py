@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Analyse hors ligne de l'historique des batteries du parc
+
+Lit tout l'historique disponible, d'une des sources suivantes:
+
+    - base Domoticz: tables `Percentage_Calendar` (moyennes journalières) et
+      `Percentage` (journal court) des devices créés par le plugin, dont le
+      DeviceID est déjà le hw_id
+    - export JSON (liste de réponses `type=devices`) ou trace du plugin
+      (.jsonl.gz): les enregistrements sont regroupés par `_HardWares`,
+      comme dans le plugin
+
+Chaque device est analysé dans un processus du pool, en NumPy: courbe de
+décharge journalière, remplacements de pile, durées de vie observées,
+vitesse de décharge et date estimée du niveau vide. Les résultats sont
+agrégés par type de matériel (HardwareTypeVal du hw_id); les vitesses de
+décharge aberrantes de chaque type sont signalées (écart absolu médian):
+
+    python -m tools.analytics --db /opt/domoticz/domoticz.db
+    python -m tools.analytics --json snapshots.json --output report.json
+    python -m tools.analytics --trace trace-20210101-120000.jsonl.gz --workers 4
+"""
+
+# standard libs
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+from typing import Iterable, Iterator, List, Mapping, Optional, Tuple
+from urllib.request import pathname2url
+
+# optional libs
+try:
+    import numpy as np
+except ImportError:  # numpy absent: l'outil est indisponible
+    np = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint:disable=wrong-import-position,protected-access
+from battery_level.core import _HardWares, split_hw_id  # noqa: E402
+from battery_level.trace import read_trace  # noqa: E402
+
+# série d'un device: (hw_id, nom, epochs, niveaux)
+Series = Tuple[str, str, 'np.ndarray', 'np.ndarray']
+
+_HISTORY_QUERY = '''
+    SELECT DeviceRowID, Date, Percentage_Avg, 0 FROM Percentage_Calendar WHERE DeviceRowID IN ({devices})
+    UNION ALL
+    SELECT DeviceRowID, Date, Percentage, 1 FROM Percentage WHERE DeviceRowID IN ({devices})
+    ORDER BY 1
+'''
+_DEVICES_QUERY = '''
+    SELECT d.ID FROM DeviceStatus AS d JOIN Hardware AS h ON h.ID = d.HardwareID WHERE h.Extra = ?
+'''
+_REMOTE_CONNECTION = re.compile(r'_(\d+)$')
+_DAY = 86400
+
+
+def read_database(path: str, plugin_key: str = 'pyBattLev') -> List[Series]:
+    """Historique des devices du plugin dans la base Domoticz (lecture seule)
+
+    Le journal court remplace les moyennes journalières à partir de son
+    premier jour.
+    """
+    connection = sqlite3.connect('file:{}?mode=ro'.format(pathname2url(path)), uri=True)
+    try:
+        names = dict(connection.execute(
+            'SELECT d.ID, d.DeviceID || char(9) || d.Name FROM DeviceStatus AS d'
+            ' JOIN Hardware AS h ON h.ID = d.HardwareID WHERE h.Extra = ?',
+            (plugin_key,)
+        ).fetchall())
+        rows = connection.execute(
+            _HISTORY_QUERY.format(devices=_DEVICES_QUERY),
+            (plugin_key, plugin_key)
+        ).fetchall()
+    finally:
+        connection.close()
+    if not rows:
+        return []
+    row_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    epochs = np.array([row[1] for row in rows], dtype='datetime64[s]').astype(np.float64)
+    levels = np.array([row[2] for row in rows], dtype=np.float64)
+    short_log = np.array([row[3] for row in rows], dtype=bool)
+    series = []
+    unique_ids, starts = np.unique(row_ids, return_index=True)
+    for row_id, start, stop in zip(unique_ids, starts, np.append(starts[1:], len(rows))):
+        hw_id, _, name = names.get(int(row_id), '').partition('\t')
+        if not _is_battery(hw_id):
+            continue
+        device_epochs, device_levels = epochs[start:stop], levels[start:stop]
+        device_short = short_log[start:stop]
+        if device_short.any():
+            first_day = device_epochs[device_short].min() // _DAY * _DAY
+            kept = device_short | (device_epochs < first_day)
+            device_epochs, device_levels = device_epochs[kept], device_levels[kept]
+        series.append((hw_id, name, device_epochs, device_levels))
+    return series
+
+
+def json_snapshots(path: str) -> Iterator[Tuple[str, List[dict]]]:
+    """Export JSON: une réponse `type=devices`, ou une liste de réponses ou de listes d'enregistrements"""
+    with open(path, encoding='utf-8') as export:
+        datas = json.load(export)
+    for snapshot in datas if isinstance(datas, list) and datas and not _is_record(datas[0]) else [datas]:
+        yield '', snapshot.get('result', []) if isinstance(snapshot, dict) else snapshot
+
+
+def trace_snapshots(path: str) -> Iterator[Tuple[str, List[dict]]]:
+    """Trace du plugin: réponses `type=devices`, avec le préfixe de leur source"""
+    for event in read_trace(path):
+        if event.get('ev') != 'in' or event.get('status') != '200':
+            continue
+        try:
+            datas = json.loads(event['data'])
+        except ValueError:
+            continue
+        if datas.get('title') == 'Devices':
+            match = _REMOTE_CONNECTION.search(event['conn'])
+            yield 'R{}-'.format(match.group(1)) if match else '', datas.get('result', [])
+
+
+def group_snapshots(snapshots: Iterable[Tuple[str, List[dict]]]) -> List[Series]:
+    """Regroupement des enregistrements par matériel, comme dans le plugin
+
+    Chaque instantané met à jour `_HardWares`; un échantillon par matériel
+    et par date de mise à jour est retenu.
+    """
+    samples: Mapping[str, Mapping[float, float]] = {}
+    names: Mapping[str, str] = {}
+    for prefix, records in snapshots:
+        for datas in records:
+            if 'BatteryLevel' in datas:
+                _HardWares.update(datas, prefix)
+        for hw_id, bat_lev, name, last_update in _HardWares.items():
+            samples.setdefault(hw_id, {})[last_update.timestamp()] = bat_lev
+            names[hw_id] = name
+    return [(
+        hw_id,
+        names[hw_id],
+        np.fromiter(device_samples.keys(), dtype=np.float64, count=len(device_samples)),
+        np.fromiter(device_samples.values(), dtype=np.float64, count=len(device_samples))
+    ) for hw_id, device_samples in samples.items()]
+
+
+def analyse_device(
+        series: Series,
+        empty_level: float = 25.0,
+        jump: float = 20.0,
+        with_curve: bool = False) -> dict:
+    """Analyse d'un device (exécutée dans un processus du pool)
+
+    Args:
+
+        - series (tuple): (hw_id, nom, epochs, niveaux)
+        - empty_level (float): niveau vide (%)
+        - jump (float): hausse journalière (points) comptée comme un remplacement de pile
+        - with_curve (bool): ajoute la courbe journalière au résultat
+    """
+    hw_id, name, epochs, levels = series
+    order = np.argsort(epochs, kind='stable')
+    epochs, levels = epochs[order], levels[order]
+    # courbe journalière: moyenne des échantillons de chaque jour
+    days, starts = np.unique((epochs // _DAY).astype(np.int64), return_index=True)
+    curve = np.add.reduceat(levels, starts) / np.diff(np.append(starts, len(levels)))
+    # remplacements: hausse d'un jour à l'autre d'au moins 'jump' points
+    replaced = np.nonzero(np.diff(curve) >= jump)[0] + 1
+    lifetimes = np.diff(days[replaced])
+    # pente de décharge depuis le dernier remplacement (moindres carrés)
+    start = replaced[-1] if len(replaced) else 0
+    rate = None
+    if len(curve) - start >= 2:
+        rate = -float(np.polyfit(days[start:] - days[start], curve[start:], 1)[0])
+    empty_date = None
+    if curve[-1] <= empty_level:
+        empty_date = int(days[-1])
+    elif rate is not None and rate > 0:
+        empty_date = int(days[-1] + np.ceil((curve[-1] - empty_level) / rate))
+    try:
+        hardware_type = split_hw_id(hw_id)[1]
+    except ValueError:
+        hardware_type = None
+    result = {
+        'hw_id': hw_id,
+        'name': name,
+        'hardware_type': hardware_type,
+        'brand': name.partition(':')[0] if ':' in name else '',
+        'samples': len(levels),
+        'first': _date(days[0]),
+        'last': _date(days[-1]),
+        'level': round(float(curve[-1]), 1),
+        'discharge_rate': None if rate is None else round(rate, 4),
+        'replacements': len(replaced),
+        'lifetimes': lifetimes.tolist(),
+        'empty_date': None if empty_date is None else _date(empty_date)
+    }
+    if with_curve:
+        result['curve'] = [[_date(day), round(float(level), 1)] for day, level in zip(days, curve)]
+    return result
+
+
+def hardware_summary(
+        results: List[dict],
+        empty_level: float = 25.0,
+        threshold: float = 3.5,
+        tolerance: float = 0.5) -> Tuple[List[dict], List[dict]]:
+    """Durée de vie par type de matériel et vitesses de décharge aberrantes
+
+    Une vitesse est aberrante si son score z robuste (écart absolu médian)
+    dépasse 'threshold' parmi les devices du même type et si elle s'écarte
+    de la médiane de plus de 'tolerance' (relatif): un parc homogène n'a
+    pas d'aberration pour quelques centièmes de point par jour.
+
+    Returns:
+
+        - tuple: (synthèse par type, devices aberrants)
+    """
+    groups: Mapping[Tuple[Optional[int], str], List[dict]] = {}
+    for result in results:
+        groups.setdefault((result['hardware_type'], result['brand']), []).append(result)
+    summary, outliers = [], []
+    for (hardware_type, brand), devices in sorted(groups.items(), key=lambda item: (str(item[0][0]), item[0][1])):
+        rated = [device for device in devices if device['discharge_rate'] is not None]
+        rates = np.array([device['discharge_rate'] for device in rated], dtype=np.float64)
+        lifetimes = np.array([life for device in devices for life in device['lifetimes']], dtype=np.float64)
+        median_rate = float(np.median(rates)) if len(rates) else None
+        summary.append({
+            'hardware_type': hardware_type,
+            'brand': brand,
+            'devices': len(devices),
+            'median_discharge_rate': None if median_rate is None else round(median_rate, 4),
+            'observed_lifetimes': len(lifetimes),
+            'median_lifetime_days': float(np.median(lifetimes)) if len(lifetimes) else None,
+            'estimated_lifetime_days': (
+                round((100 - empty_level) / median_rate) if median_rate is not None and median_rate > 0 else None
+            )
+        })
+        if len(rates) < 3:
+            continue
+        deviation = np.median(np.abs(rates - median_rate))
+        if deviation == 0:
+            continue
+        scores = 0.6745 * (rates - median_rate) / deviation
+        flagged = (np.abs(scores) > threshold) & (np.abs(rates - median_rate) > tolerance * abs(median_rate))
+        for index in np.nonzero(flagged)[0]:
+            outliers.append({
+                'hw_id': rated[index]['hw_id'],
+                'name': rated[index]['name'],
+                'discharge_rate': rated[index]['discharge_rate'],
+                'median_discharge_rate': round(median_rate, 4),
+                'score': round(float(scores[index]), 2)
+            })
+    return summary, outliers
+
+
+def analyse(
+        series: List[Series],
+        workers: Optional[int] = None,
+        **kwargs: dict) -> List[dict]:
+    """Analyse de tous les devices, en parallèle ('workers' processus; 1: sans pool)"""
+    function = partial(analyse_device, **kwargs)
+    if workers == 1:
+        return list(map(function, series))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunksize = max(1, len(series) // ((workers or os.cpu_count() or 1) * 4))
+        return list(pool.map(function, series, chunksize=chunksize))
+
+
+def report_text(results: List[dict], summary: List[dict], outliers: List[dict], horizon: int = 365) -> str:
+    """Rapport lisible: types de matériel, aberrations, devices à remplacer dans 'horizon' jours"""
+    lines = ['{:<6} {:<16} {:>7} {:>12} {:>12} {:>12}'.format(
+        'type', 'brand', 'devices', 'rate (%/d)', 'life (d)', 'estim. (d)'
+    )]
+    for group in summary:
+        lines.append('{:<6} {:<16} {:>7} {:>12} {:>12} {:>12}'.format(
+            str(group['hardware_type']), group['brand'][:16], group['devices'],
+            _text(group['median_discharge_rate']), _text(group['median_lifetime_days']),
+            _text(group['estimated_lifetime_days'])
+        ))
+    lines.append('')
+    lines.append('{} outlier(s):'.format(len(outliers)))
+    for outlier in outliers:
+        lines.append('  {:<24} {:<40} {:>8} %/d (median {}, score {})'.format(
+            outlier['hw_id'], outlier['name'][:40], outlier['discharge_rate'],
+            outlier['median_discharge_rate'], outlier['score']
+        ))
+    limit = _date(datetime.now().timestamp() // _DAY + horizon)
+    due = sorted(
+        (result for result in results if result['empty_date'] is not None and result['empty_date'] <= limit),
+        key=lambda result: result['empty_date']
+    )
+    lines.append('')
+    lines.append('{} device(s) empty within {} days:'.format(len(due), horizon))
+    for result in due:
+        lines.append('  {} {:<24} {:<40} {:>6} %'.format(
+            result['empty_date'], result['hw_id'], result['name'][:40], result['level']
+        ))
+    return '\n'.join(lines)
+
+
+def _is_battery(hw_id: str) -> bool:
+    """True pour un hw_id de device de batterie (les devices de commande sont exclus)"""
+    try:
+        split_hw_id(hw_id)
+    except ValueError:
+        return False
+    return True
+
+
+def _is_record(datas: object) -> bool:
+    """True pour un enregistrement de l'api (et non une réponse ou une liste)"""
+    return isinstance(datas, dict) and 'BatteryLevel' in datas
+
+
+def _date(day: float) -> str:
+    """Jour (depuis l'epoch) au format ISO"""
+    return str(np.datetime64(int(day), 'D'))
+
+
+def _text(value: Optional[float]) -> str:
+    """Valeur affichée"""
+    return '-' if value is None else str(value)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Point d'entrée"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--db', help='base Domoticz (domoticz.db)')
+    source.add_argument('--json', help='export JSON de réponses type=devices')
+    source.add_argument('--trace', help='trace du plugin (.jsonl.gz)')
+    parser.add_argument('--plugin-key', default='pyBattLev', help='clé du plugin dans la table Hardware')
+    parser.add_argument('--empty-level', type=float, default=25.0, help='niveau vide (%%)')
+    parser.add_argument('--jump', type=float, default=20.0, help='hausse journalière comptée comme un remplacement')
+    parser.add_argument('--threshold', type=float, default=3.5, help='score z robuste d\'une vitesse aberrante')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='écart relatif minimal d\'une vitesse aberrante')
+    parser.add_argument('--horizon', type=int, default=365, help='jours du plan de remplacement')
+    parser.add_argument('--workers', type=int, help='nombre de processus (défaut: nombre de coeurs; 1: sans pool)')
+    parser.add_argument('--curves', action='store_true', help='ajoute les courbes journalières au rapport JSON')
+    parser.add_argument('--output', help='rapport JSON')
+    args = parser.parse_args(argv)
+
+    if np is None:
+        sys.stderr.write('numpy est requis pour l\'analyse\n')
+        return 2
+    if args.db:
+        series = read_database(args.db, args.plugin_key)
+    else:
+        series = group_snapshots(json_snapshots(args.json) if args.json else trace_snapshots(args.trace))
+    results = analyse(
+        series, args.workers,
+        empty_level=args.empty_level, jump=args.jump, with_curve=args.curves
+    )
+    summary, outliers = hardware_summary(results, args.empty_level, args.threshold, args.tolerance)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump({'hardware_types': summary, 'outliers': outliers, 'devices': results}, output, indent=2)
+    print(report_text(results, summary, outliers, args.horizon))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Module `Domoticz` de substitution pour les outils hors Domoticz
+
+Reproduit le strict nécessaire de l'API du plugin (journal, images,
+devices, connexions, configuration) pour exécuter le code du plugin hors de
+l'interpréteur embarqué: bancs d'essai, rejeu de traces.
+
+    import sys
+    from tools import domoticz_stub
+    domoticz_stub.install()
+"""
+
+# standard libs
+import sys
+from itertools import count
+from time import strftime
+from typing import Any, List, Mapping, Optional, Tuple
+
+LOG: List[Tuple[str, str]] = []
+VERBOSE = False
+Devices: Mapping[int, 'Device'] = {}
+Images: Mapping[str, 'Image'] = {}
+_configuration: Mapping[str, Any] = {}
+_device_ids = count(1)
+_heartbeat = [10]
+
+
+def _log(kind: str) -> callable:
+    """Fonction de journalisation 'kind'"""
+    def log(message: str) -> None:
+        LOG.append((kind, message))
+        if VERBOSE or kind == 'error':
+            sys.stderr.write('{} {}: {}\n'.format(strftime('%H:%M:%S'), kind, message))
+    return log
+
+
+Debug = _log('debug')
+Log = _log('log')
+Status = _log('status')
+Error = _log('error')
+
+
+def Debugging(_level: int) -> None:  # pylint: disable=invalid-name
+    """Niveau de debug (sans effet)"""
+
+
+def Heartbeat(interval: Optional[int] = None) -> int:  # pylint: disable=invalid-name
+    """Période du heartbeat"""
+    if interval is not None:
+        _heartbeat[0] = interval
+    return _heartbeat[0]
+
+
+def Configuration(datas: Optional[dict] = None) -> dict:  # pylint: disable=invalid-name
+    """Configuration persistante du plugin"""
+    if datas is not None:
+        _configuration.clear()
+        _configuration.update(datas)
+    return dict(_configuration)
+
+
+class Image:
+    """Image personnalisée"""
+
+    def __init__(self: object, filename: str) -> None:
+        """Initialisation de la classe"""
+        self.Filename = filename  # pylint: disable=invalid-name
+        self.ID = 0  # pylint: disable=invalid-name
+
+    def Create(self: object) -> None:  # pylint: disable=invalid-name
+        """Création"""
+        self.ID = len(Images) + 1
+        Images[self.Filename.replace(' icons.zip', '')] = self
+
+
+class Device:  # pylint: disable=too-many-instance-attributes
+    """Device du plugin"""
+
+    def __init__(self: object, Name: str = '', Unit: int = 0, DeviceID: str = '', **kwargs: dict) -> None:  # pylint: disable=invalid-name
+        """Initialisation de la classe"""
+        self.Name = Name  # pylint: disable=invalid-name
+        self.Unit = Unit  # pylint: disable=invalid-name
+        self.DeviceID = DeviceID or str(Unit)  # pylint: disable=invalid-name
+        self.ID = 0  # pylint: disable=invalid-name
+        self.nValue = 0  # pylint: disable=invalid-name
+        self.sValue = '0'  # pylint: disable=invalid-name
+        self.Used = kwargs.get('Used', 0)  # pylint: disable=invalid-name
+        self.Image = kwargs.get('Image', 0)  # pylint: disable=invalid-name
+        self.LastUpdate = strftime('%Y-%m-%d %H:%M:%S')  # pylint: disable=invalid-name
+        self.Options = kwargs.get('Options', {})  # pylint: disable=invalid-name
+
+    def Create(self: object) -> None:  # pylint: disable=invalid-name
+        """Création"""
+        self.ID = next(_device_ids)
+        Devices[self.Unit] = self
+
+    def Update(self: object, nValue: int = 0, sValue: str = '', **kwargs: dict) -> None:  # pylint: disable=invalid-name
+        """Mise à jour"""
+        self.nValue = nValue
+        self.sValue = sValue
+        self.Name = kwargs.get('Name', self.Name)
+        self.Image = kwargs.get('Image', self.Image)
+        self.LastUpdate = strftime('%Y-%m-%d %H:%M:%S')
+
+    def Touch(self: object) -> None:  # pylint: disable=invalid-name
+        """Rafraîchissement"""
+        self.LastUpdate = strftime('%Y-%m-%d %H:%M:%S')
+
+    def Delete(self: object) -> None:  # pylint: disable=invalid-name
+        """Suppression"""
+        Devices.pop(self.Unit, None)
+
+
+class Connection:
+    """Connexion; les envois sont conservés dans `sent`"""
+
+    def __init__(self: object, Name: str = '', Transport: str = '', Protocol: str = '', Address: str = '', Port: str = '') -> None:  # pylint: disable=invalid-name,too-many-arguments
+        """Initialisation de la classe"""
+        self.Name = Name  # pylint: disable=invalid-name
+        self.Transport = Transport  # pylint: disable=invalid-name
+        self.Protocol = Protocol  # pylint: disable=invalid-name
+        self.Address = Address  # pylint: disable=invalid-name
+        self.Port = Port  # pylint: disable=invalid-name
+        self.Parent = None  # pylint: disable=invalid-name
+        self.sent: List[dict] = []
+
+    def Connected(self: object) -> bool:  # pylint: disable=invalid-name
+        """Toujours connectée"""
+        return True
+
+    def Connecting(self: object) -> bool:  # pylint: disable=invalid-name
+        """Jamais en cours de connexion"""
+        return False
+
+    def Connect(self: object) -> None:  # pylint: disable=invalid-name
+        """Connexion (sans effet)"""
+
+    def Listen(self: object) -> None:  # pylint: disable=invalid-name
+        """Écoute (sans effet)"""
+
+    def Disconnect(self: object) -> None:  # pylint: disable=invalid-name
+        """Déconnexion (sans effet)"""
+
+    def Send(self: object, datas: dict) -> None:  # pylint: disable=invalid-name
+        """Envoi"""
+        self.sent.append(datas)
+
+
+def install() -> None:
+    """Enregistre ce module comme module `Domoticz`"""
+    sys.modules.setdefault('Domoticz', sys.modules[__name__])
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Bancs d'essai des algorithmes du plugin
+
+Mesure les chemins critiques sur des données synthétiques de 10 à 100k
+éléments et écrit les résultats (JSON); compare à une référence pour
+détecter les régressions. Chaque mesure est le meilleur de plusieurs
+boucles d'appels (comme `timeit`), dans plusieurs processus; une
+régression est mesurée de nouveau avant d'être signalée:
+
+    python -m tools.microbench --output bench.json
+    python -m tools.microbench --compare baseline.json --threshold 1.5
+"""
+
+# standard libs
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from time import sleep
+from timeit import Timer
+from typing import Callable, List, Mapping, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# local libs
+from tools import domoticz_stub  # noqa: E402 pylint:disable=wrong-import-position
+
+domoticz_stub.install()
+
+# pylint:disable=wrong-import-position,protected-access
+from battery_level.core import _Bounces, _HardWares, last_update_2_datetime  # noqa: E402
+from battery_level.plans import Plans, _OrderedDevices, _OrderedListItem  # noqa: E402
+from battery_level.snapshot import Snapshot  # noqa: E402
+
+SIZES = (10, 100, 1000, 10000, 100000)
+_BOUNCE_MODES = {'DISABLED': 0, 'SYSTEMATIC': 1, 'POND_1H': 2, 'POND_1D': 4}
+
+
+def _records(size: int) -> List[dict]:
+    """Devices synthétiques, tels que renvoyés par l'api domoticz"""
+    rand = random.Random(size)
+    start = datetime(2021, 1, 1)
+    return [{
+        'idx': str(index),
+        'BatteryLevel': rand.randint(1, 100),
+        'HardwareType': rand.choice(('OpenZWave USB', 'RFXCOM', 'Zigbee2MQTT')),
+        'HardwareTypeVal': rand.choice((1, 21, 94)),
+        'HardwareID': rand.randint(1, 20),
+        'ID': '{:08X}'.format(index),
+        'Name': "Room {} - sensor {}".format(index // 3, index % 3),
+        'LastUpdate': (start + timedelta(seconds=index * 7)).strftime(r'%Y-%m-%d %H:%M:%S')
+    } for index in range(size)]
+
+
+def _bench_bounces(mode: int) -> Callable[[int], Callable[[], None]]:
+    """_Bounces._update dans le mode 'mode'; fenêtre vierge à chaque appel (coût identique d'un appel à l'autre)"""
+    def setup(size: int) -> Callable[[], None]:
+        rand = random.Random(size)
+        values = [rand.uniform(0, 100) for _ in range(size)]
+
+        def run() -> None:
+            update = _Bounces(mode)._update
+            for value in values:
+                update(value)
+        return run
+    return setup
+
+
+def _bench_refactor_name(size: int) -> Callable[[], None]:
+    """_HardWares._refactor_name"""
+    records = _records(size)
+    _HardWares.materials = {}
+    keys = []
+    for index, record in enumerate(records):
+        key = '{:08d}'.format(index)
+        _HardWares.materials[key] = [50.0, 'OpenZWave: {}'.format(record['Name']), None]
+        keys.append((key, record['Name']))
+
+    def run() -> None:
+        for key, name in keys:
+            _HardWares._refactor_name(key, 'OpenZWave', name)
+    return run
+
+
+def _bench_build_hw_id(size: int) -> Callable[[], None]:
+    """_HardWares._build_hw_id"""
+    records = _records(size)
+
+    def run() -> None:
+        for record in records:
+            _HardWares._build_hw_id(record)
+    return run
+
+
+def _bench_update(changed: bool) -> Callable[[int], Callable[[], None]]:
+    """_HardWares.update d'une interrogation complète; enregistrements tous modifiés ou tous inchangés"""
+    def setup(size: int) -> Callable[[], None]:
+        records = _records(size)
+        _HardWares.materials = {}
+        _HardWares.compile_rules()
+        for record in records:
+            _HardWares.update(record)
+
+        def run() -> None:
+            if changed:
+                _HardWares._fingerprints = {}
+            for record in records:
+                _HardWares.update(record)
+        return run
+    return setup
+
+
+def _bench_last_update(size: int) -> Callable[[], None]:
+    """last_update_2_datetime"""
+    values = [record['LastUpdate'] for record in _records(size)]
+
+    def run() -> None:
+        for value in values:
+            last_update_2_datetime(value)
+    return run
+
+
+def _bench_sort(size: int) -> Callable[[], None]:
+    """_OrderedDevices._sort"""
+    rand = random.Random(size)
+    _OrderedDevices._device_dict = {
+        index: _OrderedListItem(index, 'Device {}'.format(rand.randint(0, size)), rand.randint(0, 100))
+        for index in range(size)
+    }
+    return _OrderedDevices._sort
+
+
+def _bench_sync_item(size: int) -> Callable[[], None]:
+    """_OrderedDevices._sync_item: un niveau change, l'élément est repositionné par dichotomie"""
+    rand = random.Random(size)
+    _OrderedDevices._device_dict = {
+        index: _OrderedListItem(index, 'Device {}'.format(rand.randint(0, size)), rand.randint(0, 100))
+        for index in range(size)
+    }
+    _OrderedDevices._hw_ids = {'{:08X}'.format(index): index for index in range(size)}
+    _OrderedDevices._sort()
+    moved = _OrderedDevices._device_dict[size // 2]
+    levels = [1.0, 99.0]
+
+    def run() -> None:
+        levels.reverse()
+        _OrderedDevices._sync_item('{:08X}'.format(size // 2), size // 2, moved.name, levels[0])
+    return run
+
+
+def _bench_find_move_span(size: int) -> Callable[[], None]:
+    """Plans._find_move limité aux positions modifiées (dix positions)"""
+    ordered = [_OrderedListItem(index, 'Device {}'.format(index), index) for index in range(size)]
+    datas = [{'devidx': str(index), 'idx': str(index)} for index in range(size)]
+    datas[-1], datas[-2] = datas[-2], datas[-1]
+
+    def run() -> None:
+        Plans._find_move(ordered, datas, (max(0, size - 10), size - 1))
+    return run
+
+
+def _bench_find_move(size: int) -> Callable[[], None]:
+    """Plans._find_move; pire cas: seul le dernier device n'est pas à sa place"""
+    ordered = [_OrderedListItem(index, 'Device {}'.format(index), index) for index in range(size)]
+    datas = [{'devidx': str(index), 'idx': str(index)} for index in range(size)]
+    datas[-1], datas[-2] = datas[-2], datas[-1]
+
+    def run() -> None:
+        Plans._find_move(ordered, datas)
+    return run
+
+
+def _bench_snapshot_publish(size: int) -> Callable[[], None]:
+    """Snapshot.publish après une interrogation où 1% des devices ont changé"""
+    folder = tempfile.TemporaryDirectory(prefix='microbench-')
+    Snapshot.setup(os.path.join(folder.name, 'snapshot.bin'))
+    hw_ids = ['{:08X}'.format(index) for index in range(size)]
+    for index, hw_id in enumerate(hw_ids):
+        Snapshot.set(hw_id, 'Device {}'.format(index), index % 100, 4, 1.6e9, False)
+    Snapshot.publish()
+    changed = hw_ids[::100]
+    levels = [1.0, 99.0]
+
+    def run() -> None:
+        levels.reverse()
+        for hw_id in changed:
+            Snapshot.set(hw_id, 'Device', levels[0], 1, 1.6e9, False)
+        Snapshot.publish()
+
+    def cleanup() -> None:
+        Snapshot.setup('')
+        folder.cleanup()
+    run.cleanup = cleanup
+    return run
+
+
+BENCHMARKS: Mapping[str, Callable[[int], Callable[[], None]]] = dict(
+    [('bounces.update[{}]'.format(name), _bench_bounces(mode)) for name, mode in _BOUNCE_MODES.items()]
+    + [
+        ('hardwares.refactor_name', _bench_refactor_name),
+        ('hardwares.build_hw_id', _bench_build_hw_id),
+        ('hardwares.update[changed]', _bench_update(True)),
+        ('hardwares.update[unchanged]', _bench_update(False)),
+        ('common.last_update_2_datetime', _bench_last_update),
+        ('ordered_devices.sort', _bench_sort),
+        ('ordered_devices.sync_item', _bench_sync_item),
+        ('plans.find_move', _bench_find_move),
+        ('plans.find_move[span]', _bench_find_move_span),
+        ('snapshot.publish', _bench_snapshot_publish),
+    ]
+)
+
+
+def measure(run: Callable[[], None], min_time: float = 0.02, repeat: int = 5, pause: float = 0.1) -> float:
+    """Temps (s) d'un appel: meilleure de 'repeat' boucles de 'number' appels
+
+    'number' est calibré (1, 2, 5, 10, 20...) pour qu'une boucle dure au
+    moins 'min_time'; le ramasse-miettes est suspendu pendant les boucles.
+    Les boucles sont espacées de 'pause' secondes: la vitesse d'une machine
+    partagée varie d'une seconde à l'autre, des boucles consécutives
+    subiraient le même ralentissement.
+    """
+    timer = Timer(run)
+    multiplier = 1
+    while True:
+        for factor in (1, 2, 5):
+            number = multiplier * factor
+            best = timer.timeit(number)
+            if best >= min_time:
+                for _ in range(repeat - 1):
+                    sleep(pause)
+                    best = min(best, timer.timeit(number))
+                return best / number
+        multiplier *= 10
+
+
+def run_round(sizes: Tuple[int, ...], pattern: str = '') -> Mapping[str, float]:
+    """Une exécution des bancs dans ce processus; clés 'nom/taille', temps par appel (s)"""
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if pattern not in name:
+            continue
+        for size in sizes:
+            run = setup(size)
+            try:
+                results['{}/{}'.format(name, size)] = measure(run)
+            finally:
+                cleanup = getattr(run, 'cleanup', None)
+                if cleanup is not None:
+                    cleanup()
+    return results
+
+
+def run_all(sizes: Tuple[int, ...], pattern: str = '', rounds: int = 3) -> Mapping[str, float]:
+    """Exécute les bancs; clés 'nom/taille', temps par appel (s)
+
+    Chaque exécution a lieu dans un nouveau processus et le meilleur temps
+    de chaque banc est gardé: les écarts propres à un processus
+    (disposition mémoire, graine de hachage) et les ralentissements
+    passagers de la machine ne touchent qu'une des mesures.
+    """
+    results = {}
+    command = [sys.executable, '-m', 'tools.microbench', '--round', '--filter', pattern, '--sizes']
+    for _ in range(rounds):
+        output = subprocess.run(
+            command + [str(size) for size in sizes],
+            check=True,
+            stdout=subprocess.PIPE,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).stdout
+        for key, elapsed in json.loads(output).items():
+            results[key] = min(elapsed, results.get(key, elapsed))
+    for key, elapsed in results.items():
+        sys.stderr.write('{:<40} {:>12.6f} s\n'.format(key, elapsed))
+    return results
+
+
+def compare(results: Mapping[str, float], baseline: Mapping[str, float], threshold: float) -> List[str]:
+    """Bancs en régression: rapport (temps / référence) supérieur au seuil"""
+    return [
+        key for key, value in sorted(results.items())
+        if baseline.get(key) and value / baseline[key] > threshold
+    ]
+
+
+def confirm(
+        results: Mapping[str, float],
+        baseline: Mapping[str, float],
+        threshold: float,
+        rounds: int,
+        retries: int) -> List[str]:
+    """Régressions confirmées: les bancs suspects sont mesurés de nouveau
+
+    Un ralentissement de la machine peut durer plusieurs secondes et toucher
+    toutes les exécutions d'un banc; une vraie régression se reproduit.
+    """
+    regressions = compare(results, baseline, threshold)
+    for _ in range(retries):
+        if not regressions:
+            break
+        sys.stderr.write('{} régression(s) à confirmer\n'.format(len(regressions)))
+        for key in regressions:
+            name, size = key.rsplit('/', 1)
+            for measured, elapsed in run_all((int(size),), name, rounds).items():
+                results[measured] = min(elapsed, results.get(measured, elapsed))
+        regressions = compare(results, baseline, threshold)
+    for key, value in sorted(results.items()):
+        if baseline.get(key):
+            print('{:<40} {:>12.6f} {:>12.6f} {:>7.2f}x'.format(key, baseline[key], value, value / baseline[key]))
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Point d'entrée; code retour 1 en cas de régression"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--filter', default='', help='ne lance que les bancs contenant ce texte')
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='exécutions de la suite, chacune dans un processus; meilleur temps gardé')
+    parser.add_argument('--round', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help='fichier de résultats (JSON)')
+    parser.add_argument('--compare', help='fichier de référence (JSON, même format)')
+    parser.add_argument('--threshold', type=float, default=1.5,
+                        help='rapport temps / référence au-delà duquel on signale une régression')
+    parser.add_argument('--retries', type=int, default=2,
+                        help='nouvelles mesures des bancs en régression avant de la signaler')
+    args = parser.parse_args(argv)
+    if args.round:
+        json.dump(run_round(tuple(args.sizes), args.filter), sys.stdout)
+        return 0
+
+    results = run_all(tuple(args.sizes), args.filter, args.rounds)
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as baseline:
+            regressions = confirm(
+                results, json.load(baseline)['results'], args.threshold, args.rounds, args.retries
+            )
+    document = {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'platform': platform.platform()
+        },
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(document, output, indent=2, sort_keys=True)
+    if regressions:
+        print('{} régression(s)'.format(len(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""Rejeu d'une trace d'échanges avec l'API Domoticz
+
+Charge le plugin avec le module `Domoticz` de substitution et les paramètres
+enregistrés dans la trace (option avancée `trace=1`), puis rejoue
+connexions, réponses et heartbeats, à pleine vitesse ou au rythme
+d'origine. Le temps de traitement de chaque évènement est mesuré; le rejeu
+peut être profilé (cProfile):
+
+    python -m tools.replay trace-20210101-120000.jsonl.gz
+    python -m tools.replay trace.jsonl.gz --timing original --speed 10
+    python -m tools.replay trace.jsonl.gz --profile replay.prof --options "columnar=1"
+"""
+
+# standard libs
+import argparse
+import cProfile
+import importlib.util
+import os
+import re
+import sys
+import tempfile
+from time import perf_counter, sleep
+from types import ModuleType
+from typing import Iterator, List, Mapping, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# local libs
+from tools import domoticz_stub  # noqa: E402 pylint:disable=wrong-import-position
+
+domoticz_stub.install()
+
+# pylint:disable=wrong-import-position
+from battery_level.trace import TRACE_VERSION, read_trace  # noqa: E402
+
+_PLUGIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'plugin.py')
+# options sans objet (ou non déterministes) pendant un rejeu
+_DROPPED_OPTIONS = ('trace', 'trace_anonymize', 'metrics_port', 'worker')
+_TITLE = re.compile(r'"title"\s*:\s*"([^"]*)"')
+
+
+def replay_options(recorded: str, overrides: str = '') -> str:
+    """Options avancées du rejeu: celles de la trace, sans les options sans objet, puis 'overrides'"""
+    options = {}
+    for option in '{};{}'.format(recorded, overrides).split(';'):
+        key, _, value = option.partition('=')
+        key = key.strip()
+        if key and key not in _DROPPED_OPTIONS:
+            options[key] = value.strip()
+    return ';'.join('{}={}'.format(key, value) for key, value in options.items())
+
+
+def load_plugin(parameters: Mapping[str, str], home_folder: str) -> ModuleType:
+    """Charge plugin.py avec les paramètres 'parameters'"""
+    spec = importlib.util.spec_from_file_location('replayed_plugin', _PLUGIN)
+    plugin = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(plugin)
+    plugin.Parameters = dict(parameters, HomeFolder=home_folder)
+    plugin.Images = domoticz_stub.Images
+    plugin.Devices = domoticz_stub.Devices
+    plugin.Settings = {}
+    return plugin
+
+
+def _label(event: Mapping[str, object]) -> str:
+    """Libellé d'un évènement: type et titre de la réponse"""
+    if event['ev'] == 'in':
+        match = _TITLE.search(event['data'][:512])
+        return 'in:{}'.format(match.group(1) if match else event['status'])
+    return event['ev']
+
+
+def _events(path: str) -> Tuple[dict, Iterator[dict]]:
+    """En-tête et évènements de la trace"""
+    events = read_trace(path)
+    header = next(events)
+    if header.get('version') != TRACE_VERSION:
+        raise ValueError('Version de trace non supportée: {}'.format(header.get('version')))
+    return header, events
+
+
+def replay(
+        plugin: ModuleType,
+        events: Iterator[dict],
+        timing: str = 'fast',
+        speed: float = 1.0) -> List[Tuple[float, str, float]]:
+    """Rejoue les évènements; renvoie (instant dans la trace, libellé, durée de traitement)"""
+    timings = []
+    start = perf_counter()
+    for event in events:
+        kind = event['ev']
+        if kind == 'out':
+            continue
+        if timing == 'original':
+            delay = event['t'] / speed - (perf_counter() - start)
+            if delay > 0:
+                sleep(delay)
+        before = perf_counter()
+        if kind == 'in':
+            plugin.onMessage(
+                domoticz_stub.Connection(Name=event['conn']),
+                {'Status': event['status'], 'Headers': {}, 'Data': event['data'].encode('utf-8')}
+            )
+        elif kind == 'conn':
+            plugin.onConnect(domoticz_stub.Connection(Name=event['conn']), event['status'], '')
+        elif kind == 'hb':
+            plugin.onHeartbeat()
+        timings.append((event['t'], _label(event), perf_counter() - before))
+    return timings
+
+
+def summary(timings: List[Tuple[float, str, float]], top: int = 10) -> str:
+    """Synthèse: temps par type d'évènement et évènements les plus lents"""
+    by_label: Mapping[str, List[float]] = {}
+    for _, label, duration in timings:
+        by_label.setdefault(label, []).append(duration)
+    lines = ['{:<28} {:>7} {:>12} {:>12}'.format('event', 'count', 'total (s)', 'max (s)')]
+    for label, durations in sorted(by_label.items(), key=lambda item: -sum(item[1])):
+        lines.append('{:<28} {:>7} {:>12.6f} {:>12.6f}'.format(
+            label, len(durations), sum(durations), max(durations)
+        ))
+    lines.append('')
+    lines.append('{} slowest:'.format(top))
+    for instant, label, duration in sorted(timings, key=lambda timing: -timing[2])[:top]:
+        lines.append('  t={:>10.3f}s {:<28} {:>12.6f} s'.format(instant, label, duration))
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Point d'entrée"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('trace', help='fichier de trace (.jsonl.gz)')
+    parser.add_argument('--timing', choices=('fast', 'original'), default='fast',
+                        help='pleine vitesse ou rythme d\'origine')
+    parser.add_argument('--speed', type=float, default=1.0, help='accélération du rythme d\'origine')
+    parser.add_argument('--options', default='', help='options avancées ajoutées ou remplacées (clé=valeur;...)')
+    parser.add_argument('--profile', help='fichier de profil cProfile (.prof)')
+    parser.add_argument('--top', type=int, default=10, help='nombre d\'évènements lents affichés')
+    parser.add_argument('--verbose', action='store_true', help='affiche le journal du plugin')
+    args = parser.parse_args(argv)
+
+    domoticz_stub.VERBOSE = args.verbose
+    header, events = _events(args.trace)
+    parameters = dict(header['parameters'])
+    parameters['Username'] = replay_options(parameters.get('Username', ''), args.options)
+    with tempfile.TemporaryDirectory() as home_folder:
+        plugin = load_plugin(parameters, home_folder + os.sep)
+        plugin.onStart()
+        profiler = cProfile.Profile() if args.profile else None
+        if profiler is not None:
+            profiler.enable()
+        timings = replay(plugin, events, args.timing, args.speed)
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        plugin.onStop()
+    print(summary(timings, args.top))
+    errors = [message for kind, message in domoticz_stub.LOG if kind == 'error']
+    if errors:
+        print('{} erreur(s) du plugin'.format(len(errors)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())